@@ -0,0 +1,91 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import weakref
+
+from .prompt_builder import record_ollama_usage
+from .scheduler import OLLAMA, get_scheduler
+from .settings import get_settings, lazy_import
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
+ollama = lazy_import('ollama')
+
+
+class AsyncLLMDispatcher:
+    """
+    异步 LLM 调度层：并发执行本地 Ollama 调用（失败诊断的扇出），并发数有上限。
+    - ollama_concurrency: 同时进行的 Ollama 调用数上限。
+
+    ollama 默认客户端是同步且线程安全的，这里放到专用线程池执行（大小即上限，不受默认执行器 cpu+4 的限制），
+    线程内再占用全局 CapacityScheduler 的名额，多个项目并发时共享上限；信号量按事件循环分别创建。
+    云端调用不经过这里：LLMClient.generate 自己占用 CapacityScheduler 的 cloud 名额（cloud_llm.max_concurrency）。
+    同步调用方用 run(coro) 即可，无需自己管理事件循环。
+    """
+
+    def __init__(self, ollama_concurrency: int = 2):
+        self.limits = {OLLAMA: max(1, int(ollama_concurrency))}
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._executors = {backend: concurrent.futures.ThreadPoolExecutor(max_workers=limit,
+                                                                          thread_name_prefix=f'llm-{backend}')
+                           for backend, limit in self.limits.items()}
+
+    def _semaphore(self, backend: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._semaphores.setdefault(loop, {})
+            if backend not in per_loop:
+                per_loop[backend] = asyncio.Semaphore(self.limits[backend])
+            return per_loop[backend]
+
+    async def _in_thread(self, backend: str, fn, *args, **kwargs):
+        def call():
+            with get_scheduler().slot(backend):
+                return fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executors[backend], call)
+
+    async def ollama_generate(self, model: str, prompt: str, options: dict = None) -> str:
+        """调用本地 Ollama，返回去除首尾空白的响应文本。"""
+        with span('ollama'):  # 协程各自持有上下文副本，并发调用的区间互不嵌套
+            async with self._semaphore(OLLAMA):
+                response = await self._in_thread(OLLAMA, ollama.generate, model=model, prompt=prompt,
+                                                  options=options or {})
+            content = response['response'].strip()
+            record_ollama_usage(response, prompt, content)
+        return content
+
+    @staticmethod
+    async def gather(*coros, return_exceptions: bool = True) -> list:
+        """并发等待全部协程，默认把异常作为结果返回，由调用方逐个回退。"""
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+
+    @staticmethod
+    def run(coro):
+        """在同步代码中执行协程；若当前线程已有事件循环，则放到新线程的事件循环里执行。"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_llm_dispatcher() -> AsyncLLMDispatcher:
+    """按 local_llm.max_concurrency 懒创建全局调度器。"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AsyncLLMDispatcher(
+                ollama_concurrency=(config.get('local_llm') or {}).get('max_concurrency', 2),
+            )
+        return _dispatcher
@@ -1,51 +1,122 @@
-import json
-import os
 import logging
 from typing import Dict, List
 
+from .error_ledger import ErrorLedger
+
 logger = logging.getLogger(__name__)
 
+# 账本存储在 error_history.jsonl（追加写 + 哈希索引，见 error_ledger.py），
+# 旧版 error_history.json 在首次访问时自动迁移。
+
+
 def load_error_history(project_dir: str) -> List[Dict]:
-    """加载 error_history.json 文件。"""
-    history_path = os.path.join(project_dir, 'error_history.json')
-    if not os.path.exists(history_path):
-        logger.warning(f"Error history file not found: {history_path}. Creating empty list.")
-        return []
-    try:
-        with open(history_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error in {history_path}: {e}")
-        return []
+    """加载错误账本的全部条目。"""
+    ledger = ErrorLedger.for_project(project_dir)
+    if not ledger.exists():
+        logger.warning(f"Error history not found in {project_dir}. Creating empty list.")
+    return ledger.entries()
+
 
 def save_error_history(project_dir: str, history: List[Dict]):
-    """保存 error_history.json 文件。"""
-    history_path = os.path.join(project_dir, 'error_history.json')
-    with open(history_path, 'w', encoding='utf-8') as f:
-        json.dump(history, f, ensure_ascii=False, indent=4)
-    logger.info(f"Error history saved to {history_path}")
+    """用给定条目整体重写账本。"""
+    ledger = ErrorLedger.for_project(project_dir)
+    ledger.replace(history)
+    logger.info(f"Error history saved to {ledger.path}")
+
+
+def reset_error_history(project_dir: str):
+    """清空账本（新项目初始化）。"""
+    ErrorLedger.for_project(project_dir).reset()
+
 
 def append_error(project_dir: str, error_hash: str, iteration: int, abstract: str, case: str):
     """追加新错误到历史。"""
-    history = load_error_history(project_dir)
-    new_entry = {
-        "hash": error_hash,
+    append_errors(project_dir, [{'hash': error_hash, 'abstract': abstract, 'case': case}], iteration)
+    logger.info(f"Appended error with hash {error_hash} at iteration {iteration}")
+
+
+def append_errors(project_dir: str, errors: List[Dict], iteration: int) -> int:
+    """一次迭代的错误批量追加（单次写入），返回条目数。errors 中需含 hash / abstract / case。"""
+    count = ErrorLedger.for_project(project_dir).append([{
+        "hash": err['hash'],
         "first_iter": iteration,
         "fixed_iter": None,  # 初始为 None，待回填
-        "abstract": abstract,
-        "case": case
-    }
-    history.append(new_entry)
-    save_error_history(project_dir, history)
-    logger.info(f"Appended error with hash {error_hash} at iteration {iteration}")
+        "abstract": err['abstract'],
+        "case": err['case']
+    } for err in errors])
+    logger.debug(f"Appended {count} errors at iteration {iteration}")
+    return count
+
 
 def backfill_fixed(project_dir: str, error_hash: str, fixed_iteration: int):
     """回填 fixed_iter 到匹配的 hash 条目。"""
-    history = load_error_history(project_dir)
-    for entry in history:
-        if entry["hash"] == error_hash and entry["fixed_iter"] is None:
-            entry["fixed_iter"] = fixed_iteration
-            save_error_history(project_dir, history)
-            logger.info(f"Backfilled fixed_iter {fixed_iteration} for hash {error_hash}")
-            return
-    logger.warning(f"No unfixed entry found for hash {error_hash}")
\ No newline at end of file
+    if ErrorLedger.for_project(project_dir).mark_fixed(error_hash, fixed_iteration):
+        logger.info(f"Backfilled fixed_iter {fixed_iteration} for hash {error_hash}")
+    else:
+        logger.warning(f"No unfixed entry found for hash {error_hash}")
+
+
+class ErrorBook:
+    """
+    一次运行期间的错误账本，由 IterationState 持有。
+    - project_dir: 项目目录（底层为 error_history.jsonl 账本，见 error_ledger.py）。
+    查询全部走账本的内存索引；新错误和回填立即进索引、写入暂存，迭代结束时 flush() 批量写入。
+    """
+
+    def __init__(self, project_dir: str):
+        self.project_dir = project_dir
+        self._ledger = ErrorLedger.for_project(project_dir)
+        logger.info(f"Loaded error book with {len(self._ledger)} entries")
+
+    def entries(self) -> List[Dict]:
+        """全部条目（含未写入的），供代码生成提示使用。"""
+        return self._ledger.entries()
+
+    def get(self, error_hash: str) -> Dict | None:
+        return self._ledger.get(error_hash)
+
+    def is_fixed(self, error_hash: str) -> bool:
+        return self._ledger.is_fixed(error_hash)
+
+    def unfixed_hashes(self) -> set:
+        return self._ledger.unfixed_hashes()
+
+    def regressions(self, fresh_errors: List[Dict]) -> List[Dict]:
+        """fresh_errors 中曾被修复过的错误。"""
+        fixed = self._ledger.fixed_among(err['hash'] for err in fresh_errors)
+        return [err for err in fresh_errors if err['hash'] in fixed]
+
+    def record(self, errors: List[Dict], iteration: int) -> int:
+        """
+        登记一次迭代的新错误（暂存，flush 时写入），返回新增的条目数。
+        仍未修复的 hash 不再重复登记：回填只关闭最早一条未修复条目，重复条目会在修复后继续显示为未修复。
+        """
+        seen = self._ledger.unfixed_hashes()
+        entries = []
+        for err in errors:
+            if err['hash'] in seen:
+                continue
+            seen.add(err['hash'])
+            entries.append({
+                "hash": err['hash'],
+                "first_iter": iteration,
+                "fixed_iter": None,  # 初始为 None，待回填
+                "abstract": err['abstract'],
+                "case": err['case']
+            })
+        return self._ledger.append(entries, defer=True)
+
+    def mark_fixed(self, error_hash: str, fixed_iteration: int) -> bool:
+        """回填该 hash 最早一条未修复条目（暂存，flush 时写入）。"""
+        if not self._ledger.mark_fixed(error_hash, fixed_iteration, defer=True):
+            logger.warning(f"No unfixed entry found for hash {error_hash}")
+            return False
+        logger.info(f"Backfilled fixed_iter {fixed_iteration} for hash {error_hash}")
+        return True
+
+    def flush(self) -> int:
+        """把暂存的新错误和回填批量写入账本，返回写入的记录数。"""
+        written = self._ledger.flush()
+        if written:
+            logger.info(f"Flushed {written} ledger records to {self._ledger.path}")
+        return written
@@ -0,0 +1,307 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import deque
+
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+PATHS = get_settings().get('paths') or {}
+LEDGER_FILE = PATHS.get('error_history') or 'error_history.jsonl'  # 项目目录下的账本文件名
+LEGACY_FILE = 'error_history.json'  # 旧版整体 JSON，仅作迁移来源
+
+_instances: dict[str, 'ErrorLedger'] = {}
+_instances_lock = threading.Lock()
+
+
+class ErrorLedger:
+    """
+    错误账本：追加写的 JSONL 日志 + 内存哈希索引。
+    - path: 日志文件路径（error_history.jsonl）。
+    - legacy_path: 旧版 error_history.json，日志不存在时一次性迁移（迁移后改名为 .migrated）。
+      path 本身是旧版整体 JSON（数组）时原地转换为 JSONL，原文件备份为 .migrated。
+
+    每行一条记录：
+    - {"op": "add", "hash", "first_iter", "fixed_iter", "abstract", "case"}：新错误。
+    - {"op": "fix", "hash", "fixed_iter"}：回填该 hash 最早一条未修复的条目。
+    打开时重放日志建立索引，之后按 hash 查询/回填均为 O(1)；fix 记录积累过多时整理（compact）为只含 add 的日志。
+
+    append / mark_fixed 传 defer=True 时只更新索引，记录暂存到 flush() 时一次写入（ErrorBook 按迭代批量写）；
+    暂存期间文件被其他写入方修改时，重新加载后再把暂存记录重放到新索引上。
+    """
+
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, path: str, legacy_path: str = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.RLock()
+        self._pending: list[dict] = []  # 已进索引、尚未写入文件的记录
+        self._load()
+
+    @classmethod
+    def for_project(cls, project_dir: str) -> 'ErrorLedger':
+        """项目目录下的共享账本实例（同一路径只打开一次）。"""
+        return cls._shared(os.path.join(project_dir, LEDGER_FILE), os.path.join(project_dir, LEGACY_FILE))
+
+    @classmethod
+    def for_history_path(cls, history_path: str) -> 'ErrorLedger':
+        """
+        按给定路径打开账本，路径即 JSONL 日志本身（不按扩展名推导）；同目录的旧版 error_history.json 作为迁移来源。
+        - history_path: 如配置项 paths.error_history 拼上项目目录；不能是旧版 error_history.json 本身。
+        """
+        legacy_path = os.path.join(os.path.dirname(history_path), LEGACY_FILE)
+        if os.path.abspath(legacy_path) == os.path.abspath(history_path):
+            raise ValueError(f"{history_path} is the legacy JSON history, pass the JSONL ledger path instead")
+        return cls._shared(history_path, legacy_path)
+
+    @classmethod
+    def _shared(cls, path: str, legacy_path: str | None) -> 'ErrorLedger':
+        path = os.path.abspath(path)
+        with _instances_lock:
+            ledger = _instances.get(path)
+            if ledger is None:
+                ledger = _instances[path] = cls(path, legacy_path)
+        ledger._refresh()
+        return ledger
+
+    # ---- 加载 / 重放 ----
+
+    def _reset_index(self):
+        self._entries: list[dict] = []
+        self._unfixed: dict[str, deque] = {}  # hash -> 未修复条目下标（按出现顺序）
+        self._latest: dict[str, int] = {}  # hash -> 最近一条条目下标
+        self._fixed_hashes: set[str] = set()  # 曾被修复过的 hash（回归判定）
+        self._fix_records = 0
+        self._stat = None
+
+    def _load(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._load_file()
+            for record in pending:
+                if self._apply(record):
+                    self._pending.append(record)
+
+    def _load_file(self):
+        with self._lock:
+            self._reset_index()
+            if not os.path.exists(self.path):
+                if self.legacy_path and os.path.exists(self.legacy_path):
+                    self._migrate(self.legacy_path)
+                return
+            if self._is_legacy_json(self.path):
+                self._migrate(self.path)
+                return
+            torn = False
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    torn = not line.endswith('\n')
+                    try:
+                        self._apply(json.loads(line))
+                    except (json.JSONDecodeError, KeyError, TypeError) as e:
+                        logger.warning(f"Skipping corrupt ledger record {self.path}:{line_no}: {e}")
+            if torn:  # 上次写入中断：补换行，避免下一条记录接在残行后面
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write('\n')
+            if self._fix_records >= max(self.COMPACT_MIN_RECORDS, len(self._entries) // 2):
+                self.compact()
+            self._stat = self._file_stat()
+
+    @staticmethod
+    def _is_legacy_json(path: str) -> bool:
+        """旧版文件是一个 JSON 数组，JSONL 日志每行是一个对象。"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read(256).lstrip().startswith('[')
+
+    def _migrate(self, source: str):
+        """从旧版整体 JSON 导入条目并重写为 JSONL；source 即 self.path 时原地转换。"""
+        try:
+            with open(source, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decode error in {source}: {e}")
+            history = []
+        for entry in history:
+            self._add_entry(entry)
+        if source == self.path:
+            shutil.copyfile(source, source + '.migrated')
+            self._rewrite()
+        else:
+            self._rewrite()
+            os.replace(source, source + '.migrated')
+        logger.info(f"Migrated {len(self._entries)} entries from {source} to {self.path}")
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _refresh(self):
+        """文件被其他写入方修改（或删除）时重新加载。"""
+        with self._lock:
+            if self._file_stat() != self._stat:
+                self._load()
+
+    def _apply(self, record: dict) -> bool:
+        """把一条日志记录应用到索引，返回是否生效（没有可回填条目的 fix 不生效）。"""
+        if record.get('op', 'add') == 'fix':
+            self._fix_records += 1
+            return self._fix(record['hash'], record['fixed_iter'])
+        self._add_entry(record)
+        return True
+
+    def _add_entry(self, record: dict):
+        entry = {
+            'hash': record['hash'],
+            'first_iter': record.get('first_iter'),
+            'fixed_iter': record.get('fixed_iter'),
+            'abstract': record.get('abstract', ''),
+            'case': record.get('case', ''),
+        }
+        index = len(self._entries)
+        self._entries.append(entry)
+        self._latest[entry['hash']] = index
+        if entry['fixed_iter'] is None:
+            self._unfixed.setdefault(entry['hash'], deque()).append(index)
+        else:
+            self._fixed_hashes.add(entry['hash'])
+        return entry
+
+    def _fix(self, error_hash: str, fixed_iteration: int) -> bool:
+        pending = self._unfixed.get(error_hash)
+        if not pending:
+            return False
+        self._entries[pending.popleft()]['fixed_iter'] = fixed_iteration
+        if not pending:
+            del self._unfixed[error_hash]
+        self._fixed_hashes.add(error_hash)
+        return True
+
+    # ---- 写入 ----
+
+    def _write(self, records: list[dict]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+        self._stat = self._file_stat()
+
+    def _rewrite(self):
+        """用当前条目重写日志（原子替换），不含 fix 记录。"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries:
+                f.write(json.dumps({'op': 'add', **entry}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+        self._fix_records = 0
+        self._pending = []  # 暂存记录的效果已包含在重写的条目中
+        self._stat = self._file_stat()
+
+    def _commit(self, records: list[dict], defer: bool):
+        if not records:
+            return
+        if defer:
+            self._pending.extend(records)
+        else:
+            self._write(records)
+
+    def append(self, entries: list[dict], defer: bool = False) -> int:
+        """批量追加新错误（一次写入；defer 时暂存到 flush），返回条目数。"""
+        if not entries:
+            return 0
+        with self._lock:
+            self._refresh()
+            added = [self._add_entry(entry) for entry in entries]
+            self._commit([{'op': 'add', **entry} for entry in added], defer)
+        return len(added)
+
+    def mark_fixed(self, error_hash: str, fixed_iteration: int, defer: bool = False) -> bool:
+        """回填该 hash 最早一条未修复条目的 fixed_iter；没有未修复条目时返回 False。"""
+        return self.mark_fixed_many([error_hash], fixed_iteration, defer) == 1
+
+    def mark_fixed_many(self, hashes, fixed_iteration: int, defer: bool = False) -> int:
+        """批量回填（defer 时暂存到 flush），返回实际回填的条目数。"""
+        with self._lock:
+            self._refresh()
+            records = [{'op': 'fix', 'hash': h, 'fixed_iter': fixed_iteration}
+                       for h in hashes if self._fix(h, fixed_iteration)]
+            self._commit(records, defer)
+            self._fix_records += len(records)
+        return len(records)
+
+    def flush(self) -> int:
+        """把暂存的记录一次写入文件，返回写入的记录数。"""
+        with self._lock:
+            records, self._pending = self._pending, []
+            if records:
+                self._write(records)
+        return len(records)
+
+    def replace(self, entries: list[dict]):
+        """整体替换账本内容（兼容 save_error_history）。"""
+        with self._lock:
+            self._reset_index()
+            for entry in entries:
+                self._add_entry(entry)
+            self._rewrite()
+
+    def compact(self):
+        """把 fix 记录合并进 add 记录，日志长度回到条目数。"""
+        with self._lock:
+            before = self._fix_records
+            self._rewrite()
+        logger.info(f"Compacted {self.path} ({before} fix records merged)")
+
+    def reset(self):
+        """清空账本（新项目），同时移除旧版 JSON 文件。"""
+        with self._lock:
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                os.remove(self.legacy_path)
+            self.replace([])
+
+    # ---- 查询 ----
+
+    def entries(self) -> list[dict]:
+        with self._lock:
+            self._refresh()
+            return [dict(entry) for entry in self._entries]
+
+    def get(self, error_hash: str) -> dict | None:
+        """该 hash 最近的一条条目。"""
+        with self._lock:
+            self._refresh()
+            index = self._latest.get(error_hash)
+            return None if index is None else dict(self._entries[index])
+
+    def is_fixed(self, error_hash: str) -> bool:
+        """该 hash 是否曾被修复（再次出现即为回归）。"""
+        with self._lock:
+            self._refresh()
+            return error_hash in self._fixed_hashes
+
+    def fixed_among(self, hashes) -> set[str]:
+        """hashes 中曾被修复过的那些（一次性判定一批新错误）。"""
+        with self._lock:
+            self._refresh()
+            return {h for h in hashes if h in self._fixed_hashes}
+
+    def unfixed_hashes(self) -> set[str]:
+        with self._lock:
+            self._refresh()
+            return set(self._unfixed)
+
+    def exists(self) -> bool:
+        return self._stat is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._entries)
@@ -0,0 +1,150 @@
+import json
+import logging
+import re
+
+from .async_llm import AsyncLLMDispatcher, get_llm_dispatcher
+from .fingerprint import error_type_of
+from .prompt_builder import LOCAL_BUDGET_TOKENS, estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+ABSTRACT_MAX_CHARS = 100
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_FENCE_RE = re.compile(r'```(?:json)?\s*\n?(.*?)```', re.DOTALL)
+
+
+def fallback_analysis(exception: str) -> dict:
+    """LLM 不可用或输出无法解析时的回退结果。"""
+    return {'abstract': f"{error_type_of(exception)} in test case", 'diagnosis': ''}
+
+
+def build_prompt(failures: list[dict]) -> str:
+    """
+    把一批失败合并成一个结构化提示。
+    - failures: [{'hash': str, 'case': str, 'exception': str}, ...]（hash 已去重）。
+    返回: 要求模型输出 JSON 数组的提示字符串。
+    每条失败平分本地模型的提示预算，超长的栈迹只保留末尾（异常类型与消息所在处）。
+    """
+    share = (LOCAL_BUDGET_TOKENS - 200) // max(1, len(failures))
+    blocks = []
+    for failure in failures:
+        case = truncate_to_tokens(failure['case'], share // 2)
+        exception = truncate_to_tokens(failure['exception'], share - estimate_tokens(case) - 20, keep='tail')
+        blocks.append(f"### hash: {failure['hash']}\n"
+                      f"Test case:\n{case}\n"
+                      f"Error:\n{exception}")
+    joined = '\n\n'.join(blocks)
+    return f"""Diagnose these {len(failures)} Python test failures.
+
+{joined}
+
+Output ONLY a JSON array with one object per failure, in any order:
+[{{"hash": "<hash from above>", "abstract": "brief summary incl. possible cause <{ABSTRACT_MAX_CHARS} chars", "diagnosis": "possible cause and fix suggestion"}}]"""
+
+
+def _json_candidates(text: str) -> list[str]:
+    text = _THINK_RE.sub('', text).strip()
+    candidates = [block.strip() for block in _FENCE_RE.findall(text)]
+    candidates.append(text)
+    start, end = text.find('['), text.rfind(']')
+    if 0 <= start < end:
+        candidates.append(text[start:end + 1])
+    return candidates
+
+
+def parse_response(text: str, expected_hashes: list[str]) -> dict[str, dict]:
+    """
+    解析模型输出，返回 {hash: {'abstract', 'diagnosis'}}，只包含 expected_hashes 中且字段合法的条目。
+    兼容 <think> 段、```json 围栏、数组外的多余文字，以及 {"results": [...]} 或单个对象。
+    缺少 hash 但条目数与请求一致时按顺序对应。
+    """
+    items = None
+    for candidate in _json_candidates(text):
+        try:
+            data = json.loads(candidate)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if isinstance(data, dict):
+            lists = [value for value in data.values() if isinstance(value, list)]
+            data = lists[0] if len(lists) == 1 else [data]
+        if isinstance(data, list):
+            items = data
+            break
+    if items is None:
+        logger.warning("Failure analysis output is not a JSON array")
+        return {}
+
+    expected = set(expected_hashes)
+    by_position = len(items) == len(expected_hashes)
+    parsed = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        hash_value = str(item.get('hash', '')).strip()
+        if hash_value not in expected:
+            # 模型常截断或抄错长哈希：唯一前缀匹配，否则按位置对应
+            matches = [h for h in expected_hashes if hash_value and h.startswith(hash_value)]
+            if len(matches) == 1:
+                hash_value = matches[0]
+            elif by_position:
+                hash_value = expected_hashes[position]
+            else:
+                continue
+        abstract = item.get('abstract')
+        if not isinstance(abstract, str) or not abstract.strip():
+            continue
+        diagnosis = item.get('diagnosis', '')
+        parsed[hash_value] = {'abstract': abstract.strip()[:ABSTRACT_MAX_CHARS],
+                              'diagnosis': diagnosis if isinstance(diagnosis, str) else json.dumps(diagnosis)}
+    return parsed
+
+
+async def _analyze_chunk(dispatcher: AsyncLLMDispatcher, chunk: list[dict], model: str, options: dict) -> dict:
+    hashes = [failure['hash'] for failure in chunk]
+    try:
+        text = await dispatcher.ollama_generate(model, build_prompt(chunk), options)
+    except Exception as e:
+        logger.error(f"LLM failure analysis failed: {e}")
+        return {}
+    parsed = parse_response(text, hashes)
+    if len(parsed) < len(hashes):
+        logger.warning(f"LLM analysed {len(parsed)}/{len(hashes)} failures, falling back for the rest")
+    return parsed
+
+
+def analyze_failures(failures: list[dict], model: str, temperature: float = 0.2,
+                     batch_size: int = 8, dispatcher: AsyncLLMDispatcher = None) -> list[dict]:
+    """
+    一次迭代的全部失败合并分析：同一聚类（见 fingerprint.cluster_key，无则按 hash）只分析一次，
+    每 batch_size 个一条提示，各批并发。
+    - failures: [{'hash': str, 'case': str, 'exception': str[, 'cluster': str]}, ...]
+    - model / temperature: 本地模型配置。
+    - batch_size: 每条提示包含的失败数上限（控制提示长度）。
+    返回: 与输入同序的 [{'abstract': str, 'diagnosis': str}, ...]，无法分析的条目为回退结果。
+    """
+    if not failures:
+        return []
+    dispatcher = dispatcher or get_llm_dispatcher()
+    groups = {}  # 聚类键 -> 代表失败（第一个）
+    for failure in failures:
+        groups.setdefault(failure.get('cluster') or failure['hash'], failure)
+    unique = list(groups.values())
+    batch_size = max(1, int(batch_size))
+    chunks = [unique[start:start + batch_size] for start in range(0, len(unique), batch_size)]
+    options = {'temperature': temperature}
+
+    async def analyze_all():
+        return await dispatcher.gather(*(_analyze_chunk(dispatcher, chunk, model, options) for chunk in chunks))
+
+    analysed = {}
+    for result in dispatcher.run(analyze_all()):
+        if isinstance(result, Exception):
+            logger.error(f"LLM failure analysis failed: {result}")
+        else:
+            analysed.update(result)
+    logger.info(f"Analysed {len(failures)} failures ({len(unique)} unique) with {len(chunks)} LLM calls")
+    results = []
+    for failure in failures:
+        representative = groups[failure.get('cluster') or failure['hash']]
+        results.append(analysed.get(representative['hash']) or fallback_analysis(failure['exception']))
+    return results
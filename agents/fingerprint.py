@@ -0,0 +1,144 @@
+"""
+错误指纹：把异常栈归一化后再哈希，保证同一个 bug 在不同迭代得到同一个指纹。
+
+原实现对原始 stderr 做 SHA256，其中的临时文件路径、行号、对象地址每次都变，
+导致同一错误每轮都是新 hash、账本无限增长、回归检测永远不触发。这里：
+- 指纹 = 异常类型 + 最内层栈帧函数 + 用例（AST 归一化），与消息、路径、行号无关；
+- 聚类键 = 异常类型 + 最内层栈帧函数 + 消息模板（数字/字符串/地址替换为占位符），不含用例，
+  用于把不同用例中同一根因的失败归为一组；
+- 哈希用 blake2b（32 字节摘要，十六进制 64 位，与原 SHA256 长度一致）。
+"""
+import ast
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+_TRACEBACK_HEADER = 'Traceback (most recent call last):'
+_FRAME_RE = re.compile(r'^\s*File "(?P<file>[^"]+)", line (?P<line>\d+)(?:, in (?P<func>.+))?$')
+_EXC_LINE_RE = re.compile(r'^(?P<type>[A-Za-z_][\w.]*)(?::\s?(?P<message>.*))?$')
+_EXC_SUFFIXES = ('Error', 'Exception', 'Exit', 'Interrupt', 'Warning')
+
+# 沙箱生成的、每次运行都不同的文件名
+_VOLATILE_FILES = [
+    (re.compile(r'^temp_[\w-]+\.py$'), 'temp.py'),  # mkstemp 临时源码
+    (re.compile(r'^case_\d+\.py$'), 'case.py'),  # 批量执行时按分片内序号命名
+]
+_ADDRESS_RE = re.compile(r'0x[0-9a-fA-F]+')
+_PATH_RE = re.compile(r'(?:[A-Za-z]:)?(?:[\\/][^\\/\s"\'<>:]+)+[\\/](?P<name>[^\\/\s"\'<>:]+)')
+_LINE_RE = re.compile(r'\bline \d+')
+_QUOTED_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?(?![\w.])')
+
+
+def _normalize_file(path: str) -> str:
+    name = os.path.basename(path.replace('\\', '/'))
+    for pattern, replacement in _VOLATILE_FILES:
+        if pattern.match(name):
+            return replacement
+    return name
+
+
+def parse_traceback(text: str) -> dict:
+    """
+    解析异常字符串（完整 traceback、format_exception_only 输出或单行 'Type: msg'）。
+    返回: {'type': str, 'message': str, 'frames': [(文件名, 函数名), ...]}，frames 从外到内，
+    链式异常只取最后一段；文件名已去掉目录和临时名。
+    """
+    text = text.strip()
+    start = text.rfind(_TRACEBACK_HEADER)
+    body = text[start + len(_TRACEBACK_HEADER):] if start >= 0 else text
+    lines = body.splitlines()
+
+    frames = []
+    for line in lines:
+        match = _FRAME_RE.match(line)
+        if match:
+            frames.append((_normalize_file(match.group('file')), (match.group('func') or '').strip()))
+
+    exc_type, message = 'Unknown', ''
+    for line in reversed(lines):
+        match = _EXC_LINE_RE.match(line)
+        if not match or line.startswith(' '):
+            continue
+        if match.group('message') is not None or match.group('type').endswith(_EXC_SUFFIXES):
+            exc_type, message = match.group('type'), (match.group('message') or '').strip()
+            break
+    return {'type': exc_type, 'message': message, 'frames': frames}
+
+
+def error_type_of(exception: str) -> str:
+    """从异常字符串取异常类型：取最后一个形如 'Type: msg' 或裸 'XxxError' 的非缩进行。"""
+    return parse_traceback(exception)['type']
+
+
+def normalize_traceback(text: str) -> str:
+    """去掉每次运行都会变化的部分（目录、临时文件名、行号、对象地址），用于比较和展示。"""
+    def file_repl(match):
+        return f'File "{_normalize_file(match.group(1))}"'
+
+    text = re.sub(r'File "([^"]+)"', file_repl, text)
+    text = _PATH_RE.sub(lambda m: _normalize_file(m.group('name')), text)
+    text = _LINE_RE.sub('line N', text)
+    return _ADDRESS_RE.sub('0x?', text)
+
+
+def message_template(message: str) -> str:
+    """消息模板：地址、路径、引号内容、数字替换为占位符（'list index 5 out of range' -> 'list index <n> ...'）。"""
+    message = _ADDRESS_RE.sub('<addr>', message)
+    message = _PATH_RE.sub('<path>', message)
+    message = _QUOTED_RE.sub('<s>', message)
+    return _NUMBER_RE.sub('<n>', message)
+
+
+@lru_cache(maxsize=4096)
+def _code_key(code: str) -> str:
+    """用例的结构化表示（与空白、注释无关）；解析失败时退回压缩空白后的文本。同一用例每轮重复出现，结果缓存。"""
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return ' '.join(code.split())
+
+
+def _innermost(parsed: dict) -> str:
+    frames = parsed['frames']
+    if not frames:
+        return ''
+    file_name, func = frames[-1]
+    # 模块级代码（或 SyntaxError 没有函数名）以文件区分
+    return func if func and func != '<module>' else f'{file_name}:<module>'
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8'), digest_size=32).hexdigest()
+
+
+def fingerprint(exception: str, related_code: str = '', error_type: str = None) -> str:
+    """
+    错误指纹：异常类型 + 最内层栈帧函数 + 用例结构。
+    - exception: 异常字符串（traceback 或 'Type: msg'）。
+    - related_code: 相关代码（用例）。
+    - error_type: 异常字符串解析不出类型时使用。
+    返回: 64 位十六进制 blake2b 摘要。
+    """
+    parsed = parse_traceback(exception)
+    exc_type = parsed['type'] if parsed['type'] != 'Unknown' else (error_type or 'Unknown')
+    return _digest(exc_type, _innermost(parsed), _code_key(related_code))
+
+
+def cluster_key(exception: str) -> str:
+    """近似重复聚类键：异常类型 + 最内层栈帧函数 + 消息模板，与用例无关。"""
+    parsed = parse_traceback(exception)
+    return _digest(parsed['type'], _innermost(parsed), message_template(parsed['message']))[:16]
+
+
+def cluster_failures(failures: list[dict]) -> dict[str, list[dict]]:
+    """
+    按 cluster_key 分组。
+    - failures: [{'exception': str, ...}, ...]
+    返回: {cluster_key: [failure, ...]}，组和组内顺序与输入一致。
+    """
+    clusters: dict[str, list[dict]] = {}
+    for failure in failures:
+        clusters.setdefault(failure.get('cluster') or cluster_key(failure['exception']), []).append(failure)
+    return clusters
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_instances: dict[str, 'LLMResponseCache'] = {}
+_instances_lock = threading.Lock()
+
+
+class LLMResponseCache:
+    """
+    LLM 响应的磁盘缓存（SQLite），供 LLMClient 和 LocalLLMAgent 共用。
+    - path: 数据库文件路径。
+    - ttl_sec: 条目有效期（秒），0 表示永不过期（可用于离线回放录制的会话）。
+    - max_entries: 条目上限，超出时按最近使用时间淘汰。
+    - bypass_nonzero_temperature: 为 True 时 temperature > 0 的调用不走缓存（需要采样多样性时）。
+    键为 (后端, 模型, 提示, temperature, max_tokens) 的 SHA256。
+    """
+
+    def __init__(self, path: str, ttl_sec: float = 0, max_entries: int = 10000,
+                 bypass_nonzero_temperature: bool = False):
+        self.path = path
+        self.ttl_sec = ttl_sec or 0
+        self.max_entries = max(1, int(max_entries))
+        self.bypass_nonzero_temperature = bypass_nonzero_temperature
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'key TEXT PRIMARY KEY, response TEXT NOT NULL, '
+                           'created REAL NOT NULL, last_used REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)')
+
+    @classmethod
+    def from_config(cls, cache_config: dict | None) -> 'LLMResponseCache | None':
+        """按 config.yaml 的 llm_cache 段返回共享实例（同一路径只打开一次），未启用返回 None。"""
+        if not cache_config or not cache_config.get('enabled', False):
+            return None
+        path = cache_config.get('path', '.cache/llm_responses.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(_ROOT_DIR, path)
+        with _instances_lock:
+            if path not in _instances:
+                _instances[path] = cls(path,
+                                       ttl_sec=cache_config.get('ttl_sec', 0),
+                                       max_entries=cache_config.get('max_entries', 10000),
+                                       bypass_nonzero_temperature=cache_config.get('bypass_nonzero_temperature',
+                                                                                   False))
+            return _instances[path]
+
+    @staticmethod
+    def make_key(backend: str, model: str, prompt: str, temperature, max_tokens=None, stop: str = None) -> str:
+        """
+        - stop: 流式提前中止条件的标识（见 LLMClient.generate），不同条件截断出的内容分别缓存；None 表示完整响应。
+        """
+        fields = [backend, model, prompt, temperature, max_tokens]
+        if stop is not None:  # 不带 stop 的键与之前的版本保持一致，已有缓存仍可命中
+            fields.append(stop)
+        data = json.dumps(fields, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def applies_to(self, temperature) -> bool:
+        return not (self.bypass_nonzero_temperature and temperature and temperature > 0)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl_sec and now - row[1] > self.ttl_sec:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        logger.debug(f"LLM cache hit {key[:10]}...")
+        return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, response, created, last_used) '
+                               'VALUES (?, ?, ?, ?)', (key, response, now, now))
+            if self.ttl_sec:
+                self._conn.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl_sec,))
+            overflow = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute('DELETE FROM responses WHERE key IN '
+                                   '(SELECT key FROM responses ORDER BY last_used LIMIT ?)', (overflow,))
+            self._conn.execute('COMMIT')
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
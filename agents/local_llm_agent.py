@@ -1,18 +1,38 @@
-import ollama
 import logging
 
+from .llm_cache import LLMResponseCache
+from .prompt_builder import record_ollama_usage
+from .scheduler import OLLAMA, get_scheduler
+from .settings import lazy_import
+from .tracing import span
+
+ollama = lazy_import('ollama')  # 第一次调用时才导入
+
 logger = logging.getLogger(__name__)
 
 class LocalLLMAgent:
-    def __init__(self, model='qwen3:4b', temperature=0.2):
+    def __init__(self, model='qwen3:4b', temperature=0.2, cache: LLMResponseCache = None):
         self.model = model
         self.temperature = temperature
+        self.cache = cache  # 可选响应缓存
 
     def generate(self, prompt: str) -> str:
         """使用 Ollama 生成响应"""
+        cache_key = None
+        if self.cache is not None and self.cache.applies_to(self.temperature):
+            cache_key = self.cache.make_key('ollama', self.model, prompt, self.temperature)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         try:
-            response = ollama.generate(model='qwen3:4b', prompt=prompt, options={'temperature': 0.2, 'num_ctx': 16384})
-            return response['response'].strip()
+            with span('ollama'), get_scheduler().slot(OLLAMA):
+                response = ollama.generate(model=self.model, prompt=prompt,
+                                           options={'temperature': self.temperature, 'num_ctx': 16384})
+                content = response['response'].strip()
+                record_ollama_usage(response, prompt, content)
         except Exception as e:
             logger.error(f"Ollama 生成失败: {str(e)}")
-            return ""  # 返回空字符串，避免中断
\ No newline at end of file
+            return ""  # 返回空字符串，避免中断
+        if cache_key is not None and content:
+            self.cache.put(cache_key, content)
+        return content
@@ -0,0 +1,163 @@
+"""
+沙箱执行前的静态预检（进程内、毫秒级）：去掉 markdown 代码围栏，compile() 源码，
+检查未定义的名字以及 SRS 接口签名中列出但源码未定义的函数/类。
+任何一项不通过都只产生一条合成错误，跳过全部用例的沙箱执行。
+"""
+import ast
+import builtins
+import re
+import symtable
+
+# 合成错误条目的 case 字段；run_pytest_cases 会跳过这个“用例”，修复子循环复测它时只重新预检
+PREFLIGHT_CASE = '# preflight: static checks on src.py'
+
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_FENCE_RE = re.compile(r'```([\w+-]*)[^\n]*\n(.*?)```', re.DOTALL)
+_SRS_FENCE_RE = re.compile(r'```[^\n]*\n.*?```', re.DOTALL)
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*)$', re.MULTILINE)
+_INTERFACE_HEADING_RE = re.compile(r'接口|签名|interface|signature|\bapi\b', re.IGNORECASE)
+_INLINE_CODE_RE = re.compile(r'`([^`\n]+)`')
+_PYTHON_LANGS = ('', 'python', 'py', 'python3')
+_DEF_RE = re.compile(r'\bdef\s+([A-Za-z_]\w*)\s*\(')
+_CLASS_RE = re.compile(r'\bclass\s+([A-Za-z_]\w*)\s*[(:]')
+
+_MODULE_NAMES = {'__name__', '__file__', '__doc__', '__builtins__', '__spec__', '__loader__', '__package__',
+                 '__annotations__', '__path__', '__cached__'}
+
+
+def strip_code_fences(text: str) -> str:
+    """
+    去掉回复中的代码围栏：按顺序拼接全部 Python（或未标注语言）代码块，模型回显的验收用例块（见 is_test_block）跳过；
+    没有这类代码块时拼接其余非用例代码块，仍没有时拼接全部代码块；没有代码块时原样返回（去掉首尾空行）。
+    """
+    text = _THINK_RE.sub('', text)
+    blocks = [(lang.lower(), body.strip('\n')) for lang, body in _FENCE_RE.findall(text)]
+    if not blocks:
+        return text.strip('\n')
+    source_blocks = [(lang, body) for lang, body in blocks if not is_test_block(body)]
+    code_blocks = [body for lang, body in source_blocks if lang in _PYTHON_LANGS] or \
+        [body for _, body in source_blocks] or [body for _, body in blocks]
+    return '\n\n'.join(code_blocks)
+
+
+def is_test_block(code: str) -> bool:
+    """SRS 代码块是否属于验收用例（测试函数、pytest 装饰器/fixture 或 import pytest 开头的块）。"""
+    return 'def test_' in code or '@pytest.' in code or \
+        code.lstrip().startswith(('import pytest', 'from pytest '))
+
+
+def pytest_blocks(markdown: str) -> list[str]:
+    """SRS 中的验收用例代码块（Python 或未标注语言，见 is_test_block），按出现顺序，去掉首尾空白。"""
+    return [body.strip() for lang, body in _FENCE_RE.findall(markdown)
+            if lang.lower() in _PYTHON_LANGS and is_test_block(body)]
+
+
+def _interface_sections(srs_content: str) -> list[str]:
+    """标题含“接口/签名/interface/signature/API”的章节正文（到下一个同级或更高级标题为止，不含代码块内的 # 行）。"""
+    fences = [m.span() for m in _SRS_FENCE_RE.finditer(srs_content)]
+    headings = [m for m in _HEADING_RE.finditer(srs_content)
+                if not any(start <= m.start() < end for start, end in fences)]
+    sections = []
+    for i, heading in enumerate(headings):
+        if not _INTERFACE_HEADING_RE.search(heading.group(2)):
+            continue
+        level = len(heading.group(1))
+        end = next((h.start() for h in headings[i + 1:] if len(h.group(1)) <= level), len(srs_content))
+        sections.append(srs_content[heading.end():end])
+    return sections
+
+
+def interface_names(srs_content: str) -> list[str]:
+    """
+    SRS 接口签名中的函数名/类名（def name( / class Name( 或 class Name:）。
+    只从两处收集，正文叙述里的 def/class 字样不算：
+    - Python 代码块（验收用例块整块跳过，见 is_test_block）；
+    - 接口签名章节（见 _interface_sections）里的行内代码，如 `def add(a, b)`。
+    test_ 开头和双下划线名字不算。
+    """
+    sources = [body for lang, body in _FENCE_RE.findall(srs_content)
+               if lang.lower() in _PYTHON_LANGS and not is_test_block(body)]
+    for section in _interface_sections(srs_content):
+        sources += _INLINE_CODE_RE.findall(_SRS_FENCE_RE.sub('', section))
+    text = '\n'.join(sources)
+    names = []
+    for name in _DEF_RE.findall(text) + _CLASS_RE.findall(text):
+        if name.startswith('test_') or (name.startswith('__') and name.endswith('__')) or name in names:
+            continue
+        names.append(name)
+    return names
+
+
+_STAR_IMPORT_RE = re.compile(r'^\s*from\s+[\w.]+\s+import\s+\*', re.MULTILINE)
+
+
+def _walk_tables(table: symtable.SymbolTable):
+    yield table
+    for child in table.get_children():
+        yield from _walk_tables(child)
+
+
+def _first_lines(code: str, names: set[str]) -> dict[str, int]:
+    lines = {}
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Name) and node.id in names:
+            lines[node.id] = min(lines.get(node.id, node.lineno), node.lineno)
+    return lines
+
+
+def scan_names(code: str, filename: str = 'src.py') -> tuple[list[tuple[str, int]], set[str]]:
+    """
+    只用符号表（不再遍历 AST）一次得到两类名字：
+    - 未定义的全局引用：既不是内置名，也没有在模块级定义（赋值、import、def/class、global 声明后赋值）；
+      有 from x import * 时无法判断，视为没有。
+    - 任意作用域里定义过的名字（含方法名），用于接口名检查。
+    返回: ([(未定义名字, 首次引用的行号), ...]（按行号排序）, 已定义名字集合)。源码须已通过 compile。
+    """
+    tables = list(_walk_tables(symtable.symtable(code, filename, 'exec')))
+    module_defined = set(dir(builtins)) | _MODULE_NAMES
+    defined_anywhere = set()
+    for table in tables:
+        is_module = table.get_type() == 'module'
+        for symbol in table.get_symbols():
+            if symbol.is_assigned() or symbol.is_imported() or symbol.is_namespace():
+                defined_anywhere.add(symbol.get_name())
+                if is_module or symbol.is_declared_global():
+                    module_defined.add(symbol.get_name())
+    if _STAR_IMPORT_RE.search(code):
+        return [], defined_anywhere
+    undefined = {symbol.get_name() for table in tables for symbol in table.get_symbols()
+                 if symbol.is_referenced() and symbol.is_global() and symbol.get_name() not in module_defined}
+    if not undefined:
+        return [], defined_anywhere
+    lines = _first_lines(code, undefined)  # 只在确有未定义名字时才解析 AST 取行号
+    return sorted(((name, lines.get(name, 0)) for name in undefined), key=lambda item: (item[1], item[0])), \
+        defined_anywhere
+
+
+def check_code(code: str, required_names=(), filename: str = 'src.py', undefined_names: bool = True) -> str | None:
+    """
+    预检源码。
+    - required_names: 必须定义的名字（SRS 接口签名）；方法名在任意层级定义即可。
+    - undefined_names: 是否检查未定义的全局名字。
+    返回: 第一项不通过的检查对应的异常文本（格式与沙箱里的异常一致，可直接计算指纹），全部通过返回 None。
+    """
+    try:
+        compile(code, filename, 'exec')
+    except SyntaxError as e:
+        location = f'  File "{filename}", line {e.lineno}\n'
+        if e.text:
+            location += f'    {e.text.strip()}\n'
+        return f"{location}{type(e).__name__}: {e.msg}"
+    except ValueError as e:  # 源码含 NUL 字节等
+        return f"SyntaxError: {e}"
+
+    undefined, defined = scan_names(code, filename)
+    if undefined and undefined_names:
+        listed = ', '.join(f"'{name}' (line {line})" for name, line in undefined)
+        return f"NameError: name '{undefined[0][0]}' is not defined; undefined names in {filename}: {listed}"
+
+    missing = [name for name in required_names if name not in defined]
+    if missing:
+        return (f"ImportError: cannot import name '{missing[0]}' from 'src'; "
+                f"SRS interface names missing in {filename}: {', '.join(missing)}")
+    return None
@@ -0,0 +1,210 @@
+"""
+提示组装：按 token 预算拼接各段内容，超出时按优先级压缩；错误账本去重与压缩；记录每次调用的 token 用量。
+代码生成（CodeGenerator）、SRS 协商（SRSHandler）和本地 LLM 辅助（失败诊断、micro_fix、用例补全）共用。
+"""
+import json
+import logging
+import math
+import re
+import threading
+
+from .settings import get_settings
+from .tracing import add_usage
+
+logger = logging.getLogger(__name__)
+
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
+
+_prompt_config = config.get('prompt') or {}
+CLOUD_BUDGET_TOKENS = _prompt_config.get('cloud_budget_tokens', 32000)  # 云端提示上限（不含输出）
+LOCAL_BUDGET_TOKENS = _prompt_config.get('local_budget_tokens', 12000)  # 本地模型提示上限（num_ctx 减去输出余量）
+LEDGER_BUDGET_TOKENS = _prompt_config.get('ledger_budget_tokens', 3000)  # 错误账本段的默认上限
+FIXED_ABSTRACT_CHARS = _prompt_config.get('fixed_abstract_chars', 80)  # 已修复条目只保留的摘要长度
+
+# CJK 字符大致一字一 token，其余按 4 字符一 token 估算（偏保守，无需分词器）
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+_TRUNCATED = '\n...[truncated]...\n'
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 text 的 token 数。"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = 'head') -> str:
+    """
+    把 text 截到约 max_tokens 个 token。
+    - keep: 'head' 保留开头，'tail' 保留结尾（如栈迹），'middle' 保留首尾、去掉中间。
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    chars = max(1, int(len(text) * max_tokens / tokens) - len(_TRUNCATED))
+    if keep == 'tail':
+        return _TRUNCATED.lstrip('\n') + text[-chars:]
+    if keep == 'middle':
+        head = chars // 2
+        return text[:head] + _TRUNCATED + text[len(text) - (chars - head):]
+    return text[:chars] + _TRUNCATED.rstrip('\n')
+
+
+def compact_error_book(entries: list[dict], max_tokens: int = None, regression_hashes=()) -> list[dict]:
+    """
+    压缩错误账本供提示使用。
+    - entries: 账本条目（同一 hash 可能多条：修复后复发会重新登记）。
+    - regression_hashes: 本轮检测到的回归 hash，视同复发。
+    按 hash 去重后分三类：复发（regressed）与未修复（open）的条目保留摘要和用例全文；
+    已修复（fixed）的只保留截短的摘要。超出 max_tokens 时先丢最早修复的条目（以一条 omitted 计数代替），
+    仍超出再截短未修复条目的用例。
+    返回: 按 复发、未修复、已修复 排列的条目列表，每类内最近的在前。
+    """
+    if max_tokens is None:
+        max_tokens = LEDGER_BUDGET_TOKENS
+    regression_hashes = set(regression_hashes)
+    grouped: dict[str, dict] = {}
+    for entry in entries:
+        error_hash = entry.get('hash')
+        if not error_hash:
+            continue
+        group = grouped.setdefault(error_hash, {'first_iter': entry.get('first_iter'), 'occurrences': 0,
+                                                'was_fixed': False})
+        group['occurrences'] += 1
+        group['was_fixed'] = group['was_fixed'] or entry.get('fixed_iter') is not None
+        group['latest'] = entry
+
+    active, fixed = [], []
+    for error_hash, group in grouped.items():
+        latest = group['latest']
+        if latest.get('fixed_iter') is None or error_hash in regression_hashes:
+            regressed = error_hash in regression_hashes or group['was_fixed']
+            active.append({'hash': error_hash[:12], 'status': 'regressed' if regressed else 'open',
+                           'first_iter': group['first_iter'], 'occurrences': group['occurrences'],
+                           'abstract': latest.get('abstract', ''), 'case': latest.get('case', '')})
+        else:
+            abstract = latest.get('abstract', '')
+            if len(abstract) > FIXED_ABSTRACT_CHARS:
+                abstract = abstract[:FIXED_ABSTRACT_CHARS] + '...'
+            fixed.append({'hash': error_hash[:12], 'status': 'fixed', 'fixed_iter': latest['fixed_iter'],
+                          'abstract': abstract})
+    active.sort(key=lambda e: (e['status'] != 'regressed', -(e['first_iter'] or 0)))
+    fixed.sort(key=lambda e: -(e['fixed_iter'] or 0))
+
+    def size(item):
+        return estimate_tokens(json.dumps(item, ensure_ascii=False)) + 1
+
+    # 逐条累计，避免对大账本反复整体序列化
+    active_tokens = sum(size(e) for e in active)
+    fixed_sizes = [size(e) for e in fixed]
+    fixed_tokens = sum(fixed_sizes)
+    budget = max_tokens - size({'status': 'omitted', 'count': len(fixed)})
+    omitted = 0
+    while fixed and active_tokens + fixed_tokens > budget:
+        fixed.pop()
+        fixed_tokens -= fixed_sizes.pop()
+        omitted += 1
+    tail = [{'status': 'omitted', 'count': omitted}] if omitted else []
+    if active and active_tokens + fixed_tokens > budget:
+        per_entry = max(16, (budget - fixed_tokens) // len(active))
+        for entry in active:
+            entry['case'] = truncate_to_tokens(entry['case'], max(16, per_entry - size(dict(entry, case=''))))
+    if omitted:
+        logger.debug(f"Error book compaction omitted {omitted} old fixed entries")
+    return active + fixed + tail
+
+
+class PromptBuilder:
+    """
+    按预算拼接提示。每段可带 shrink(max_tokens) -> str 压缩函数和 priority（越小越先被压缩）；
+    没有 shrink 的段视为必需，原样保留。
+    - budget_tokens: 整个提示的 token 上限。
+
+    build() 之后 report 记录各段最终的 token 数，便于日志与统计。
+    """
+
+    def __init__(self, budget_tokens: int):
+        self.budget_tokens = int(budget_tokens)
+        self._sections: list[dict] = []
+        self.report: dict = {}
+
+    def add(self, text: str, name: str = None, shrink=None, priority: int = 0) -> 'PromptBuilder':
+        self._sections.append({'name': name or f'section{len(self._sections)}', 'text': text,
+                               'shrink': shrink, 'priority': priority})
+        return self
+
+    def build(self, separator: str = '\n') -> str:
+        """拼接所有段；总量超出预算时按 priority 依次压缩可压缩的段，直到满足预算或无段可压。"""
+        tokens = [estimate_tokens(section['text']) for section in self._sections]
+        over = sum(tokens) - self.budget_tokens
+        shrinkable = sorted((i for i, s in enumerate(self._sections) if s['shrink'] is not None),
+                            key=lambda i: self._sections[i]['priority'])
+        for i in shrinkable:
+            if over <= 0:
+                break
+            section = self._sections[i]
+            section['text'] = section['shrink'](max(0, tokens[i] - over))
+            new_tokens = estimate_tokens(section['text'])
+            over -= tokens[i] - new_tokens
+            tokens[i] = new_tokens
+        total = sum(tokens)
+        self.report = {'budget': self.budget_tokens, 'tokens': total,
+                       'sections': {s['name']: n for s, n in zip(self._sections, tokens)}}
+        if total > self.budget_tokens:
+            logger.warning(f"Prompt exceeds budget after compaction: {total} > {self.budget_tokens} tokens")
+        return separator.join(section['text'] for section in self._sections if section['text'])
+
+
+class UsageTracker:
+    """
+    进程级 token 用量统计：按后端（cloud / ollama）累计提示与输出 token 数。
+    接口返回用量时用真实值，否则用 estimate_tokens 估算（estimated 计数单独记录）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: dict[str, dict] = {}
+
+    def record(self, backend: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> dict:
+        usage = {'prompt_tokens': int(prompt_tokens), 'completion_tokens': int(completion_tokens),
+                 'estimated': estimated}
+        with self._lock:
+            totals = self._totals.setdefault(backend, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                       'estimated_calls': 0})
+            totals['calls'] += 1
+            totals['prompt_tokens'] += usage['prompt_tokens']
+            totals['completion_tokens'] += usage['completion_tokens']
+            totals['estimated_calls'] += int(estimated)
+        add_usage(backend, usage['prompt_tokens'], usage['completion_tokens'], estimated)  # 计入当前追踪区间
+        logger.info(f"{backend} usage: prompt={usage['prompt_tokens']} completion={usage['completion_tokens']}"
+                    f"{' (estimated)' if estimated else ''}")
+        return usage
+
+    def totals(self) -> dict:
+        with self._lock:
+            return {backend: dict(totals) for backend, totals in self._totals.items()}
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+
+_tracker = UsageTracker()
+
+
+def get_usage_tracker() -> UsageTracker:
+    return _tracker
+
+
+def record_ollama_usage(response, prompt: str, completion: str) -> dict:
+    """从 Ollama 回复的 prompt_eval_count / eval_count 记录用量，缺失时估算。"""
+    try:
+        prompt_tokens, completion_tokens = response.get('prompt_eval_count'), response.get('eval_count')
+    except AttributeError:
+        prompt_tokens = completion_tokens = None
+    if prompt_tokens is None or completion_tokens is None:
+        return _tracker.record('ollama', estimate_tokens(prompt), estimate_tokens(completion), estimated=True)
+    return _tracker.record('ollama', prompt_tokens, completion_tokens)
@@ -0,0 +1,138 @@
+"""
+沙箱子进程的内核级资源限制（仅依赖标准库，供 sandbox.py、sandbox_worker.py 和 sandbox_launcher.py 共用）。
+
+- POSIX: 在执行被测代码之前由子进程自己设置 RLIMIT_AS / RLIMIT_CPU / RLIMIT_NOFILE，超限由内核立即处理。
+  预热池在 fork 出的子进程里设置；逐次启动的解释器由 sandbox_launcher 在 exec 之后、运行被测代码之前设置。
+- 可选 cgroup v2: 配置了可写的 cgroup 目录时，为每次运行建立子 cgroup 并写入 memory.max。
+- 不支持时（Windows）由调用方退回 psutil 轮询。
+"""
+import math
+import os
+import signal
+import uuid
+
+try:
+    import resource  # 仅 POSIX
+except ImportError:  # pragma: no cover
+    resource = None
+
+MEMORY_EXCEEDED = 'MemoryError: Exceeded max memory'
+CPU_EXCEEDED = 'TimeoutError: CPU time limit exceeded'
+
+
+def rlimits_supported() -> bool:
+    """子进程能否自行设置内核级上限（resource 模块仅 POSIX 提供）。"""
+    return resource is not None
+
+
+def _limit_values(max_memory_mb: int = None, cpu_sec: float = None, max_open_files: int = None) -> list[tuple]:
+    limits = []
+    if max_memory_mb:
+        limit = int(max_memory_mb) * 1024 * 1024
+        limits.append((resource.RLIMIT_AS, limit, limit))
+    if cpu_sec:
+        # 软限制触发 SIGXCPU，硬限制多留 1 秒兜底 SIGKILL
+        soft = int(math.ceil(cpu_sec))
+        limits.append((resource.RLIMIT_CPU, soft, soft + 1))
+    if max_open_files:
+        limits.append((resource.RLIMIT_NOFILE, int(max_open_files), int(max_open_files)))
+    return limits
+
+
+def _clamp(soft: int, hard: int, current_hard: int) -> tuple[int, int]:
+    """不超过现有硬上限（非特权进程不能调高）。"""
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    return soft, hard
+
+
+def apply_limits(max_memory_mb: int = None, cpu_sec: float = None, max_open_files: int = None):
+    """在当前进程（子进程）中设置资源上限并降低优先级。无法设置的项静默跳过。"""
+    try:
+        os.nice(10)  # 降低 CPU 优先级
+    except (OSError, AttributeError):
+        pass
+    if resource is None:
+        return
+    for which, soft, hard in _limit_values(max_memory_mb, cpu_sec, max_open_files):
+        try:
+            resource.setrlimit(which, _clamp(soft, hard, resource.getrlimit(which)[1]))
+        except (ValueError, OSError):
+            pass
+
+
+def enter_cgroup(cgroup_procs: str):
+    """把当前进程加入 cgroup（写入其 cgroup.procs）。"""
+    with open(cgroup_procs, 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def describe_violation(returncode: int, stderr: str, cgroup: 'CgroupScope' = None) -> str | None:
+    """根据退出状态判断是否触发了资源上限，返回与原 exception 字段一致的描述。"""
+    if cgroup is not None and cgroup.oom_killed():
+        return MEMORY_EXCEEDED
+    sigxcpu = getattr(signal, 'SIGXCPU', None)
+    if sigxcpu is not None and returncode == -sigxcpu:
+        return CPU_EXCEEDED
+    if returncode != 0 and stderr.strip():
+        last_line = stderr.strip().splitlines()[-1]
+        if last_line.startswith('MemoryError'):
+            return MEMORY_EXCEEDED
+    return None
+
+
+class CgroupScope:
+    """
+    一次运行专用的 cgroup v2 子组。
+    - root: 已委派给当前用户、启用了 memory 控制器的 cgroup 目录。
+    - memory_max_mb: 写入 memory.max（并关闭 swap）。
+    """
+
+    def __init__(self, root: str, memory_max_mb: int):
+        self.path = os.path.join(root, f'sandbox-{os.getpid()}-{uuid.uuid4().hex[:8]}')
+        os.mkdir(self.path)
+        try:
+            self._write('memory.max', str(int(memory_max_mb) * 1024 * 1024))
+        except OSError:
+            self.close()
+            raise
+        try:
+            self._write('memory.swap.max', '0')
+        except OSError:
+            pass
+
+    @staticmethod
+    def available(root: str) -> bool:
+        if not root:
+            return False
+        try:
+            with open(os.path.join(root, 'cgroup.subtree_control'), 'r') as f:
+                controllers = f.read().split()
+        except OSError:
+            return False
+        return 'memory' in controllers and os.access(root, os.W_OK)
+
+    @property
+    def procs_file(self) -> str:
+        return os.path.join(self.path, 'cgroup.procs')
+
+    def _write(self, name: str, value: str):
+        with open(os.path.join(self.path, name), 'w') as f:
+            f.write(value)
+
+    def oom_killed(self) -> bool:
+        try:
+            with open(os.path.join(self.path, 'memory.events'), 'r') as f:
+                for line in f:
+                    key, _, value = line.partition(' ')
+                    if key == 'oom_kill':
+                        return int(value) > 0
+        except (OSError, ValueError):
+            pass
+        return False
+
+    def close(self):
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 这些结果受机器负载影响，不可复用
+_NON_DETERMINISTIC_PREFIXES = ('TimeoutError', 'MemoryError: Exceeded max memory', 'Sandbox worker')
+
+
+class CaseResultCache:
+    """
+    用例执行结果的持久化缓存（SQLite），跨迭代、跨进程复用。
+    - path: 数据库文件路径。
+    - max_entries: 条目上限，超出时按最近使用时间（LRU）淘汰。
+    键为 (源码, 用例, 沙箱配置) 的 SHA256，值为用例的异常字符串（通过为 None）。
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                           'key TEXT PRIMARY KEY, exception TEXT, last_used REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used)')
+        self._count = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    @staticmethod
+    def make_key(code: str, case: str, sandbox_config: dict) -> str:
+        data = json.dumps([code, case, sandbox_config], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def cacheable(exception: str | None) -> bool:
+        return exception is None or not exception.startswith(_NON_DETERMINISTIC_PREFIXES)
+
+    def get_many(self, keys: list[str]) -> dict[str, str | None]:
+        """批量查询，返回命中的 {key: exception}，并刷新命中条目的使用时间。"""
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):  # SQLite 参数个数上限
+                chunk = unique[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, exception FROM results WHERE key IN ({placeholders})', chunk).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany('UPDATE results SET last_used = ? WHERE key = ?',
+                                       [(now, key) for key in found])
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: dict[str, str | None]):
+        """写入结果（跳过超时等不确定结果），超出上限时淘汰最久未使用的条目。"""
+        rows = [(key, exc, time.time()) for key, exc in items.items() if self.cacheable(exc)]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('INSERT OR REPLACE INTO results (key, exception, last_used) VALUES (?, ?, ?)',
+                                   rows)
+            self._count = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute('DELETE FROM results WHERE key IN '
+                                   '(SELECT key FROM results ORDER BY last_used LIMIT ?)', (overflow,))
+                self._count -= overflow
+                logger.debug(f"Evicted {overflow} cached test results")
+            self._conn.execute('COMMIT')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self._count}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM results')
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,79 +1,168 @@
 import subprocess
 import os
+import sys
+import atexit
 import signal
-import tempfile
+import time
 import logging
-import logging.config  # 已存在
-import yaml
+import json
 import threading  # 用于 Windows 超时兼容
 import platform  # 检查系统平台
 import psutil  # 新增：用于 Windows 资源限制
 
-# 加载配置（相对路径，从 agents/ 到根 config/）
-config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.yaml')
-with open(config_path, 'r', encoding='utf-8') as f:
-    config = yaml.safe_load(f)
+from .resource_limits import CgroupScope, MEMORY_EXCEEDED, describe_violation, rlimits_supported
+from .sandbox_pool import CANCELLED, SandboxPool, kill_group, watch_cancel
+from .scheduler import SANDBOX, get_scheduler
+from .settings import get_settings
+from .tracing import span
+from .workspaces import WorkspacePool
+
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
 
 TIMEOUT_SEC = config['sandbox']['timeout_sec']
 MAX_MEMORY_MB = config['sandbox']['max_memory_mb']
 LOG_LEVEL = config['agent']['log_level']
-
-# 配置日志（使用 logging.conf）
-logging_conf_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'logging.conf')
-logging.config.fileConfig(logging_conf_path)
-
-
-def run_in_sandbox(code: str, src_dir: str = None, timeout_sec: int = TIMEOUT_SEC) -> dict:
+POOL_CONFIG = config['sandbox'].get('pool') or {}
+LIMITS_CONFIG = config['sandbox'].get('limits') or {}
+MAX_OPEN_FILES = LIMITS_CONFIG.get('max_open_files')
+CGROUP_ROOT = LIMITS_CONFIG.get('cgroup_root')
+WORKSPACE_ROOT = config['sandbox'].get('workspace_root')  # 默认 /dev/shm（tmpfs），不可用时系统临时目录
+SANDBOX_UMASK = 0o077  # 只在子进程中生效
+LAUNCHER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_launcher.py')  # POSIX 冷路径的入口
+
+_pool = None
+_pool_lock = threading.Lock()
+_workspaces = None
+_workspaces_lock = threading.Lock()
+
+
+def get_workspaces() -> WorkspacePool:
+    """全局可复用工作区池（逐次启动解释器的沙箱与 pytest 工作区共用）。"""
+    global _workspaces
+    with _workspaces_lock:
+        if _workspaces is None:
+            _workspaces = WorkspacePool(WORKSPACE_ROOT, max_idle=max(4, int(POOL_CONFIG.get('size', 2)) * 2))
+            atexit.register(_workspaces.close)
+        return _workspaces
+
+
+def pool_enabled() -> bool:
+    """预热池需要 fork（POSIX），Windows 下自动退回逐次启动解释器。"""
+    return bool(POOL_CONFIG.get('enabled', False)) and hasattr(os, 'fork')
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """按 config.yaml 的 sandbox.pool 懒创建全局预热池。"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(size=POOL_CONFIG.get('size', 2),
+                                max_runs_per_worker=POOL_CONFIG.get('max_runs_per_worker', 50),
+                                max_memory_mb=MAX_MEMORY_MB,
+                                max_open_files=MAX_OPEN_FILES,
+                                workspace_root=get_workspaces().root)
+            _pool.warm()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def run_in_sandbox(code: str, src_dir: str = None, timeout_sec: int = TIMEOUT_SEC, cancel=None) -> dict:
     """
     在沙箱中执行代码。
     - code: 要执行的 Python 代码字符串。
-    - src_dir: 可选隔离目录（默认用临时目录）。
+    - src_dir: 子进程的工作目录（并加入 sys.path），默认用一个独占的临时工作区。
     - timeout_sec: 超时秒数（从 config 读取或覆盖）。
+    - cancel: 可选取消信号（threading.Event 等有 is_set() 的对象），置位时杀掉正在执行的子进程，
+      exception 为 CANCELLED（fail-fast 或推测式生成中已有胜者时用于释放沙箱名额）。
     返回: {'stdout': str, 'stderr': str, 'returncode': int, 'exception': str or None}
 
     安全措施：
-    - 使用临时目录隔离。
+    - 代码写在独占的工作区（可复用的 tmpfs 目录，用完清空）中执行。
+    - 工作目录与 umask 只传给子进程，调用方进程的 cwd / umask 不变，可从多个线程同时调用。
     - 禁止网络/文件写（通过 umask 和 ulimit/psutil）。
+    - POSIX：子进程经 sandbox_launcher 启动，在执行被测代码之前自行设置 RLIMIT_AS/RLIMIT_CPU/RLIMIT_NOFILE
+      （配置 sandbox.limits.cgroup_root 时内存改用 cgroup v2），子进程在独立会话中。
     - Windows 兼容：用 threading.Timer 替代 signal.alarm，无 ulimit，用 psutil 限制。
+    - 启用 sandbox.pool 时交给预热工作进程 fork 执行，返回格式不变。
+    - 同时运行的沙箱数受全局 CapacityScheduler 的 sandbox 上限约束（多项目并发时共享）。
     """
+    with span('sandbox', pooled=pool_enabled()) as sandbox_span:
+        waiting = time.perf_counter()
+        with get_scheduler().slot(SANDBOX):
+            sandbox_span.set(wait_sec=round(time.perf_counter() - waiting, 6))  # 等待沙箱名额的时间
+            result = _run_in_sandbox(code, src_dir, timeout_sec, cancel)
+        sandbox_span.set(returncode=result['returncode'])
+        return result
+
+
+def _run_in_sandbox(code: str, src_dir: str, timeout_sec: int, cancel=None) -> dict:
     logging.info(f"Starting sandbox execution with timeout {timeout_sec}s and max memory {MAX_MEMORY_MB}MB")
+    if pool_enabled():
+        result = get_sandbox_pool().run(code, src_dir, timeout_sec, cancel)
+        logging.info("Sandbox execution complete")
+        return result
 
-    # 创建隔离目录
-    sandbox_dir = tempfile.mkdtemp() if src_dir is None else src_dir
-    temp_file_path = os.path.join(sandbox_dir, 'temp.py')
+    with get_workspaces().workspace() as workspace:
+        result = _run_process(code, workspace, src_dir or workspace, timeout_sec, cancel)
+    logging.info("Sandbox execution complete")
+    return result
 
-    # 写入代码到临时文件
+
+def _run_process(code: str, workspace: str, cwd: str, timeout_sec: int, cancel=None) -> dict:
+    """逐次启动解释器执行 workspace/temp.py，工作目录 cwd（同时放在 sys.path 最前面，与预热池一致）。"""
+    temp_file_path = os.path.join(workspace, 'temp.py')
     with open(temp_file_path, 'w', encoding='utf-8') as f:
         f.write(code)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [cwd, env.get('PYTHONPATH')]))
 
     result = {'stdout': '', 'stderr': '', 'returncode': -1, 'exception': None}
+    timer = None
+    mem_thread = None
+    cgroup = None
+    cancel_done = None
+    cancelled = []
 
     try:
-        # 切换到沙箱目录，限制权限
-        os.chdir(sandbox_dir)
-        os.umask(0o077)  # 限制新文件为只读当前用户
-
-        # 构建命令：Windows 跳过 ulimit，用 psutil 限制
-        cmd = ['python', temp_file_path]
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        p = psutil.Process(proc.pid)
-        p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)  # 降低 CPU 优先级
-
-        # 内存监控线程（如果超过 MAX_MEMORY_MB，终止）
-        def memory_monitor():
-            while proc.poll() is None:
+        cmd = [sys.executable, temp_file_path]
+        popen_kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE, 'cwd': cwd, 'env': env}
+        posix = os.name == 'posix'
+        if posix:
+            # cwd / umask / 新会话由 subprocess 的 C 实现在 fork 之后、exec 之前设置，子进程中不运行 Python 代码，
+            # 也不改动本进程
+            popen_kwargs.update(umask=SANDBOX_UMASK, start_new_session=True)
+        if rlimits_supported():
+            # POSIX：由启动器在子进程中、执行被测代码之前设置上限，超限由内核处理，无需监控线程
+            if CgroupScope.available(CGROUP_ROOT):
                 try:
-                    mem = p.memory_info().rss / (1024 * 1024)  # MB
-                    if mem > MAX_MEMORY_MB:
-                        logging.warning("Memory limit exceeded, terminating")
-                        proc.terminate()
-                        result['exception'] = 'MemoryError: Exceeded max memory'
-                except psutil.NoSuchProcess:
-                    break
-                threading.Event().wait(0.5)  # 每0.5s 检查
-
-        mem_thread = threading.Thread(target=memory_monitor)
-        mem_thread.start()
+                    cgroup = CgroupScope(CGROUP_ROOT, MAX_MEMORY_MB)
+                except OSError as e:
+                    logging.warning(f"cgroup setup failed, using rlimits: {e}")
+            limits = {'max_memory_mb': MAX_MEMORY_MB, 'cpu_sec': timeout_sec + 1, 'max_open_files': MAX_OPEN_FILES,
+                      'cgroup_procs': cgroup.procs_file if cgroup else None}
+            cmd = [sys.executable, LAUNCHER_SCRIPT, json.dumps(limits), temp_file_path]
+            proc = subprocess.Popen(cmd, **popen_kwargs)
+        else:
+            # Windows 用 psutil 限制
+            proc = subprocess.Popen(cmd, **popen_kwargs)
+            p = psutil.Process(proc.pid)
+            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS if os.name == 'nt' else 10)  # 降低 CPU 优先级
+
+            # 内存监控线程（如果超过 MAX_MEMORY_MB，终止）
+            def memory_monitor():
+                while proc.poll() is None:
+                    try:
+                        mem = p.memory_info().rss / (1024 * 1024)  # MB
+                        if mem > MAX_MEMORY_MB:
+                            logging.warning("Memory limit exceeded, terminating")
+                            proc.terminate()
+                            result['exception'] = MEMORY_EXCEEDED
+                    except psutil.NoSuchProcess:
+                        break
+                    threading.Event().wait(0.5)  # 每0.5s 检查
+
+            mem_thread = threading.Thread(target=memory_monitor)
+            mem_thread.start()
 
         # 超时处理
         def timeout_handler():
@@ -85,12 +174,29 @@ def run_in_sandbox(code: str, src_dir: str = None, timeout_sec: int = TIMEOUT_SE
         timer = threading.Timer(timeout_sec, timeout_handler)
         timer.start()
 
+        def cancel_handler():
+            cancelled.append(True)
+            if posix:
+                kill_group(proc.pid)  # 子进程在独立会话中，连同其派生的进程一起杀掉
+            else:
+                proc.kill()
+
+        cancel_done = watch_cancel(cancel, cancel_handler)
+
         # 通信并捕获输出
         stdout, stderr = proc.communicate()
         result['stdout'] = stdout.decode('utf-8', errors='replace')  # 用 replace 避免解码错误
         result['stderr'] = stderr.decode('utf-8', errors='replace')
         result['returncode'] = proc.returncode
 
+        if cancelled:
+            result['exception'] = CANCELLED
+        if not result['exception']:
+            violation = describe_violation(result['returncode'], result['stderr'], cgroup)
+            if violation:
+                logging.warning(f"Resource limit exceeded: {violation}")
+                result['exception'] = violation
+
         if result['returncode'] != 0 and not result['exception']:
             result['exception'] = result['stderr'] or 'Unknown error'
             logging.error(f"Execution failed with exception: {result['exception']}")
@@ -100,19 +206,14 @@ def run_in_sandbox(code: str, src_dir: str = None, timeout_sec: int = TIMEOUT_SE
         logging.error(f"Unexpected sandbox error: {e}")
 
     finally:
-        # 清理超时和监控
-        timer.cancel()
-        mem_thread.join(timeout=1) if 'mem_thread' in locals() else None
-
-        # 恢复 umask 并清理文件
-        os.umask(0o022)
-        try:
-            os.remove(temp_file_path)
-            if sandbox_dir.startswith(tempfile.gettempdir()):
-                import shutil
-                shutil.rmtree(sandbox_dir, ignore_errors=True)
-        except OSError as e:
-            logging.warning(f"Cleanup failed: {e}")
-
-    logging.info("Sandbox execution complete")
-    return result
\ No newline at end of file
+        # 清理超时和监控（工作区由调用方归还时清空）
+        if timer is not None:
+            timer.cancel()
+        if cancel_done is not None:
+            cancel_done.set()
+        if mem_thread is not None:
+            mem_thread.join(timeout=1)
+        if cgroup is not None:
+            cgroup.close()
+
+    return result
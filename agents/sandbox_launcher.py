@@ -0,0 +1,36 @@
+"""
+逐次启动解释器的沙箱入口（sandbox.py 的冷路径），只依赖标准库。
+
+用法: python sandbox_launcher.py <limits JSON> <脚本路径>
+- limits: {'max_memory_mb', 'cpu_sec', 'max_open_files', 'cgroup_procs'}，各项可为 null；
+  能加入 cgroup 时内存交给 cgroup 限制，否则用 RLIMIT_AS。
+
+在本进程执行任何被测代码之前加入 cgroup、设置资源上限，再以 __main__ 身份执行脚本（与预热池的子进程一致）。
+父进程因此不需要 preexec_fn：fork 与 exec 之间只有 subprocess 的 C 代码（新会话、umask、工作目录）。
+"""
+import json
+import os
+import sys
+
+from resource_limits import apply_limits, enter_cgroup  # 与本文件同目录（脚本方式启动时 sys.path[0]）
+from sandbox_worker import run_as_main
+
+
+def main():
+    limits = json.loads(sys.argv[1])
+    script = sys.argv[2]
+    max_memory_mb = limits.get('max_memory_mb')
+    if limits.get('cgroup_procs'):
+        try:
+            enter_cgroup(limits['cgroup_procs'])
+            max_memory_mb = None  # 内存由 cgroup 的 memory.max 限制
+        except OSError:
+            pass  # 退回 RLIMIT_AS
+    apply_limits(max_memory_mb, limits.get('cpu_sec'), limits.get('max_open_files'))
+    with open(script, 'r', encoding='utf-8') as f:
+        code = f.read()
+    sys.exit(run_as_main(code, script, os.getcwd()))
+
+
+if __name__ == '__main__':
+    main()
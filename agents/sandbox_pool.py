@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+from .resource_limits import describe_violation
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_worker.py')
+CANCELLED = 'Cancelled: sandbox run aborted'
+
+
+def watch_cancel(cancel, on_cancel, interval: float = 0.05) -> threading.Event:
+    """
+    监视取消信号：cancel（有 is_set() 的对象）置位时调用一次 on_cancel。
+    返回: done 事件，运行结束后由调用方置位以停止监视。cancel 为 None 时不启动线程。
+    """
+    done = threading.Event()
+    if cancel is None:
+        return done
+
+    def watch():
+        while not done.wait(interval):
+            if cancel.is_set():
+                on_cancel()
+                return
+    threading.Thread(target=watch, name='sandbox-cancel', daemon=True).start()
+    return done
+
+
+def kill_group(pid: int):
+    """杀掉以 pid 为组长的进程组（沙箱子进程都在独立会话中）。"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class SandboxWorkerError(RuntimeError):
+    """工作进程崩溃或无响应。"""
+
+
+class _Worker:
+    """一个预热的解释器进程（见 sandbox_worker.py），按行 JSON 收发请求。"""
+
+    def __init__(self, workspace_root: str = None):
+        self.workspace = tempfile.mkdtemp(prefix='sandbox_worker_', dir=workspace_root)
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, self.workspace],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', errors='replace', bufsize=1,
+        )
+        self.runs = 0
+        self.broken = False
+
+    def alive(self) -> bool:
+        return not self.broken and self.proc.poll() is None
+
+    def request(self, req: dict, guard_timeout: float, cancel=None) -> dict:
+        """
+        发送请求并等待响应；超过 guard_timeout 未返回则杀掉工作进程。
+        cancel 置位时杀掉正在执行的子进程组，工作进程随后照常返回响应（响应中 'cancelled' 为 True）。
+        """
+        guard = threading.Timer(guard_timeout, self.proc.kill)
+        guard.start()
+        cancelled = []
+        done = None
+        try:
+            self.proc.stdin.write(json.dumps(req) + '\n')
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+            if line and 'started' in json.loads(line):
+                child_pid = json.loads(line)['started']
+                done = watch_cancel(cancel, lambda: (cancelled.append(True), kill_group(child_pid)))
+                line = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError) as e:
+            self.broken = True
+            raise SandboxWorkerError(f"Sandbox worker pipe error: {e}") from e
+        finally:
+            guard.cancel()
+            if done is not None:
+                done.set()
+        if not line:
+            self.broken = True
+            raise SandboxWorkerError("Sandbox worker exited unexpectedly")
+        self.runs += 1
+        resp = json.loads(line)
+        resp['cancelled'] = bool(cancelled)
+        return resp
+
+    def close(self):
+        try:
+            if self.alive():
+                self.proc.stdin.close()
+                self.proc.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+        finally:
+            if self.broken:
+                self.proc.kill()
+            shutil.rmtree(self.workspace, ignore_errors=True)
+
+
+class SandboxPool:
+    """
+    预热沙箱工作进程池。
+    - size: 工作进程数（同时也是最大并发执行数）。
+    - max_runs_per_worker: 单个工作进程执行多少次后回收重建。
+    - max_memory_mb: 子进程地址空间上限（RLIMIT_AS）。
+    - max_open_files: 子进程文件描述符上限（RLIMIT_NOFILE）。
+    - workspace_root: 各工作进程的常驻工作区所在目录（如 tmpfs 上的 /dev/shm），默认系统临时目录。
+    CPU 时间上限（RLIMIT_CPU）取每次运行的 timeout_sec + 1。
+
+    run() 返回与 run_in_sandbox 相同的 {'stdout', 'stderr', 'returncode', 'exception'}。
+    """
+
+    def __init__(self, size: int = 2, max_runs_per_worker: int = 50, max_memory_mb: int = None,
+                 max_open_files: int = None, workspace_root: str = None):
+        self.size = max(1, int(size))
+        self.max_runs_per_worker = max(1, int(max_runs_per_worker))
+        self.max_memory_mb = max_memory_mb
+        self.max_open_files = max_open_files
+        self.workspace_root = workspace_root
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle: list[_Worker] = []
+        self._closed = False
+
+    def warm(self):
+        """预先启动全部工作进程（在锁外启动，不阻塞并发的取用/归还）。"""
+        with self._lock:
+            missing = self.size - len(self._idle)
+        workers = [_Worker(self.workspace_root) for _ in range(max(0, missing))]
+        self._add_idle(workers)
+        logger.info(f"Sandbox pool warmed with {self.size} workers")
+
+    def _add_idle(self, workers: list[_Worker]):
+        """把新启动的工作进程放入空闲列表；池已关闭或已满时关闭多余的。"""
+        extra = []
+        with self._lock:
+            for worker in workers:
+                if self._closed or len(self._idle) >= self.size:
+                    extra.append(worker)
+                else:
+                    self._idle.append(worker)
+        for worker in extra:
+            worker.close()
+
+    def _acquire(self) -> _Worker:
+        self._slots.acquire()
+        dead = []
+        try:
+            with self._lock:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive():
+                        return worker
+                    dead.append(worker)
+        finally:
+            for worker in dead:  # 关闭（等待退出）放在锁外
+                worker.close()
+        return _Worker(self.workspace_root)
+
+    def _release(self, worker: _Worker):
+        recycle = not worker.alive() or worker.runs >= self.max_runs_per_worker
+        try:
+            if recycle:
+                logger.debug(f"Recycling sandbox worker after {worker.runs} runs")
+                worker.close()
+                if not self._closed:
+                    # 回收后立即补一个新进程（锁外启动），下次取用时解释器已启动完毕
+                    self._add_idle([_Worker(self.workspace_root)])
+            else:
+                self._add_idle([worker])
+        finally:
+            self._slots.release()
+
+    def run(self, code: str, cwd: str = None, timeout_sec: float = 10, cancel=None) -> dict:
+        """执行一次；cancel 置位时杀掉子进程，exception 为 CANCELLED。"""
+        if self._closed:
+            raise SandboxWorkerError("Sandbox pool is shut down")
+        worker = self._acquire()
+        cwd = cwd or worker.workspace
+        req = {
+            'code': code,
+            'cwd': cwd,
+            'filename': os.path.join(cwd, 'temp.py'),
+            'timeout_sec': timeout_sec,
+            'max_memory_mb': self.max_memory_mb,
+            'cpu_sec': timeout_sec + 1,
+            'max_open_files': self.max_open_files,
+        }
+        result = {'stdout': '', 'stderr': '', 'returncode': -1, 'exception': None}
+        try:
+            resp = worker.request(req, guard_timeout=timeout_sec + 5, cancel=cancel)
+        except SandboxWorkerError as e:
+            result['exception'] = str(e)
+            logger.error(f"Sandbox worker failure: {e}")
+            return result
+        finally:
+            self._release(worker)
+
+        result['stdout'] = resp['stdout']
+        result['stderr'] = resp['stderr']
+        result['returncode'] = resp['returncode']
+        violation = describe_violation(result['returncode'], result['stderr'])
+        if resp.get('error'):
+            result['exception'] = resp['error']
+        elif resp['cancelled']:
+            result['exception'] = CANCELLED
+        elif resp['timed_out']:
+            logger.warning("Execution timed out, terminating process")
+            result['exception'] = 'TimeoutError: Execution exceeded timeout'
+        elif violation:
+            logger.warning(f"Resource limit exceeded: {violation}")
+            result['exception'] = violation
+        elif result['returncode'] != 0:
+            result['exception'] = result['stderr'] or 'Unknown error'
+            logger.error(f"Execution failed with exception: {result['exception']}")
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
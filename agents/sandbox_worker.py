@@ -0,0 +1,189 @@
+"""
+沙箱预热工作进程（fork-server）。
+
+由 agents.sandbox_pool.SandboxPool 以独立解释器启动，只依赖标准库。
+协议：从 stdin 每行读取一个 JSON 请求，向 stdout 每行写回一个 JSON 响应。
+- 请求: {'code': str, 'cwd': str, 'filename': str, 'timeout_sec': float,
+         'max_memory_mb': int, 'cpu_sec': float, 'max_open_files': int}
+- 响应: {'stdout': str, 'stderr': str, 'returncode': int, 'timed_out': bool, 'max_rss_kb': int}
+  fork 之后、响应之前先写一行 {'started': 子进程 pid}，供调用方取消时杀掉子进程组。
+
+每个请求在 fork 出的子进程中执行，子进程独立进程组、独立工作目录和 umask，
+工作进程本身的解释器状态不受被测代码影响，省去每次冷启动解释器的开销。
+"""
+import builtins
+import json
+import linecache
+import os
+import select
+import shutil
+import signal
+import sys
+import time
+import traceback
+import types
+
+from resource_limits import apply_limits  # 与本文件同目录（脚本方式启动时 sys.path[0]）
+
+STDOUT_FILE = '.sandbox_stdout'
+STDERR_FILE = '.sandbox_stderr'
+
+
+def _exec_in_child(req: dict, out_path: str, err_path: str, proto_fd: int):
+    """子进程：重定向标准流、设置限制并以 __main__ 身份执行代码，不返回。"""
+    os.setsid()
+    os.close(proto_fd)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 1)
+    os.dup2(os.open(err_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 2)
+
+    cwd = req['cwd']
+    os.chdir(cwd)
+    os.umask(0o077)
+    apply_limits(req.get('max_memory_mb'), req.get('cpu_sec'), req.get('max_open_files'))
+
+    returncode = run_as_main(req['code'], req.get('filename') or os.path.join(cwd, 'temp.py'), cwd)
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(returncode & 0xFF)
+
+
+def run_as_main(code: str, filename: str, cwd: str) -> int:
+    """
+    以 __main__ 身份执行代码（sys.path[0] 为 cwd），输出与解释器直接运行脚本一致，返回退出码。
+    预热池的子进程与逐次启动的 sandbox_launcher 共用。
+    """
+    # 注册源码，保证回溯中能显示出错行（与直接运行 temp.py 一致）
+    linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+    main_module = types.ModuleType('__main__')
+    main_module.__file__ = filename
+    main_module.__builtins__ = builtins
+    sys.modules['__main__'] = main_module
+    sys.argv = [filename]
+    sys.path[0] = cwd
+
+    try:
+        exec(compile(code, filename, 'exec'), main_module.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except SyntaxError as e:
+        # 与解释器直接运行脚本的输出保持一致：语法错误无 Traceback 头
+        sys.stderr.write(''.join(traceback.format_exception_only(type(e), e)))
+        return 1
+    except BaseException as e:
+        # 跳过本文件的栈帧，只保留被测代码的回溯
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+    return 0
+
+
+def _wait_child(pid: int, timeout_sec: float) -> tuple[int, object, bool]:
+    """等待子进程结束，超时则杀掉整个进程组。返回 (status, rusage, timed_out)。"""
+    deadline = time.monotonic() + timeout_sec
+    pidfd = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+    try:
+        delay = 0.001
+        while True:
+            wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+            if wpid:
+                return status, rusage, False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if pidfd is not None:
+                select.select([pidfd], [], [], remaining)
+            else:
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.05)
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage, True
+
+
+def _read_capture(path: str) -> str:
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ''
+
+
+def _clean_workspace(workspace: str):
+    """清除上一次运行在工作区留下的文件，使工作区可被复用。"""
+    for name in os.listdir(workspace):
+        path = os.path.join(workspace, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def handle_request(req: dict, workspace: str, proto_fd: int) -> dict:
+    """fork 子进程执行单个请求，收集输出。"""
+    out_path = os.path.join(workspace, STDOUT_FILE)
+    err_path = os.path.join(workspace, STDERR_FILE)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _exec_in_child(req, out_path, err_path, proto_fd)
+        finally:
+            os._exit(1)
+    # 先告知子进程 pid（独立进程组），调用方取消时可直接杀掉它，本进程随后照常返回响应
+    os.write(proto_fd, (json.dumps({'started': pid}) + '\n').encode('utf-8'))
+    status, rusage, timed_out = _wait_child(pid, float(req.get('timeout_sec') or 10))
+    resp = {
+        'stdout': _read_capture(out_path),
+        'stderr': _read_capture(err_path),
+        'returncode': os.waitstatus_to_exitcode(status),
+        'timed_out': timed_out,
+        'max_rss_kb': rusage.ru_maxrss,
+    }
+    _clean_workspace(workspace)
+    return resp
+
+
+def main():
+    workspace = sys.argv[1]
+    # 协议通道改用独立 fd，原 stdout 指向 /dev/null，避免任何意外输出污染协议
+    proto_fd = os.dup(1)
+    proto = os.fdopen(proto_fd, 'w', encoding='utf-8')
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    for line in sys.stdin.buffer:
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        try:
+            resp = handle_request(req, workspace, proto_fd)
+        except Exception as e:
+            resp = {'stdout': '', 'stderr': '', 'returncode': -1, 'timed_out': False,
+                    'max_rss_kb': 0, 'error': f"{type(e).__name__}: {e}"}
+        proto.write(json.dumps(resp) + '\n')
+        proto.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
+
+CLOUD = 'cloud'
+OLLAMA = 'ollama'
+SANDBOX = 'sandbox'
+
+
+class CapacityScheduler:
+    """
+    进程级容量限制：云端 LLM、本地 Ollama、沙箱执行各自独立的并发上限，
+    多个项目（IterationState）并发运行时共享。
+    - limits: {资源名: 上限}，上限为 None/0 的资源不限制。
+
+    slot() 按线程可重入：同一线程内嵌套申请同一资源（如调度器线程里调用 LLMClient.generate）只占一个名额。
+    """
+
+    def __init__(self, limits: dict):
+        self.limits = {name: int(limit) for name, limit in limits.items() if limit}
+        self._semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()}
+        self._held = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {name: {'in_use': 0, 'peak': 0, 'acquired': 0, 'wait_sec': 0.0} for name in self.limits}
+
+    def _depth(self) -> dict:
+        if not hasattr(self._held, 'depth'):
+            self._held.depth = {}
+        return self._held.depth
+
+    @contextmanager
+    def slot(self, resource: str):
+        """占用一个 resource 名额直到退出上下文；名额用尽时阻塞等待。"""
+        semaphore = self._semaphores.get(resource)
+        depth = self._depth()
+        if semaphore is None or depth.get(resource):
+            depth[resource] = depth.get(resource, 0) + 1
+            try:
+                yield
+            finally:
+                depth[resource] -= 1
+            return
+
+        start = time.perf_counter()
+        semaphore.acquire()
+        waited = time.perf_counter() - start
+        with self._lock:
+            stats = self._stats[resource]
+            stats['in_use'] += 1
+            stats['acquired'] += 1
+            stats['peak'] = max(stats['peak'], stats['in_use'])
+            stats['wait_sec'] += waited
+        if waited > 1:
+            logger.debug(f"Waited {waited:.1f}s for a {resource} slot")
+        depth[resource] = 1
+        try:
+            yield
+        finally:
+            depth[resource] = 0
+            with self._lock:
+                self._stats[resource]['in_use'] -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: dict(stats, limit=self.limits[name]) for name, stats in self._stats.items()}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> CapacityScheduler:
+    """按 config.yaml 的 scheduler 段懒创建全局调度器（未配置的项沿用各自的并发配置）。"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            section = config.get('scheduler') or {}
+            _scheduler = CapacityScheduler({
+                CLOUD: section.get('cloud_llm', (config.get('cloud_llm') or {}).get('max_concurrency')),
+                OLLAMA: section.get('local_llm', (config.get('local_llm') or {}).get('max_concurrency')),
+                SANDBOX: section.get('sandbox', ((config.get('sandbox') or {}).get('pool') or {}).get('size')),
+            })
+        return _scheduler
@@ -1,19 +1,15 @@
 import re
 import difflib
 import ast
-import os
 import logging
-import logging.config
-import yaml
-import ollama  # 新增导入
 
-# 加载配置（保持原样）
-config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.yaml')
-with open(config_path, 'r', encoding='utf-8') as f:
-    config = yaml.safe_load(f)
+from .prompt_builder import LOCAL_BUDGET_TOKENS, PromptBuilder, record_ollama_usage, truncate_to_tokens
+from .scheduler import OLLAMA, get_scheduler
+from .settings import get_settings, lazy_import
+from .tracing import span
 
-logging_conf_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'logging.conf')
-logging.config.fileConfig(logging_conf_path)
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
+ollama = lazy_import('ollama')  # 第一次调用时才导入
 
 
 def micro_fix(code: str, error: dict) -> tuple[str, bool]:
@@ -26,17 +22,20 @@ def micro_fix(code: str, error: dict) -> tuple[str, bool]:
     logging.info(f"Attempting LLM micro fix for error: {exc[:100]}...")
 
     # LLM Prompt：设计为结构化，限制输出为代码或 NO_FIX
-    prompt = f"""You are a code fixer. Given this Python code:
-{code}
-
-It has this error: {exc}
-
-If it's a minor SyntaxError or NameError, fix it and return ONLY the full fixed code.
-If you can't fix or it's not minor, return 'NO_FIX'."""
+    # 代码必须完整保留，超出本地模型预算时只截短栈迹（保留末尾的异常行）
+    prompt = (PromptBuilder(LOCAL_BUDGET_TOKENS)
+              .add(f"You are a code fixer. Given this Python code:\n{code}\n", name='code')
+              .add(f"It has this error: {exc}\n", name='error',
+                   shrink=lambda n: f"It has this error: {truncate_to_tokens(exc, n - 8, keep='tail')}\n")
+              .add("If it's a minor SyntaxError or NameError, fix it and return ONLY the full fixed code.\n"
+                   "If you can't fix or it's not minor, return 'NO_FIX'.", name='instruction')
+              .build())
 
     try:
-        response = ollama.generate(model='qwen3:4b', prompt=prompt, options={'temperature': 0.2, 'num_ctx': 16384})
-        fixed_code = response['response'].strip()
+        with span('ollama'), get_scheduler().slot(OLLAMA):
+            response = ollama.generate(model='qwen3:4b', prompt=prompt, options={'temperature': 0.2, 'num_ctx': 16384})
+            fixed_code = response['response'].strip()
+            record_ollama_usage(response, prompt, fixed_code)
         if fixed_code == 'NO_FIX':
             logging.info("LLM: No fix applied")
             return code, False
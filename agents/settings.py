@@ -0,0 +1,156 @@
+"""
+进程级配置与启动设置：config.yaml 只解析一次并缓存（支持环境变量覆盖），日志只在入口初始化一次，
+重量级依赖（如 ollama）延迟到第一次使用时才导入。
+"""
+import importlib.util
+import logging
+import logging.config
+import os
+import sys
+import threading
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(ROOT_DIR, 'config', 'config.yaml')
+LOGGING_CONF_PATH = os.path.join(ROOT_DIR, 'config', 'logging.conf')
+ENV_PREFIX = 'AUTOCODE__'  # AUTOCODE__SANDBOX__TIMEOUT_SEC=20 覆盖 sandbox.timeout_sec
+
+logger = logging.getLogger(__name__)
+
+_settings: dict[str, dict] = {}
+_settings_lock = threading.Lock()
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+
+def apply_env_overrides(config: dict, environ=None) -> dict:
+    """
+    用 AUTOCODE__<段>__<键>[__<子键>...] 形式的环境变量覆盖配置（键不区分大小写）。
+    值按 YAML 标量解析：'20' -> 20，'true' -> True，'[1, 2]' -> 列表，'null' -> None。
+    """
+    environ = os.environ if environ is None else environ
+    for name, raw in environ.items():
+        if not name.startswith(ENV_PREFIX):
+            continue
+        keys = [key.lower() for key in name[len(ENV_PREFIX):].split('__') if key]
+        if not keys:
+            continue
+        node = config
+        for key in keys[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        try:
+            node[keys[-1]] = yaml.safe_load(raw)
+        except yaml.YAMLError:
+            node[keys[-1]] = raw
+    return config
+
+
+def apply_standin(config: dict) -> dict:
+    """
+    standin.url 非空时把所有 LLM 客户端指向本地替身服务（benchmarks/llm_standin.py）：
+    云端 cloud_llm.base_url 改为该地址，Ollama 通过 OLLAMA_HOST 环境变量指向同一地址。
+    ollama 在第一次调用时才导入，因此须在任何 Ollama 调用之前加载配置（AUTOCODE__STANDIN__URL 即可）。
+    """
+    url = (config.get('standin') or {}).get('url')
+    if not url:
+        return config
+    url = str(url).rstrip('/')
+    config.setdefault('cloud_llm', {})['base_url'] = url
+    os.environ['OLLAMA_HOST'] = url
+    if 'ollama' in sys.modules:
+        logger.warning("ollama was imported before the stand-in switch, its default client keeps the old host")
+    logger.info(f"LLM clients redirected to stand-in server {url}")
+    return config
+
+
+def load_settings(path: str = CONFIG_PATH, environ=None) -> dict:
+    """读取并解析配置文件（不缓存），应用环境变量覆盖与替身服务开关。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    return apply_standin(apply_env_overrides(config, environ))
+
+
+def get_settings(path: str = None) -> dict:
+    """
+    返回缓存的配置（每个配置文件每进程只解析一次）。
+    - path: 配置文件路径，默认 config/config.yaml；相对路径按项目根目录解析。
+    返回的 dict 为全进程共享，调用方不应修改。
+    """
+    path = CONFIG_PATH if path is None else path
+    if not os.path.isabs(path):
+        path = os.path.join(ROOT_DIR, path)
+    path = os.path.normpath(path)
+    settings = _settings.get(path)
+    if settings is None:
+        with _settings_lock:
+            settings = _settings.get(path)
+            if settings is None:
+                settings = _settings[path] = load_settings(path)
+    return settings
+
+
+def reload_settings():
+    """清空缓存，下次 get_settings 重新读取（测试或修改配置文件后使用）。"""
+    with _settings_lock:
+        _settings.clear()
+
+
+def setup_logging(level: str = None, force: bool = False):
+    """
+    按 config/logging.conf 初始化日志，只在入口调用一次（重复调用无效果，除非 force）。
+    - level: 根日志级别，默认取 agent.log_level。
+    日志文件写到项目根目录的 logs/ 下，与当前工作目录无关。
+    """
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured and not force:
+            return
+        log_dir = os.path.join(ROOT_DIR, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        logging.config.fileConfig(LOGGING_CONF_PATH, defaults={'logdir': log_dir.replace('\\', '/')},
+                                  disable_existing_loggers=False)
+        level = level or (get_settings().get('agent') or {}).get('log_level')
+        if level:
+            logging.getLogger().setLevel(str(level).upper())
+        _logging_configured = True
+
+
+class LazyModule:
+    """
+    模块代理：第一次访问属性时才执行导入（加锁，多线程同时首次访问也只导入一次）。
+    unittest.mock.patch('pkg.mod.ollama.generate') 之类的打补丁方式照常可用。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str):
+    """
+    延迟导入模块：已导入时直接返回模块本身，否则返回 LazyModule 代理。
+    模块不存在时立即抛出 ImportError（与直接 import 一致）。
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    return LazyModule(name)
@@ -1,26 +1,64 @@
 import re
-import ast
-import hashlib
+import sys
 import json
 import os
 import logging
-import yaml
-import ollama  # 新增导入，用于 LLM 增强
+import shutil
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .sandbox import run_in_sandbox  # 同包导入沙箱
+from .settings import get_settings, lazy_import
+from .sandbox import CANCELLED, get_workspaces, run_in_sandbox  # 同包导入沙箱
+from .result_cache import CaseResultCache
+from .failure_analysis import ABSTRACT_MAX_CHARS, analyze_failures, fallback_analysis
+from .preflight import PREFLIGHT_CASE, check_code, pytest_blocks, strip_code_fences
+from .fingerprint import fingerprint, cluster_key, error_type_of
+from .error_ledger import ErrorLedger
+from .error_book import ErrorBook
+from .scheduler import OLLAMA, get_scheduler
+from .tracing import bind, record_span, span
 
-# 加载配置（相对路径，从agents/到根config/）
-config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.yaml')
-with open(config_path, 'r', encoding='utf-8') as f:
-    config = yaml.safe_load(f)
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
+ollama = lazy_import('ollama')  # 用于 LLM 增强，第一次调用时才导入
+
+TIMEOUT_SEC = config['sandbox']['timeout_sec']
+CASE_TIMEOUT_SEC = config['sandbox'].get('case_timeout_sec', TIMEOUT_SEC)
+RUNNER = config['sandbox'].get('runner', 'isolated')  # pytest | batch | isolated
+MAX_WORKERS = max(1, int(config['sandbox'].get('max_workers', 1)))
+FAIL_FAST = bool(config['sandbox'].get('fail_fast', False))
+PREFLIGHT = config.get('preflight') or {'enabled': True}  # 沙箱前的静态预检
+RESULT_CACHE_CONFIG = config['sandbox'].get('result_cache') or {}
+# 影响用例结果的沙箱配置，作为缓存键的一部分
+SANDBOX_FINGERPRINT = {
+    'timeout_sec': TIMEOUT_SEC,
+    'case_timeout_sec': CASE_TIMEOUT_SEC,
+    'max_memory_mb': config['sandbox']['max_memory_mb'],
+    'runner': RUNNER,
+}
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> CaseResultCache | None:
+    """按 sandbox.result_cache 懒创建全局结果缓存（未启用返回 None）。路径相对项目根目录。"""
+    global _result_cache
+    if not RESULT_CACHE_CONFIG.get('enabled', False):
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            path = RESULT_CACHE_CONFIG.get('path', '.cache/test_results.sqlite')
+            if not os.path.isabs(path):
+                path = os.path.join(os.path.dirname(os.path.dirname(__file__)), path)
+            _result_cache = CaseResultCache(path, RESULT_CACHE_CONFIG.get('max_entries', 5000))
+        return _result_cache
 
-# 配置日志（使用logging.conf）
-logging_conf_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'logging.conf')
-logging.config.fileConfig(logging_conf_path)
 
 # LLM 配置（从 config.yaml 读取，或 hardcode）
-LLM_MODEL = 'qwen3:4b'  # 你的模型
-LLM_TEMPERATURE = 0.2  # 低温度，确保精确
+LLM_MODEL = (config.get('local_llm') or {}).get('model', 'qwen3:4b')  # 你的模型
+LLM_TEMPERATURE = (config.get('local_llm') or {}).get('temperature', 0.2)  # 低温度，确保精确
+ANALYSIS_BATCH_SIZE = (config.get('local_llm') or {}).get('analysis_batch_size', 8)  # 每条诊断提示包含的失败数
 
 
 def extract_pytest_cases(srs_path: str) -> list[str]:
@@ -28,14 +66,13 @@ def extract_pytest_cases(srs_path: str) -> list[str]:
     从SRS Markdown提取pytest用例代码块。
     - srs_path: SRS文件路径。
     返回: pytest函数字符串列表。
-    示例: 提取def test_xxx()块。
+    示例: 提取def test_xxx()块，以及带 @pytest.mark.parametrize / fixture、以 import pytest 开头的块（见 preflight.is_test_block）。
     """
     logging.info(f"Extracting pytest cases from {srs_path}")
     try:
         with open(srs_path, 'r', encoding='utf-8') as f:
             content = f.read()
-        cases = re.findall(r'```python\n(.*?)\n```', content, re.DOTALL)
-        filtered_cases = [case.strip() for case in cases if case.strip().startswith('def test_')]
+        filtered_cases = pytest_blocks(content)
         logging.info(f"Extracted {len(filtered_cases)} test cases")
         return filtered_cases
     except FileNotFoundError:
@@ -48,131 +85,695 @@ def extract_pytest_cases(srs_path: str) -> list[str]:
 
 def compute_error_fingerprint(error_type: str, stack_trace: str, related_code: str) -> str:
     """
-    计算错误指纹：异常类型 + 栈迹 + AST子树哈希。
-    - error_type: 异常类型（如'SyntaxError'）。
+    计算错误指纹：异常类型 + 最内层栈帧函数 + 用例AST（栈迹先归一化，见 fingerprint.py）。
+    - error_type: 异常类型（如'SyntaxError'），栈迹中解析不出类型时使用。
     - stack_trace: 异常栈字符串。
     - related_code: 相关代码片段（用例或源码）。
-    返回: SHA256哈希字符串。
+    返回: 64 位十六进制 blake2b 哈希字符串。路径、行号、地址变化不影响结果。
 
-    增强: 用 LLM 生成智能摘要（abstract）。
+    纯函数，不调用 LLM；摘要和诊断由 failure_analysis 在一次迭代结束时批量生成。
     """
-    logging.debug("Computing error fingerprint")
-    try:
-        tree = ast.parse(related_code)
-        ast_str = ast.dump(tree, indent=None)
-    except SyntaxError as e:
-        ast_str = related_code  # 回退到原始代码
-        logging.warning(f"AST parse failed: {e}")
-    data = f"{error_type}:{stack_trace}:{ast_str}".encode('utf-8')
-    hash_value = hashlib.sha256(data).hexdigest()
+    hash_value = fingerprint(stack_trace, related_code, error_type)
     logging.debug(f"Fingerprint computed: {hash_value[:10]}...")  # 只记录前10位
+    return hash_value
+
+
+_BATCH_MARKER = '__AUTOCODE_CASE_RESULT__'
+_SKIPPED = object()  # fail-fast 取消、未执行的用例
+
+
+class _RunError(str):
+    """沙箱或测试运行器本身的失败（超时、崩溃、沙箱异常等），不是用例自己的结果，不写入结果缓存。"""
+
+
+class _AnyEvent:
+    """组合多个取消信号（None 忽略），任一置位即视为置位；可直接传给 run_in_sandbox。"""
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self) -> bool:
+        return any(event.is_set() for event in self.events)
+
+# 批量执行脚本：源码只编译/执行一次，每个用例在命名空间副本中运行，逐条输出结果
+_BATCH_HARNESS = """
+import json, linecache, signal, sys, time, traceback
+
+_SOURCE = {source!r}
+_CASES = {cases!r}
+_CASE_TIMEOUT = {case_timeout!r}
+_MARKER = {marker!r}
+
+
+class _CaseTimeout(BaseException):
+    pass
+
 
-    # LLM 增强: 生成摘要（可选，回退到原逻辑）
+def _on_alarm(signum, frame):
+    raise _CaseTimeout()
+
+
+def _register(filename, text):
+    linecache.cache[filename] = (len(text), None, text.splitlines(True), filename)
+
+
+def _format(exc):
+    if isinstance(exc, _CaseTimeout):
+        return 'TimeoutError: Execution exceeded timeout'
+    if isinstance(exc, SyntaxError):
+        return ''.join(traceback.format_exception_only(type(exc), exc))
+    return ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__.tb_next))
+
+
+def _report(index, exception, elapsed=0.0):
+    sys.stdout.write('\\n' + _MARKER + json.dumps({{'index': index, 'exception': exception, 'elapsed': elapsed}}) + '\\n')
+    sys.stdout.flush()
+
+
+def _main():
+    _register('src.py', _SOURCE)
+    namespace = {{'__name__': 'src', '__builtins__': __builtins__}}
+    load_error = None
     try:
-        prompt = f"""Analyze this Python error:
-Error type: {error_type}
-Stack trace: {stack_trace}
-Related code: {related_code}
-
-Provide a brief summary (under 100 chars) including possible cause. Output ONLY the summary text."""
-        response = ollama.generate(model=LLM_MODEL, prompt=prompt, options={'temperature': LLM_TEMPERATURE})
-        enhanced_abstract = response['response'].strip()[:100]
-        logging.info(f"LLM enhanced abstract: {enhanced_abstract}")
-        # 这里返回 hash，但你可以修改 err['abstract'] 在调用处使用此摘要
-    except Exception as e:
-        logging.error(f"LLM analysis failed: {e}")
-        enhanced_abstract = f"{error_type} in test case"  # 回退
+        exec(compile(_SOURCE, 'src.py', 'exec'), namespace)
+    except BaseException as exc:
+        load_error = _format(exc)
+    use_alarm = hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+    for index, (case, func_name) in enumerate(_CASES):
+        if load_error is not None:
+            _report(index, load_error)
+            continue
+        filename = 'case_%d.py' % index
+        _register(filename, case)
+        scope = dict(namespace)
+        scope['__name__'] = '__main__'
+        start = time.perf_counter()
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, _CASE_TIMEOUT)
+            try:
+                exec(compile(case, filename, 'exec'), scope)
+                scope[func_name]()
+            finally:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        except BaseException as exc:
+            _report(index, _format(exc), time.perf_counter() - start)
+        else:
+            _report(index, None, time.perf_counter() - start)
+
+
+_main()
+"""
 
-    return hash_value  # 原返回不变，摘要可在调用处使用
 
+_FROM_IMPORT_RE = re.compile(r'^[ \t]*from[ \t]+([\w.]+)[ \t]+import[ \t]+(?:\([^)]*\)|[^\n]*)', re.MULTILINE)
+_TEST_FUNC_RE = re.compile(r'^[ \t]*(?:async[ \t]+)?def[ \t]+(test_\w*)[ \t]*\(', re.MULTILINE)
 
-def run_pytest_cases(cases: list[str], code: str, src_dir: str) -> list[dict]:
+
+def adjust_case(case: str) -> str:
     """
-    执行提取的pytest用例（在沙箱中）。
-    - cases: 用例列表。
-    - code: 要测试的源码字符串（假设包含被测函数）。
-    - src_dir: 源码目录（用于sys.path）。
-    返回: fresh_errors列表[{'hash': str, 'abstract': str, 'case': str, 'exception': str, 'llm_diagnosis': str}]
+    移除从被测模块导入的语句（如 from src import add），因为 code 是内联字符串，直接使用函数。
+    pytest 与标准库的导入保留（如 from pytest import approx、from math import pi）。
+    """
+    def drop(match):
+        top = match.group(1).split('.')[0]
+        return match.group(0) if top == 'pytest' or top in sys.stdlib_module_names else ''
+    return _FROM_IMPORT_RE.sub(drop, case).strip()
+
+
+def _case_func_name(adjusted_case: str) -> str:
+    match = _TEST_FUNC_RE.search(adjusted_case)
+    return match.group(1) if match else adjusted_case.split('(')[0].split()[-1]
+
 
-    增强: 用 LLM 分析每个异常，提供诊断信息。
+def split_support(adjusted_cases: list[str]) -> tuple[list[str], list[str]]:
     """
-    logging.info(f"Running {len(cases)} pytest cases")
-    fresh_errors = []
-    for case in cases:
-        # 移除任何导入语句，因为 code 是内联字符串，直接使用函数
-        adjusted_case = re.sub(r'from\s+.*\s+import\s+.*', '', case).strip()  # 用 regex 移除导入行
+    分出只有 fixture / 辅助定义、没有测试函数的块（support），它们不是用例：
+    pytest 模式下写进 tests/conftest.py 供全部用例使用，batch / isolated 模式不支持 fixture，忽略。
+    返回: (用例, support 块)。
+    """
+    cases, support = [], []
+    for case in adjusted_cases:
+        (cases if _TEST_FUNC_RE.search(case) else support).append(case)
+    return cases, support
+
 
-        # 组合完整代码：直接内联 code + adjusted_case + 调用测试，无需 sys.path 或模块导入
-        full_code = f"""
+def _run_case_isolated(adjusted_case: str, code: str, src_dir: str, cancel=None):
+    """单个用例独占一个沙箱执行，返回异常字符串（通过为 None，被 cancel 中止为 _SKIPPED，沙箱本身失败为 _RunError）。"""
+    # 组合完整代码：直接内联 code + adjusted_case + 调用测试，无需 sys.path 或模块导入
+    full_code = f"""
 {code}  # 内联源码函数定义
 
 {adjusted_case}  # 测试用例
 
 # 调用测试函数（假设test_xxx无参）
-test_func_name = '{adjusted_case.split('(')[0].split()[-1]}'
+test_func_name = '{_case_func_name(adjusted_case)}'
 globals()[test_func_name]()
 """
-        logging.debug(f"Executing test case: {adjusted_case[:50]}...")
-        result = run_in_sandbox(full_code, src_dir)
+    logging.debug(f"Executing test case: {adjusted_case[:50]}...")
+    with span('case', case=_case_func_name(adjusted_case)) as case_span:
+        result = run_in_sandbox(full_code, src_dir, cancel=cancel)
+        case_span.set(passed=result['exception'] is None)
+    if result['exception'] == CANCELLED:
+        return _SKIPPED
+    if result['exception'] is not None and result['exception'] != result['stderr']:
+        return _RunError(result['exception'])  # 不是被测代码抛出的异常（其回溯即子进程的 stderr）
+    return result['exception']
+
+
+def _run_cases_batched(adjusted_cases: list[str], code: str, src_dir: str, cancel=None) -> list:
+    """
+    所有用例在同一个沙箱进程中执行：源码只加载一次，每个用例单独捕获异常并有独立超时。
+    进程中途崩溃或整体超时时，未上报结果的用例退回逐个隔离执行；被 cancel 中止时记为 _SKIPPED。
+    返回: 与 adjusted_cases 同序的异常字符串列表（通过为 None）。
+    """
+    harness = _BATCH_HARNESS.format(
+        source=code,
+        cases=[(case, _case_func_name(case)) for case in adjusted_cases],
+        case_timeout=CASE_TIMEOUT_SEC,
+        marker=_BATCH_MARKER,
+    )
+    timeout = TIMEOUT_SEC + CASE_TIMEOUT_SEC * len(adjusted_cases)
+    outcomes: dict[int, str | None] = {}
+    with span('shard', cases=len(adjusted_cases)) as shard_span:
+        result = run_in_sandbox(harness, src_dir, timeout_sec=timeout, cancel=cancel)
+        for line in result['stdout'].splitlines():
+            if line.startswith(_BATCH_MARKER):
+                try:
+                    record = json.loads(line[len(_BATCH_MARKER):])
+                    outcomes[record['index']] = record['exception']
+                    # 用例在沙箱进程内执行，按其上报的耗时补记用例区间
+                    record_span('case', record.get('elapsed', 0.0), parent=shard_span,
+                                passed=record['exception'] is None,
+                                case=_case_func_name(adjusted_cases[record['index']]))
+                except (json.JSONDecodeError, KeyError, IndexError) as e:
+                    logging.warning(f"Malformed batch result line: {e}")
+
+    missing = [i for i in range(len(adjusted_cases)) if i not in outcomes]
+    if missing and result['exception'] == CANCELLED:
+        return [outcomes.get(i, _SKIPPED) for i in range(len(adjusted_cases))]
+    if missing:
+        logging.warning(f"Batch run reported {len(outcomes)}/{len(adjusted_cases)} cases "
+                        f"({result['exception'] or 'no exception'}), rerunning the rest in isolation")
+        for i in missing:
+            outcomes[i] = _run_case_isolated(adjusted_cases[i], code, src_dir, cancel)
+    return [outcomes[i] for i in range(len(adjusted_cases))]
+
+
+_PYTEST_MARKER = '__AUTOCODE_LOAD_ERROR__'
+_PYTEST_RESULTS = 'results.jsonl'
+_CASE_FILE = re.compile(r'test_case_(\d+)\.py')
+
+# pytest 工作区的 conftest：单用例超时；失败回溯去掉 pytest 自身的栈帧（与 batch 模式的异常字符串一致）；
+# 每个测试阶段的结果立即追加一行 JSON 到结果文件，进程中途崩溃时已完成的结果不丢失
+_PYTEST_CONFTEST = """
+import json, os, signal, traceback
+
+import pytest
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_CASE_TIMEOUT = {case_timeout!r}
+_RESULTS = {results!r}
+
+
+class _CaseTimeout(BaseException):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _CaseTimeout()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    use_alarm = hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, _CASE_TIMEOUT)
+    try:
+        yield
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if not report.failed or call.excinfo is None:
+        return
+    exc = call.excinfo.value
+    if isinstance(exc, _CaseTimeout):
+        report.longrepr = 'TimeoutError: Execution exceeded timeout'
+        return
+    tb = exc.__traceback__
+    while tb is not None and not tb.tb_frame.f_code.co_filename.startswith(_ROOT):
+        tb = tb.tb_next
+    if tb is not None:
+        report.longrepr = ''.join(traceback.format_exception(type(exc), exc, tb))
+
+
+def _log(report, when):
+    record = {{'nodeid': report.nodeid, 'when': when, 'outcome': report.outcome,
+              'duration': getattr(report, 'duration', 0.0),
+              'longrepr': str(report.longrepr) if report.failed else None}}
+    with open(_RESULTS, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\\n')
+
+
+def pytest_runtest_logreport(report):
+    _log(report, report.when)
+
+
+def pytest_collectreport(report):
+    if report.failed:  # 用例模块本身导入失败
+        _log(report, 'collect')
+"""
+
+# 沙箱内执行的入口：先加载源码（失败时所有用例共用该错误，与 batch 模式一致），再跑一次 pytest
+_PYTEST_HARNESS = """
+import json, os, sys, traceback
+
+_ROOT = {root!r}
+_ARGS = {args!r}
+_MARKER = {marker!r}
+
+sys.path.insert(0, _ROOT)
+os.chdir(_ROOT)
+try:
+    import src.src
+except BaseException as exc:
+    if isinstance(exc, SyntaxError):
+        error = ''.join(traceback.format_exception_only(type(exc), exc))
+    else:
+        error = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__.tb_next))
+    sys.stdout.write('\\n' + _MARKER + json.dumps(error) + '\\n')
+    sys.exit(0)
+
+import pytest
+
+code = pytest.main(_ARGS)
+sys.exit(0 if code in (0, 1) else int(code))  # 1 = 有用例失败，结果在结果文件里
+"""
+
+# 每个用例文件的开头：导入 pytest，并把被测模块的名字放进用例的全局命名空间（用例中的 from 导入已被去掉）；
+# test / Test 开头的名字不复制，否则源码里的测试函数 / 测试类会在每个用例模块里被 pytest 重复收集
+_PYTEST_CASE_HEADER = """import pytest
+import src.src as _autocode_source
+
+globals().update({name: value for name, value in vars(_autocode_source).items()
+                  if not name.startswith(('__', 'test', 'Test'))})
+
+
+"""
 
-        if result['exception']:
-            error_type = result['exception'].split(':')[0].strip() if ':' in result['exception'] else 'Unknown'
-            stack_trace = result['exception']
-            hash_value = compute_error_fingerprint(error_type, stack_trace, adjusted_case)
 
-            # LLM 增强: 分析异常，提供诊断
+def html_report_available() -> bool:
+    """pytest-html 是否可用（可选依赖，未安装时不生成 HTML 报告）。"""
+    return importlib.util.find_spec('pytest_html') is not None
+
+
+def _write_pytest_workspace(root: str, adjusted_cases: list[str], code: str, support: list[str] = ()):
+    """
+    写出真实的包结构：src/src.py（被测源码）、tests/test_case_<i>.py（每个用例一个模块，同名用例互不覆盖）、
+    conftest.py 与 pytest.ini（阻止向上查找宿主项目的配置）；有 support 块（共享 fixture）时写进 tests/conftest.py。
+    """
+    os.makedirs(os.path.join(root, 'src'))
+    os.makedirs(os.path.join(root, 'tests'))
+    files = {
+        os.path.join('src', '__init__.py'): '',
+        os.path.join('src', 'src.py'): code,
+        'conftest.py': _PYTEST_CONFTEST.format(case_timeout=CASE_TIMEOUT_SEC,
+                                               results=os.path.join(root, _PYTEST_RESULTS)),
+        'pytest.ini': '[pytest]\n',
+    }
+    if support:
+        files[os.path.join('tests', 'conftest.py')] = _PYTEST_CASE_HEADER + '\n\n\n'.join(support) + '\n'
+    for i, case in enumerate(adjusted_cases):
+        files[os.path.join('tests', f'test_case_{i}.py')] = _PYTEST_CASE_HEADER + case + '\n'
+    for name, content in files.items():
+        with open(os.path.join(root, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def _parse_results(path: str, parent=None) -> tuple[dict[int, str | None], set[int]]:
+    """
+    解析 conftest 写出的结果文件（每行一个测试阶段）：按文件名 test_case_<i> 汇总到用例下标，
+    任一测试项（参数化的每组）的任一阶段失败即该用例失败，异常取第一个失败阶段的文本。
+    每个测试项按各阶段耗时之和补记一个 case 区间。
+    返回: (outcomes {下标: 异常字符串或 None}, 有测试项开始了但没走到 teardown 的下标——进程在其执行中崩溃)。
+    """
+    outcomes: dict[int, str | None] = {}
+    items: dict[str, dict] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
             try:
-                prompt = f"""Diagnose this Python test failure:
-Error: {result['exception']}
-Code snippet: {adjusted_case}
+                record = json.loads(line)
+            except json.JSONDecodeError:  # 进程被杀时最后一行可能不完整
+                continue
+            match = _CASE_FILE.search(record['nodeid'])
+            if match is None:
+                continue
+            index = int(match.group(1))
+            exception = record['longrepr'] if record['outcome'] == 'failed' else None
+            if outcomes.get(index) is None:
+                outcomes[index] = exception
+            item = items.setdefault(record['nodeid'], {'index': index, 'duration': 0.0, 'passed': True})
+            item['duration'] += record['duration'] or 0.0
+            item['passed'] = item['passed'] and exception is None
+            item['finished'] = record['when'] in ('teardown', 'collect')
+    for nodeid, item in items.items():
+        record_span('case', item['duration'], parent=parent, passed=item['passed'], case=nodeid.split('::')[-1])
+    unfinished = {item['index'] for item in items.values() if not item['finished']}
+    for index in unfinished:
+        outcomes.pop(index, None)
+    return outcomes, unfinished
 
-Output JSON: {{"abstract": "brief summary <100 chars", "diagnosis": "possible cause and fix suggestion"}}"""
-                response = ollama.generate(model=LLM_MODEL, prompt=prompt, options={'temperature': LLM_TEMPERATURE})
-                llm_output = json.loads(response['response'].strip())  # 假设输出 JSON
-                abstract = llm_output.get('abstract', f"{error_type} in test case")
-                diagnosis = llm_output.get('diagnosis', '')
-                logging.info(f"LLM diagnosis: {diagnosis}")
-            except Exception as e:
-                logging.error(f"LLM diagnosis failed: {e}")
-                abstract = f"{error_type} in test case"
-                diagnosis = ''
-
-            err = {
-                'hash': hash_value,
-                'abstract': abstract,  # 使用 LLM 增强摘要
+
+def _pytest_once(adjusted_cases: list[str], code: str, fail_fast: bool, html_report: str = None, cancel=None,
+                 support: list[str] = ()):
+    """
+    在一个沙箱进程中对全部用例跑一次 pytest（support 见 split_support）。
+    返回: (outcomes, unfinished, 沙箱结果)，见 _parse_results。源码加载失败时所有用例共用该错误。
+    """
+    with get_workspaces().workspace() as root:  # 可复用的 tmpfs 工作区，归还时清空
+        _write_pytest_workspace(root, adjusted_cases, code, support)
+        results_path = os.path.join(root, _PYTEST_RESULTS)
+        args = ['-q', '-p', 'no:cacheprovider', '--tb=native', '--continue-on-collection-errors', 'tests']
+        if fail_fast:
+            args.insert(0, '-x')
+        html_path = None
+        if html_report and html_report_available():
+            html_path = os.path.join(root, 'report.html')
+            args += [f'--html={html_path}', '--self-contained-html']
+        harness = _PYTEST_HARNESS.format(root=root, args=args, marker=_PYTEST_MARKER)
+        timeout = TIMEOUT_SEC + CASE_TIMEOUT_SEC * len(adjusted_cases)
+
+        with span('pytest', cases=len(adjusted_cases)) as run_span:
+            result = run_in_sandbox(harness, root, timeout_sec=timeout, cancel=cancel)
+            for line in result['stdout'].splitlines():
+                if line.startswith(_PYTEST_MARKER):
+                    load_error = json.loads(line[len(_PYTEST_MARKER):])
+                    return {i: load_error for i in range(len(adjusted_cases))}, set(), result
+            outcomes, unfinished = {}, set()
+            if os.path.exists(results_path):
+                outcomes, unfinished = _parse_results(results_path, run_span)
+        if html_path and os.path.exists(html_path):
+            os.makedirs(os.path.dirname(os.path.abspath(html_report)), exist_ok=True)
+            shutil.copyfile(html_path, html_report)
+        return outcomes, unfinished, result
+
+
+def _run_cases_pytest(adjusted_cases: list[str], code: str, fail_fast: bool,
+                      html_report: str = None, cancel=None, support: list[str] = ()) -> list:
+    """
+    所有用例作为真实的测试模块在一个沙箱进程中跑一次 pytest（fixture、parametrize 照常可用），
+    逐项结果取自 conftest 逐行写出的 JSON 结果文件；给出 html_report 且安装了 pytest-html 时同一次运行顺带生成 HTML 报告。
+    进程中途崩溃或整体超时：正在执行的用例记为该次运行的异常，还没开始的用例再合起来跑一次，直到没有进展为止。
+    fail-fast 时出现失败后不再重跑，其余用例记为 _SKIPPED；被 cancel 中止时未完成的用例同样记为 _SKIPPED。
+    返回: 与 adjusted_cases 同序的结果（异常字符串 / None / _SKIPPED）。
+    """
+    outcomes: dict[int, str | None] = {}
+    pending = list(range(len(adjusted_cases)))
+    while pending:
+        found, unfinished, result = _pytest_once([adjusted_cases[i] for i in pending], code, fail_fast, html_report,
+                                                 cancel, support)
+        html_report = None  # 重跑的只是部分用例，不覆盖报告
+        if result['exception'] == CANCELLED:
+            for local, exception in found.items():
+                outcomes[pending[local]] = exception
+            break
+        crash = _RunError(result['exception'] or 'Test run ended without a result')
+        for local, exception in found.items():
+            outcomes[pending[local]] = exception
+        for local in unfinished:
+            outcomes[pending[local]] = crash
+        rest = [i for i in pending if i not in outcomes]
+        if not rest or (fail_fast and any(outcomes.values())):
+            break
+        if len(rest) == len(pending):  # 没有任何进展（如 pytest 无法启动）
+            for i in rest:
+                outcomes[i] = crash
+            break
+        logging.warning(f"pytest run ended early ({crash.splitlines()[-1] if crash.strip() else crash}), "
+                        f"rerunning {len(rest)} remaining cases")
+        pending = rest
+    return [outcomes.get(i, _SKIPPED) for i in range(len(adjusted_cases))]
+
+
+def write_html_report(cases: list[str], code: str, report_path: str) -> bool:
+    """
+    单独跑一次 pytest 生成 HTML 报告（测试时没有顺带生成时使用，如结果全部命中缓存）。
+    返回: 是否生成了报告（未安装 pytest-html 时为 False）。
+    """
+    if not html_report_available():
+        logging.warning("pytest-html is not installed, skipping HTML report")
+        return False
+    if '```' in code:
+        code = strip_code_fences(code)
+    cases, support = split_support([adjust_case(case) for case in cases if case != PREFLIGHT_CASE])
+    _run_cases_pytest(cases, code, fail_fast=False, html_report=report_path, support=support)
+    return os.path.exists(report_path)
+
+
+def _analyze_failures(failures: list[tuple[str, str]], diagnose: bool = True) -> list[dict]:
+    """
+    计算失败用例的指纹，并把全部失败交给 failure_analysis 批量诊断，结果与输入同序。
+    - failures: [(adjusted_case, exception), ...]
+    - diagnose: False 时不调用 LLM，摘要取自异常类型（用于已取消的测试）。
+    """
+    records = []
+    with span('fingerprint', failures=len(failures)):
+        for adjusted_case, exception in failures:
+            error_type = exception.split(':')[0].strip() if ':' in exception else 'Unknown'
+            records.append({
+                'hash': compute_error_fingerprint(error_type, exception, adjusted_case),
+                'cluster': cluster_key(exception),  # 近似重复的失败共用一次诊断
                 'case': adjusted_case,
-                'exception': result['exception'],
-                'llm_diagnosis': diagnosis  # 新增字段，供上游使用
-            }
-            fresh_errors.append(err)
-            logging.warning(f"Test failed: {err['abstract']}")
+                'exception': exception,
+            })
+    if diagnose:
+        with span('diagnose', failures=len(records)):
+            analyses = analyze_failures(records, LLM_MODEL, LLM_TEMPERATURE, batch_size=ANALYSIS_BATCH_SIZE)
+    else:
+        analyses = [fallback_analysis(record['exception']) for record in records]
+    for record, analysis in zip(records, analyses):
+        record['abstract'] = analysis['abstract']
+        record['llm_diagnosis'] = analysis['diagnosis']  # 新增字段，供上游使用
+    return [{key: record[key] for key in ('hash', 'abstract', 'case', 'exception', 'llm_diagnosis', 'cluster')}
+            for record in records]
+
 
+def _preflight_error(exception: str) -> dict:
+    """预检失败时的合成错误条目（字段与 run_pytest_cases 的返回一致，不做 LLM 诊断）。"""
+    return {
+        'hash': compute_error_fingerprint(error_type_of(exception), exception, PREFLIGHT_CASE),
+        'abstract': f"Preflight {exception.splitlines()[-1]}"[:ABSTRACT_MAX_CHARS],
+        'case': PREFLIGHT_CASE,
+        'exception': exception,
+        'llm_diagnosis': '',
+        'cluster': cluster_key(exception),
+    }
+
+
+def _execute_cases(adjusted_cases: list[str], code: str, src_dir: str,
+                   max_workers: int, fail_fast: bool, cancel: threading.Event = None,
+                   html_report: str = None, support: list[str] = ()) -> list:
+    """
+    并发执行用例，返回与 adjusted_cases 同序的结果（异常字符串 / None / _SKIPPED）。
+    - pytest 模式：全部用例一次 pytest 运行（不分片，max_workers 不起作用），可顺带生成 html_report；
+      support 块（共享 fixture，见 split_support）写进 tests/conftest.py，其他模式忽略。
+    - batch 模式：用例按顺序切成不超过 max_workers 个分片，每个分片一个沙箱进程。
+    - isolated 模式：每个用例一个任务。
+    - fail_fast: 首个失败出现后取消尚未开始的任务，并杀掉仍在运行的沙箱，其结果记为 _SKIPPED。
+    - cancel: 外部取消信号（如推测式生成中已有候选通过），置位后同样取消未开始的任务、杀掉运行中的沙箱。
+    实际进程数同时受沙箱预热池大小约束。
+    """
+    stop = threading.Event()  # fail-fast 时置位，正在运行的沙箱随之被杀掉、释放名额
+    abort = _AnyEvent(stop, cancel)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    n = len(adjusted_cases)
+    if RUNNER == 'pytest':
+        if cancelled():
+            return [_SKIPPED] * n
+        return _run_cases_pytest(adjusted_cases, code, fail_fast, html_report, cancel, support)
+    if support:
+        logging.warning(f"Ignoring {len(support)} fixture-only blocks, fixtures need the pytest runner")
+    if RUNNER == 'batch':
+        shard_count = min(max_workers, n)
+        size, extra = divmod(n, shard_count)
+        shards, start = [], 0
+        for k in range(shard_count):
+            end = start + size + (1 if k < extra else 0)
+            shards.append(list(range(start, end)))
+            start = end
+
+        def run_shard(indices):
+            return _run_cases_batched([adjusted_cases[i] for i in indices], code, src_dir, abort)
+    else:
+        shards = [[i] for i in range(n)]
+
+        def run_shard(indices):
+            return [_run_case_isolated(adjusted_cases[indices[0]], code, src_dir, abort)]
+
+    @bind  # 线程池中执行的用例区间仍挂在调用方的 execute 区间下
+    def task(indices):
+        if cancelled():
+            return [_SKIPPED] * len(indices)
+        return run_shard(indices)
+
+    outcomes = [_SKIPPED] * n
+    if max_workers == 1 or len(shards) == 1:
+        for indices in shards:
+            for i, exception in zip(indices, task(indices)):
+                outcomes[i] = exception
+            if (fail_fast and any(outcomes[i] not in (None, _SKIPPED) for i in indices)) or cancelled():
+                break
+        return outcomes
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(shards)), thread_name_prefix='sandbox-case')
+    try:
+        futures = {executor.submit(task, indices): indices for indices in shards}
+        for future in as_completed(futures):
+            indices = futures[future]
+            for i, exception in zip(indices, future.result()):
+                outcomes[i] = exception
+            if fail_fast and any(outcomes[i] not in (None, _SKIPPED) for i in indices):
+                logging.info("Fail-fast: cancelling outstanding test cases")
+                stop.set()
+                break
+            if cancelled():
+                logging.info("Cancelled: dropping outstanding test cases")
+                break
+    finally:
+        # fail-fast 或被取消时仍在运行的沙箱已被杀掉（stop / cancel），不等待其任务收尾，结果被丢弃
+        executor.shutdown(wait=not (stop.is_set() or cancelled()), cancel_futures=True)
+    return outcomes
+
+
+def run_pytest_cases(cases: list[str], code: str, src_dir: str,
+                     max_workers: int = None, fail_fast: bool = None,
+                     cache: CaseResultCache | None = None, cancel: threading.Event = None,
+                     required_names=(), html_report: str = None) -> list[dict]:
+    """
+    执行提取的pytest用例（在沙箱中）。
+    - cases: 用例列表。
+    - code: 要测试的源码字符串（假设包含被测函数）。
+    - src_dir: 源码目录（用于sys.path）。
+    - max_workers: 并发沙箱数（默认 sandbox.max_workers，只对 batch / isolated 生效）。
+    - fail_fast: 首个失败后取消剩余用例（默认 sandbox.fail_fast）。
+    - cache: 结果缓存（默认按 sandbox.result_cache 配置），命中的用例不再进入沙箱。
+    - cancel: 置位后不再启动新用例，已失败的用例不做 LLM 诊断（结果不完整，调用方应视为未通过）。
+    - required_names: SRS 接口签名中的名字，预检时要求源码都有定义。
+    - html_report: pytest 模式下全部用例都实际执行时，同一次运行把 HTML 报告写到该路径（需要 pytest-html）。
+    返回: fresh_errors列表[{'hash': str, 'abstract': str, 'case': str, 'exception': str, 'llm_diagnosis': str,
+    'cluster': str}]，
+    顺序与 cases 一致，与并发执行的完成顺序无关。
+
+    sandbox.runner 为 pytest 时源码与用例写成真实的包和测试模块，在一个沙箱进程内跑一次 pytest；
+    为 batch 时所有用例在一个沙箱进程内执行（源码只加载一次），为 isolated 时每个用例独占一个沙箱。
+    增强: 本次全部失败合并为一条（或按 analysis_batch_size 分成几条并发的）LLM 提示，批量生成摘要和诊断。
+
+    执行前先做静态预检（preflight 段）：去掉代码围栏后 compile、查未定义名字和缺失的接口，
+    不通过时直接返回一条 case 为 PREFLIGHT_CASE 的合成错误，不启动任何沙箱。
+    """
+    with span('run_tests', cases=len(cases)) as test_span:
+        fresh_errors = _run_pytest_cases(cases, code, src_dir, max_workers, fail_fast, cache, cancel, required_names,
+                                         html_report)
+        test_span.set(failures=len(fresh_errors))
+    return fresh_errors
+
+
+def _run_pytest_cases(cases: list[str], code: str, src_dir: str, max_workers: int, fail_fast: bool,
+                      cache: CaseResultCache | None, cancel: threading.Event, required_names,
+                      html_report: str = None) -> list[dict]:
+    if '```' in code:
+        code = strip_code_fences(code)
+    cases = [case for case in cases if case != PREFLIGHT_CASE]  # 复测合成错误 = 重新预检
+    if PREFLIGHT.get('enabled', True):
+        with span('preflight') as preflight_span:
+            problem = check_code(code, required_names if PREFLIGHT.get('interface_names', True) else (),
+                                 undefined_names=PREFLIGHT.get('undefined_names', True))
+            preflight_span.set(passed=problem is None)
+        if problem:
+            logging.warning(f"Preflight failed, skipping {len(cases)} sandbox runs: {problem.splitlines()[-1]}")
+            return [_preflight_error(problem)]
+    max_workers = MAX_WORKERS if max_workers is None else max(1, int(max_workers))
+    fail_fast = FAIL_FAST if fail_fast is None else fail_fast
+    cache = get_result_cache() if cache is None else cache
+    logging.info(f"Running {len(cases)} pytest cases ({RUNNER} mode, {max_workers} workers)")
+    adjusted_cases, support = split_support([adjust_case(case) for case in cases])
+
+    outcomes = [_SKIPPED] * len(adjusted_cases)
+    keys = []
+    if cache is not None:
+        shared = '\n\n'.join(support)  # 共享 fixture 改变时结果也要失效
+        keys = [cache.make_key(code, f'{shared}\n\n{case}' if shared else case, SANDBOX_FINGERPRINT)
+                for case in adjusted_cases]
+        cached = cache.get_many(keys)
+        for i, key in enumerate(keys):
+            if key in cached:
+                outcomes[i] = cached[key]
+        logging.info(f"Result cache: {len(cached)} hits, {len(adjusted_cases) - len(cached)} to run")
+    pending = [i for i, outcome in enumerate(outcomes) if outcome is _SKIPPED]
+
+    if pending and not (fail_fast and any(outcome not in (None, _SKIPPED) for outcome in outcomes)):
+        with span('execute', cases=len(pending), runner=RUNNER, workers=max_workers):
+            # 部分用例命中缓存时报告不完整，不生成
+            results = _execute_cases([adjusted_cases[i] for i in pending], code, src_dir, max_workers, fail_fast,
+                                     cancel, html_report if len(pending) == len(adjusted_cases) else None, support)
+        for i, exception in zip(pending, results):
+            outcomes[i] = exception
+        if cache is not None:
+            cache.put_many({keys[i]: outcomes[i] for i in pending
+                            if outcomes[i] is not _SKIPPED and not isinstance(outcomes[i], _RunError)})
+
+    failures = []
+    skipped = 0
+    for adjusted_case, exception in zip(adjusted_cases, outcomes):
+        if exception is _SKIPPED:
+            skipped += 1
+        elif exception:
+            failures.append((adjusted_case, exception))
+
+    fresh_errors = _analyze_failures(failures, diagnose=cancel is None or not cancel.is_set())
+    for err in fresh_errors:
+        logging.warning(f"Test failed: {err['abstract']}")
+
+    if skipped:
+        logging.info(f"Skipped {skipped} test cases after first failure")
+    if cache is not None:
+        logging.debug(f"Result cache stats: {cache.stats()}")
     logging.info(f"Found {len(fresh_errors)} fresh errors")
     return fresh_errors
 
 
-def check_regressions(fresh_errors: list[dict], history_path: str) -> list[dict]:
+def check_regressions(fresh_errors: list[dict], history_path: str, error_book: ErrorBook = None) -> list[dict]:
     """
     检查fresh_errors是否为回归（fixed_iter != None）。
     - fresh_errors: 新错误列表。
-    - history_path: 账本路径。
+    - history_path: 账本路径（配置项 paths.error_history，默认 error_history.jsonl；同目录旧版 error_history.json 自动迁移）。
+    - error_book: 调用方已持有的内存账本（IterationState），给出时不再读取 history_path。
     返回: 回归错误列表。
 
     增强: 如果有回归，用 LLM 生成总结报告。
     """
-    logging.info(f"Checking regressions in {history_path}")
-    try:
-        with open(history_path, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-    except FileNotFoundError:
-        logging.warning("History file not found, no regressions")
-        history = []
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error: {e}")
-        history = []
-
-    regressions = [err for err in fresh_errors if
-                   any(h['hash'] == err['hash'] and h.get('fixed_iter') is not None for h in history)]
+    if error_book is not None:
+        regressions = error_book.regressions(fresh_errors)
+    else:
+        logging.info(f"Checking regressions in {history_path}")
+        ledger = ErrorLedger.for_history_path(history_path)
+        if not ledger.exists():
+            logging.warning("History file not found, no regressions")
+        # 账本维护已修复 hash 的集合，每个新错误 O(1) 判定
+        regressions = [err for err in fresh_errors if ledger.is_fixed(err['hash'])]
 
     # LLM 增强: 如果有回归，生成总结
     if regressions:
@@ -184,7 +785,8 @@ def check_regressions(fresh_errors: list[dict], history_path: str) -> list[dict]
 {joined_summary}
 
 Output a brief report (<200 chars) on why they might have regressed."""
-            response = ollama.generate(model=LLM_MODEL, prompt=prompt, options={'temperature': LLM_TEMPERATURE})
+            with get_scheduler().slot(OLLAMA):
+                response = ollama.generate(model=LLM_MODEL, prompt=prompt, options={'temperature': LLM_TEMPERATURE})
             summary = response['response'].strip()
             logging.info(f"LLM regression summary: {summary}")
             # 可以将 summary 添加到 regressions 或日志
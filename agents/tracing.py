@@ -0,0 +1,275 @@
+"""
+轻量级追踪：IterationState.run_iteration 的各阶段计时（生成、预检、沙箱、用例、指纹、诊断、账本写入）
+与 token 用量。每次迭代一棵 span 树，汇总为按阶段的耗时/次数，写入项目的 profile.json，
+可选导出 Prometheus 文本格式（node_exporter textfile collector 可直接采集）。
+
+没有活动的追踪（不在 trace() 内）时 span() 不记录任何东西，开销只有一次 ContextVar 读取。
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+TRACING = get_settings().get('tracing') or {}
+ENABLED = TRACING.get('enabled', True)
+
+_current: contextvars.ContextVar = contextvars.ContextVar('autocode_span', default=None)
+
+
+class Span:
+    """一个计时区间：名字、属性、子区间与本区间内直接记录的 token 用量。"""
+    __slots__ = ('name', 'attrs', 'start', 'duration', 'children', 'tokens', '_lock')
+
+    def __init__(self, name: str, attrs: dict = None, start: float = None):
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.start = time.perf_counter() if start is None else start
+        self.duration: float | None = None
+        self.children: list['Span'] = []
+        self.tokens: dict[str, dict] = {}
+        self._lock = threading.Lock()  # 并发用例 / 候选线程同时挂子区间
+
+    def set(self, **attrs):
+        """追加属性（如 mode、returncode、cases）。"""
+        self.attrs.update(attrs)
+
+    def add_child(self, child: 'Span'):
+        with self._lock:
+            self.children.append(child)
+
+    def add_tokens(self, backend: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        with self._lock:
+            usage = self.tokens.setdefault(backend, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                     'estimated_calls': 0})
+            usage['calls'] += 1
+            usage['prompt_tokens'] += prompt_tokens
+            usage['completion_tokens'] += completion_tokens
+            usage['estimated_calls'] += int(estimated)
+
+    def to_dict(self, origin: float = None) -> dict:
+        """序列化为 {'name', 'start_sec'（相对根区间）, 'duration_sec', 'attrs', 'tokens', 'children'}。"""
+        origin = self.start if origin is None else origin
+        with self._lock:
+            children = list(self.children)
+            tokens = {backend: dict(usage) for backend, usage in self.tokens.items()}
+        node = {'name': self.name, 'start_sec': round(self.start - origin, 6),
+                'duration_sec': None if self.duration is None else round(self.duration, 6)}
+        if self.attrs:
+            node['attrs'] = self.attrs
+        if tokens:
+            node['tokens'] = tokens
+        if children:
+            node['children'] = [child.to_dict(origin) for child in sorted(children, key=lambda c: c.start)]
+        return node
+
+
+class _NullSpan:
+    """没有活动追踪时 span() 返回的占位对象，接口与 Span 相同但什么都不记。"""
+
+    def set(self, **attrs):
+        pass
+
+    def add_tokens(self, *args, **kwargs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """开始一棵新的 span 树（如一次迭代），产出根 Span；tracing.enabled 为 false 时产出占位对象。"""
+    if not ENABLED:
+        yield _NULL_SPAN
+        return
+    root = Span(name, attrs)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        root.duration = time.perf_counter() - root.start
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, parent: Span = None, **attrs):
+    """
+    在当前区间（或 parent）下开一个子区间，with 块内它成为当前区间。
+    异常时记录 attrs['error'] 后照常抛出。没有活动追踪时产出占位对象。
+    """
+    parent = _current.get() if parent is None else parent
+    if parent is None or isinstance(parent, _NullSpan):
+        yield _NULL_SPAN
+        return
+    child = Span(name, attrs)
+    parent.add_child(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        child.duration = time.perf_counter() - child.start
+        _current.reset(token)
+
+
+def record_span(name: str, duration: float, parent: Span = None, **attrs):
+    """补记一个已结束的区间（如沙箱子进程内单个用例的耗时），结束时刻取当前时间。"""
+    parent = _current.get() if parent is None else parent
+    if parent is None or isinstance(parent, _NullSpan):
+        return
+    child = Span(name, attrs, start=time.perf_counter() - duration)
+    child.duration = duration
+    parent.add_child(child)
+
+
+def add_usage(backend: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+    """把一次 LLM 调用的 token 用量记到当前区间（没有活动追踪时忽略）。"""
+    current = _current.get()
+    if current is not None:
+        current.add_tokens(backend, prompt_tokens, completion_tokens, estimated)
+
+
+def bind(fn):
+    """
+    让 fn 在其他线程（线程池任务）中运行时仍挂在当前区间下。
+    返回的包装函数可被多个线程同时调用。
+    """
+    parent = _current.get()
+    if parent is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+
+def summarize(root: Span) -> dict:
+    """
+    汇总整棵树：
+    - stages: {区间名: {'count', 'total_sec'}}，同名区间累加（并发执行的区间之和可超过墙钟）；
+    - tokens: {backend: {'calls', 'prompt_tokens', 'completion_tokens', 'estimated_calls'}}。
+    """
+    stages: dict[str, dict] = {}
+    tokens: dict[str, dict] = {}
+    stack = list(root.children)
+    while stack:
+        node = stack.pop()
+        stage = stages.setdefault(node.name, {'count': 0, 'total_sec': 0.0})
+        stage['count'] += 1
+        stage['total_sec'] += node.duration or 0.0
+        stack.extend(node.children)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for backend, usage in node.tokens.items():
+            total = tokens.setdefault(backend, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                'estimated_calls': 0})
+            for key, value in usage.items():
+                total[key] += value
+        stack.extend(node.children)
+    for stage in stages.values():
+        stage['total_sec'] = round(stage['total_sec'], 6)
+    return {'stages': dict(sorted(stages.items())), 'tokens': tokens}
+
+
+def iteration_profile(root: Span, **fields) -> dict:
+    """一次迭代的剖析记录：fields（iteration、result 等）+ 墙钟耗时 + 汇总 + span 树。"""
+    profile = dict(fields)
+    profile['duration_sec'] = round(root.duration or 0.0, 6)
+    profile.update(summarize(root))
+    profile['spans'] = root.to_dict()
+    return profile
+
+
+def save_profile(path: str, iterations: list[dict]):
+    """整体重写 profile.json（先写临时文件再替换，读取方不会看到半个文件）。"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'iterations': iterations}, f, ensure_ascii=False, indent=2, default=str)  # 属性值不一定可序列化
+    os.replace(tmp_path, path)
+
+
+def _labels(labels: dict) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def prometheus_text(iterations: list[dict], labels: dict = None) -> str:
+    """
+    把一个项目的全部迭代剖析汇总成 Prometheus 文本格式（计数器均为累计值）。
+    - labels: 附加到每个样本的标签，如 {'project': 'project3'}。
+    """
+    labels = labels or {}
+    results: dict[str, int] = {}
+    stages: dict[str, dict] = {}
+    tokens: dict[str, dict] = {}
+    for record in iterations:
+        result = record.get('result', 'unknown')
+        results[result] = results.get(result, 0) + 1
+        for name, stage in record['stages'].items():
+            total = stages.setdefault(name, {'count': 0, 'total_sec': 0.0})
+            total['count'] += stage['count']
+            total['total_sec'] += stage['total_sec']
+        for backend, usage in record['tokens'].items():
+            total = tokens.setdefault(backend, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            for key in total:
+                total[key] += usage.get(key, 0)
+
+    lines = ['# HELP autocode_iterations_total Iterations run, by result.',
+             '# TYPE autocode_iterations_total counter']
+    lines += [f'autocode_iterations_total{_labels(dict(labels, result=result))} {count}'
+              for result, count in sorted(results.items())]
+    lines += ['# HELP autocode_iteration_seconds Wall-clock time of iterations.',
+              '# TYPE autocode_iteration_seconds summary',
+              f'autocode_iteration_seconds_sum{_labels(labels)} {sum(r["duration_sec"] for r in iterations):.6f}',
+              f'autocode_iteration_seconds_count{_labels(labels)} {len(iterations)}',
+              '# HELP autocode_stage_seconds_total Time spent per stage (concurrent spans are summed).',
+              '# TYPE autocode_stage_seconds_total counter']
+    lines += [f'autocode_stage_seconds_total{_labels(dict(labels, stage=name))} {stage["total_sec"]:.6f}'
+              for name, stage in sorted(stages.items())]
+    lines += ['# HELP autocode_stage_calls_total Number of spans per stage.',
+              '# TYPE autocode_stage_calls_total counter']
+    lines += [f'autocode_stage_calls_total{_labels(dict(labels, stage=name))} {stage["count"]}'
+              for name, stage in sorted(stages.items())]
+    lines += ['# HELP autocode_llm_calls_total LLM calls, by backend.',
+              '# TYPE autocode_llm_calls_total counter']
+    lines += [f'autocode_llm_calls_total{_labels(dict(labels, backend=backend))} {usage["calls"]}'
+              for backend, usage in sorted(tokens.items())]
+    lines += ['# HELP autocode_llm_tokens_total LLM tokens, by backend and kind.',
+              '# TYPE autocode_llm_tokens_total counter']
+    for backend, usage in sorted(tokens.items()):
+        for kind in ('prompt', 'completion'):
+            lines.append(f'autocode_llm_tokens_total{_labels(dict(labels, backend=backend, kind=kind))} '
+                         f'{usage[f"{kind}_tokens"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def save_prometheus(path: str, iterations: list[dict], labels: dict = None):
+    """写 Prometheus 文本文件（原子替换，textfile collector 不会读到半个文件）。"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(iterations, labels))
+    os.replace(tmp_path, path)
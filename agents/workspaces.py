@@ -0,0 +1,102 @@
+"""
+沙箱工作区池：可复用的临时目录，默认建在 tmpfs（/dev/shm）上。
+
+每次运行独占一个工作区，用完清空内容放回池中，省去每次 mkdtemp + rmtree；
+多个线程同时取用互不干扰（取出的目录在归还前只属于一个调用方）。
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TMPFS_DIR = '/dev/shm'
+
+
+def default_root(configured: str = None) -> str:
+    """工作区所在目录：配置值优先，其次可写的 /dev/shm，最后是系统临时目录。"""
+    if configured:
+        os.makedirs(configured, exist_ok=True)
+        return configured
+    if os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK | os.X_OK):
+        return TMPFS_DIR
+    return tempfile.gettempdir()
+
+
+def clear_directory(path: str) -> bool:
+    """删除目录下的全部内容（保留目录本身）。返回: 是否已清空。"""
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return False
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+        except OSError:
+            pass
+    try:
+        return not os.listdir(path)
+    except OSError:
+        return False
+
+
+class WorkspacePool:
+    """
+    可复用的工作区目录池。
+    - root: 工作区所在目录（默认见 default_root）。
+    - prefix: 目录名前缀。
+    - max_idle: 最多保留的空闲工作区数，多出来的归还时直接删除。
+    """
+
+    def __init__(self, root: str = None, prefix: str = 'autocode_ws_', max_idle: int = 16):
+        self.root = default_root(root)
+        self.prefix = prefix
+        self.max_idle = max(0, int(max_idle))
+        self._lock = threading.Lock()
+        self._idle: list[str] = []
+        self._created = 0
+        self._closed = False
+
+    def acquire(self) -> str:
+        """取出一个空的工作区（没有空闲的就新建）。"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        return tempfile.mkdtemp(prefix=self.prefix, dir=self.root)
+
+    def release(self, path: str):
+        """清空后放回池中；清不干净、池已满或已关闭时删除。"""
+        if clear_directory(path):
+            with self._lock:
+                if not self._closed and len(self._idle) < self.max_idle:
+                    self._idle.append(path)
+                    return
+        shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def workspace(self):
+        """with 块内独占一个工作区，退出时归还。"""
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'root': self.root, 'created': self._created, 'idle': len(self._idle)}
+
+    def close(self):
+        """删除全部空闲工作区；之后归还的工作区直接删除。"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for path in idle:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,116 @@
+"""
+错误账本基准：旧版整文件 JSON 重写 vs 追加写 JSONL + 哈希索引。
+
+用法: python -m benchmarks.bench_error_ledger --entries 100000 --errors 20
+在已有 N 条历史的账本上模拟一次迭代：追加 errors 条新错误、回填其中一半、对 errors 条新错误做回归检查。
+旧版实现按原 error_book 逻辑内联复现（每条错误 load + indent=4 重写，回归检查为嵌套 any()）。
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from agents.error_ledger import ErrorLedger
+from benchmarks.common import save_results
+
+
+def _entry(i: int, iteration: int = 1) -> dict:
+    return {'hash': f'{i:064x}', 'first_iter': iteration, 'fixed_iter': iteration + 1 if i % 3 == 0 else None,
+            'abstract': f'AssertionError in test case {i}', 'case': f'def test_{i}():\n    assert f({i}) == {i}'}
+
+
+def _legacy_iteration(path: str, new_entries: list[dict], fixes: list[str], fresh: list[dict]):
+    for entry in new_entries:  # append_error
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        history.append(entry)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, ensure_ascii=False, indent=4)
+    for error_hash in fixes:  # backfill_fixed
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        for entry in history:
+            if entry['hash'] == error_hash and entry['fixed_iter'] is None:
+                entry['fixed_iter'] = 3
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(history, f, ensure_ascii=False, indent=4)
+                break
+    with open(path, 'r', encoding='utf-8') as f:  # check_regressions
+        history = json.load(f)
+    return [err for err in fresh if any(h['hash'] == err['hash'] and h.get('fixed_iter') is not None
+                                        for h in history)]
+
+
+def _ledger_iteration(path: str, new_entries: list[dict], fixes: list[str], fresh: list[dict]):
+    ledger = ErrorLedger(path)  # 包含打开时的日志重放
+    ledger.append(new_entries)
+    ledger.mark_fixed_many(fixes, 3)
+    return [err for err in fresh if ledger.is_fixed(err['hash'])]
+
+
+def run(entries: int, errors: int) -> dict:
+    history = [_entry(i) for i in range(entries)]
+    new_entries = [_entry(entries + i, 2) for i in range(errors)]
+    for entry in new_entries:
+        entry['fixed_iter'] = None
+    fixes = [entry['hash'] for entry in new_entries[::2]]
+    # 一半是旧的已修复错误（回归），一半是本次新错误；旧错误取列表尾部，嵌套扫描最坏情况
+    fresh = [{'hash': _entry(entries - 1 - 3 * i)['hash']} for i in range(errors // 2)]
+    fresh += [{'hash': entry['hash']} for entry in new_entries[:errors - len(fresh)]]
+
+    workdir = tempfile.mkdtemp(prefix='bench_ledger_')
+    try:
+        legacy_path = os.path.join(workdir, 'error_history.json')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, ensure_ascii=False, indent=4)
+        start = time.perf_counter()
+        legacy_regressions = _legacy_iteration(legacy_path, new_entries, fixes, fresh)
+        legacy_seconds = time.perf_counter() - start
+
+        ledger_path = os.path.join(workdir, 'error_history.jsonl')
+        ErrorLedger(ledger_path).replace(history)
+        start = time.perf_counter()
+        ledger_regressions = _ledger_iteration(ledger_path, new_entries, fixes, fresh)
+        ledger_seconds = time.perf_counter() - start
+
+        # 打开后的单次操作（常驻进程内账本已加载）
+        ledger = ErrorLedger(ledger_path)
+        start = time.perf_counter()
+        for err in fresh:
+            ledger.is_fixed(err['hash'])
+        lookup_us = (time.perf_counter() - start) / len(fresh) * 1e6
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    assert len(legacy_regressions) == len(ledger_regressions)
+    return {
+        'entries': entries,
+        'errors_per_iteration': errors,
+        'legacy_seconds': legacy_seconds,
+        'ledger_seconds': ledger_seconds,
+        'speedup': legacy_seconds / ledger_seconds,
+        'ledger_lookup_us': lookup_us,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000, help='已有历史条目数')
+    parser.add_argument('--errors', type=int, default=20, help='每次迭代的新错误数')
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/error_ledger.json）')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    result = run(args.entries, args.errors)
+    print(f"{result['entries']} entries, {result['errors_per_iteration']} errors/iteration")
+    print(f"legacy JSON : {result['legacy_seconds']:.3f}s")
+    print(f"JSONL ledger: {result['ledger_seconds']:.3f}s (incl. replay), "
+          f"{result['ledger_lookup_us']:.2f}us per lookup, speedup {result['speedup']:.1f}x")
+    print(f"Saved to {save_results('error_ledger', result, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
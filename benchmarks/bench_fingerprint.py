@@ -0,0 +1,87 @@
+"""
+错误指纹基准：原实现（SHA256(原始栈迹 + ast.dump)）vs 归一化 blake2b 指纹。
+
+用法: python -m benchmarks.bench_fingerprint --tracebacks 5000 --bugs 50
+合成 bugs 个不同的 bug，每个以随机的临时目录、行号、对象地址、消息数值出现多次，共 tracebacks 条。
+统计每条耗时，以及得到的不同指纹数（理想值 = bugs）和聚类数。
+"""
+import argparse
+import ast
+import hashlib
+import random
+import time
+
+from agents.fingerprint import cluster_key, fingerprint
+from benchmarks.common import save_results
+
+_EXC_TYPES = ['ZeroDivisionError', 'IndexError', 'KeyError', 'AssertionError', 'TypeError']
+
+
+def _legacy_fingerprint(error_type: str, stack_trace: str, related_code: str) -> str:
+    """原 compute_error_fingerprint 的哈希部分。"""
+    try:
+        ast_str = ast.dump(ast.parse(related_code), indent=None)
+    except SyntaxError:
+        ast_str = related_code
+    return hashlib.sha256(f"{error_type}:{stack_trace}:{ast_str}".encode('utf-8')).hexdigest()
+
+
+def _synthesize(count: int, bugs: int, seed: int = 0) -> list[tuple[str, str, str]]:
+    rng = random.Random(seed)
+    samples = []
+    for i in range(count):
+        bug = i % bugs
+        exc_type = _EXC_TYPES[bug % len(_EXC_TYPES)]
+        case = f'def test_case_{bug}():\n    assert func_{bug}({bug}, 0) == {bug}'
+        trace = (f'Traceback (most recent call last):\n'
+                 f'  File "case_{rng.randrange(8)}.py", line 2, in test_case_{bug}\n'
+                 f'  File "/tmp/sandbox_{rng.getrandbits(32):08x}/src.py", line {rng.randrange(1, 400)}, in func_{bug}\n'
+                 f'    return helper(obj)\n'
+                 f'  File "/tmp/sandbox_{rng.getrandbits(32):08x}/src.py", line {rng.randrange(1, 400)}, in helper_{bug}\n'
+                 f'    raise {exc_type}(value)\n'
+                 f'{exc_type}: bad value {rng.randrange(1000)} for <Obj at 0x{rng.getrandbits(48):012x}>')
+        samples.append((exc_type, trace, case))
+    return samples
+
+
+def _time(fn, samples) -> tuple[float, set]:
+    start = time.perf_counter()
+    results = {fn(*sample) for sample in samples}
+    return time.perf_counter() - start, results
+
+
+def run(count: int, bugs: int) -> dict:
+    samples = _synthesize(count, bugs)
+    legacy_seconds, legacy_hashes = _time(_legacy_fingerprint, samples)
+    new_seconds, new_hashes = _time(lambda t, trace, case: fingerprint(trace, case, t), samples)
+    cluster_seconds, clusters = _time(lambda t, trace, case: cluster_key(trace), samples)
+    return {
+        'tracebacks': count,
+        'bugs': bugs,
+        'legacy_us_per_trace': legacy_seconds / count * 1e6,
+        'normalized_us_per_trace': new_seconds / count * 1e6,
+        'cluster_us_per_trace': cluster_seconds / count * 1e6,
+        'legacy_distinct': len(legacy_hashes),
+        'normalized_distinct': len(new_hashes),
+        'clusters': len(clusters),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracebacks', type=int, default=5000)
+    parser.add_argument('--bugs', type=int, default=50, help='不同 bug 数')
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/fingerprint.json）')
+    args = parser.parse_args()
+
+    result = run(args.tracebacks, args.bugs)
+    print(f"{result['tracebacks']} tracebacks of {result['bugs']} bugs")
+    print(f"legacy     : {result['legacy_us_per_trace']:8.1f}us/trace, {result['legacy_distinct']} distinct hashes")
+    print(f"normalized : {result['normalized_us_per_trace']:8.1f}us/trace, "
+          f"{result['normalized_distinct']} distinct hashes")
+    print(f"cluster key: {result['cluster_us_per_trace']:8.1f}us/trace, {result['clusters']} clusters")
+    print(f"Saved to {save_results('fingerprint', result, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
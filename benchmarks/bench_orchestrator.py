@@ -0,0 +1,88 @@
+"""
+端到端压测：批量模式（SRS 生成 + IterationState 迭代循环）对接本地 LLM 替身服务的吞吐与尾延迟。
+
+用法: python -m benchmarks.bench_orchestrator --projects 16 --max-projects 4 --latency-ms 400 --tokens-per-sec 60
+替身服务在进程内后台线程运行，通过 AUTOCODE__STANDIN__URL 把云端与 Ollama 客户端都指向它；
+项目建在临时目录，测试结果缓存关闭（每个项目都真实执行沙箱）。默认脚本下每个项目第 2 次迭代通过。
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import percentiles, save_results
+from benchmarks.llm_standin import add_server_arguments, server_from_args
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _redirect_clients(url: str):
+    """必须在导入 agents / core 之前调用：模块级配置与 ollama 默认客户端都在第一次使用时读取。"""
+    os.environ['AUTOCODE__STANDIN__URL'] = url
+    os.environ['AUTOCODE__SANDBOX__RESULT_CACHE__ENABLED'] = 'false'
+    os.environ['AUTOCODE__LLM_CACHE__ENABLED'] = 'false'
+    from agents.settings import reload_settings
+    reload_settings()
+
+
+def run(server, projects: int, max_projects: int, max_iterations: int) -> dict:
+    _redirect_clients(server.url)
+    from core.batch_runner import BatchRunner
+
+    base_dir = tempfile.mkdtemp(prefix='bench_orchestrator_')
+    try:
+        runner = BatchRunner(base_dir=base_dir, template_dir=os.path.join(ROOT_DIR, 'projects', 'project_template'),
+                             summary_path=os.path.join(base_dir, 'summary.json'), max_projects=max_projects,
+                             max_iterations=max_iterations)
+        summary = runner.run([{'id': f'bench{i}', 'requirement': f'实现 add(a, b)，返回两数之和（#{i}）'}
+                              for i in range(projects)])
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    rows = summary['projects']
+    iteration_sec = [sec for row in rows for sec in row['iteration_sec']]
+    return {
+        'projects': projects,
+        'max_projects': max_projects,
+        'wall_sec': summary['wall_sec'],
+        'projects_per_min': projects / summary['wall_sec'] * 60,
+        'counts': summary['counts'],
+        'iterations': sum(row['iterations'] for row in rows),
+        'project_sec': percentiles([row['total_sec'] for row in rows]),
+        'srs_sec': percentiles([row['srs_sec'] for row in rows if row['srs_sec'] is not None]),
+        'iteration_sec': percentiles(iteration_sec),
+        'errors': [row['error'] for row in rows if row['error']],
+        'scheduler': summary['scheduler'],
+        'standin': server.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--projects', type=int, default=16)
+    parser.add_argument('--max-projects', type=int, default=4, help='同时运行的项目数')
+    parser.add_argument('--max-iterations', type=int, default=5)
+    add_server_arguments(parser)
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/orchestrator.json）')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    with server_from_args(args) as server:
+        result = run(server, args.projects, args.max_projects, args.max_iterations)
+    result['standin_config'] = {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+                                'tokens_per_sec': args.tokens_per_sec, 'error_rate': args.error_rate,
+                                'rate_limit_rate': args.rate_limit_rate, 'script': args.script or 'default'}
+    print(f"{result['projects']} projects ({result['max_projects']} concurrent) in {result['wall_sec']:.2f}s: "
+          f"{result['projects_per_min']:.1f} projects/min, {result['counts']}")
+    for key in ('project_sec', 'srs_sec', 'iteration_sec'):
+        row = result[key]
+        if row:
+            print(f"{key:<14} p50 {row['p50']:.3f}s  p95 {row['p95']:.3f}s  p99 {row['p99']:.3f}s  "
+                  f"max {row['max']:.3f}s")
+    print(f"stand-in requests: {result['standin']['requests']}, injected failures: {result['standin']['failures']}")
+    print(f"Saved to {save_results('orchestrator', result, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
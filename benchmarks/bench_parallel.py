@@ -0,0 +1,68 @@
+"""
+run_pytest_cases 并发扩展性基准：1 → N 个 worker 的墙钟时间。
+
+用法: python -m benchmarks.bench_parallel --cases 32 --delay 0.2 --max-workers 16 --runner isolated
+用例以 time.sleep 模拟耗时，LLM 诊断被替换为离线假响应，只测执行引擎本身。
+"""
+import argparse
+import logging
+import os
+import time
+from unittest.mock import patch
+
+from agents import sandbox, tester
+from benchmarks.common import save_results
+
+FAKE_DIAGNOSIS = {'response': '[]'}
+
+
+def _worker_counts(max_workers: int) -> list[int]:
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def run(cases: int, delay: float, max_workers: int, runner: str) -> list[dict]:
+    case_list = [f'def test_case_{i}():\n    time.sleep({delay})\n    assert add(1, 1) == 2'
+                 for i in range(cases)]
+    code = 'import time\n\ndef add(a, b):\n    return a + b'
+    # 预热池需容纳最大并发，必须在第一次使用沙箱之前设置
+    sandbox.POOL_CONFIG['size'] = max(max_workers, sandbox.POOL_CONFIG.get('size', 1))
+    results = []
+    with patch.object(tester, 'RUNNER', runner), \
+            patch('agents.tester.ollama.generate', return_value=FAKE_DIAGNOSIS):
+        tester.run_pytest_cases(case_list[:1], code, None, max_workers=1)  # 预热
+        for workers in _worker_counts(max_workers):
+            start = time.perf_counter()
+            errors = tester.run_pytest_cases(case_list, code, None, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            assert not errors, errors[0]['exception']
+            results.append({'workers': workers, 'cases': cases, 'seconds': elapsed})
+    base = results[0]['seconds']
+    for row in results:
+        row['speedup'] = base / row['seconds']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=32)
+    parser.add_argument('--delay', type=float, default=0.2, help='每个用例 sleep 秒数')
+    parser.add_argument('--max-workers', type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    parser.add_argument('--runner', choices=['batch', 'isolated'], default='isolated')
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/parallel.json）')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = run(args.cases, args.delay, args.max_workers, args.runner)
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    for row in results:
+        print(f"{row['workers']:>8} {row['seconds']:>10.3f} {row['speedup']:>8.2f}")
+    print(f"Saved to {save_results('parallel', {'runner': args.runner, 'rows': results}, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
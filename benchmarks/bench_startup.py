@@ -0,0 +1,108 @@
+"""
+启动耗时基准：全新解释器中 import core.state_machine 的耗时，以及 main.py 到第一次提示输入的耗时。
+
+用法: python -m benchmarks.bench_startup --repeat 5 --top 10
+每次测量都在新的子进程中进行（避免模块缓存），另用 -X importtime 列出自身耗时最多的模块。
+到第一次提示输入的测量把 input 替换为计时后退出，新项目建在临时目录，不调用任何 LLM。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import save_results
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import core.state_machine
+print(time.perf_counter() - start)
+"""
+
+FIRST_PROMPT_SCRIPT = """
+import time
+start = time.perf_counter()
+import builtins, tempfile
+import main
+
+class _Ready(Exception):
+    pass
+
+def _input(prompt=''):
+    print(time.perf_counter() - start)
+    raise _Ready
+
+builtins.input = _input
+main.create_new_project = lambda base_dir, template_dir: tempfile.mkdtemp(prefix='bench_startup_')
+main.setup_logging()
+try:
+    main.main()
+except _Ready:
+    pass
+"""
+
+
+def _run_script(script: str) -> tuple[float, float]:
+    """在新解释器中运行脚本，返回 (脚本打印的进程内耗时, 含解释器启动的墙钟耗时)。"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', script], cwd=ROOT_DIR, capture_output=True, text=True,
+                               check=True)
+    wall = time.perf_counter() - start
+    return float(completed.stdout.strip().splitlines()[-1]), wall
+
+
+def _summary(samples: list[float]) -> dict:
+    return {'min': min(samples), 'median': statistics.median(samples), 'mean': statistics.fmean(samples)}
+
+
+def measure_script(script: str, repeat: int) -> dict:
+    _run_script(script)  # 预热文件系统缓存与 .pyc
+    inner, wall = zip(*(_run_script(script) for _ in range(repeat)))
+    return {'in_process': _summary(list(inner)), 'wall': _summary(list(wall)), 'repeat': repeat}
+
+
+def slowest_imports(top: int) -> list[dict]:
+    """-X importtime 输出中自身耗时（不含子模块）最多的模块。"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import core.state_machine'],
+                               cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        rows.append({'module': name.strip(), 'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+    return sorted(rows, key=lambda row: row['self_ms'], reverse=True)[:top]
+
+
+def run(repeat: int, top: int) -> dict:
+    return {
+        'import_state_machine': measure_script(IMPORT_SCRIPT, repeat),
+        'time_to_first_prompt': measure_script(FIRST_PROMPT_SCRIPT, repeat),
+        'slowest_imports': slowest_imports(top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='列出自身导入耗时最多的前 N 个模块')
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/startup.json）')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.top)
+    print(f"{'measurement':<24} {'in-process ms':>14} {'wall ms':>10}")
+    for key in ('import_state_machine', 'time_to_first_prompt'):
+        row = results[key]
+        print(f"{key:<24} {row['in_process']['median'] * 1000:>14.1f} {row['wall']['median'] * 1000:>10.1f}")
+    print(f"\n{'module':<40} {'self ms':>8} {'cumulative ms':>14}")
+    for row in results['slowest_imports']:
+        print(f"{row['module']:<40} {row['self_ms']:>8.1f} {row['cumulative_ms']:>14.1f}")
+    print(f"Saved to {save_results('startup', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
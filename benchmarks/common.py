@@ -0,0 +1,89 @@
+"""基准测试公共工具：计时、结果保存（JSON）与离线假 LLM。"""
+import importlib
+import json
+import os
+import platform
+import statistics
+import time
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def measure(fn, repeat: int = 5, warmup: int = 1) -> dict:
+    """多次调用 fn 并统计耗时（秒）。"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'repeat': repeat,
+    }
+
+
+def percentiles(samples: list[float], points=(50, 95, 99)) -> dict:
+    """最近秩法百分位，返回 {'p50': ..., 'p95': ..., 'p99': ..., 'max': ...}；无样本时为空 dict。"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {f'p{p}': ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))] for p in points}
+    result['max'] = ordered[-1]
+    return result
+
+
+def save_results(name: str, results, path: str = None) -> str:
+    """保存结果到 benchmarks/results/<name>.json（或指定路径），返回文件路径。"""
+    path = path or os.path.join(RESULTS_DIR, f'{name}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {
+        'benchmark': name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# 直接调用 ollama.generate 的模块（模块属性 ollama 为延迟导入代理，可整体替换）
+OLLAMA_MODULES = ('agents.tester', 'agents.self_repair', 'agents.local_llm_agent', 'agents.async_llm')
+
+
+class FakeOllama:
+    """
+    进程内的 ollama 替身：generate 固定返回 response（可选延迟），记录调用次数，不发起网络请求。
+    - response: 回复文本（诊断提示期望 JSON 数组，默认 '[]' 让调用方走回退摘要）。
+    - latency: 每次调用 sleep 的秒数。
+    """
+
+    def __init__(self, response: str = '[]', latency: float = 0.0):
+        self.response = response
+        self.latency = latency
+        self.calls = 0
+
+    def generate(self, model: str = None, prompt: str = '', options: dict = None, **kwargs) -> dict:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {'response': self.response, 'prompt_eval_count': len(prompt) // 4,
+                'eval_count': len(self.response) // 4}
+
+
+@contextmanager
+def offline_llm(response: str = '[]', latency: float = 0.0):
+    """在 with 块内把所有直接调用 ollama 的模块指向同一个 FakeOllama，产出该实例。"""
+    fake = FakeOllama(response, latency)
+    with ExitStack() as stack:
+        for name in OLLAMA_MODULES:
+            stack.enter_context(patch.object(importlib.import_module(name), 'ollama', fake))
+        yield fake
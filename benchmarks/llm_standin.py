@@ -0,0 +1,381 @@
+"""
+本地 LLM 替身服务：同时实现 OpenAI 兼容的 /v1/chat/completions 与 Ollama 的 /api/generate、/api/chat，
+按脚本返回确定的回复，可配置首 token 延迟、token 吞吐与错误率，用于离线端到端压测。
+
+用法: python -m benchmarks.llm_standin --port 11500 --latency-ms 300 --tokens-per-sec 50 --error-rate 0.02
+然后以 AUTOCODE__STANDIN__URL=http://127.0.0.1:11500 启动 main.py / 批量模式，所有客户端都会改连替身服务。
+
+脚本（--script，YAML 或 JSON）:
+    rules:                         # 按顺序匹配，第一条命中的规则生效
+      - name: code                 # 统计用名字
+        match: '生成完整、可运行的 Python 源码'   # 对提示做 re.search
+        backend: openai            # 可选：只匹配 openai 或 ollama 请求
+        responses: [错误实现, 正确实现]  # 第 N 次命中返回第 N 条，用完后一直返回最后一条
+        latency_ms: 800            # 可选：覆盖全局首 token 延迟
+    default: '[]'                  # 没有规则命中时的回复
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+_SRS = """# SRS: add
+
+## Requirements
+- add(a, b) 返回两个整数之和。
+
+## Functions
+- add(a: int, b: int) -> int
+
+## 验收用例
+```python
+def test_add():
+    assert add(1, 2) == 3
+```
+
+```python
+def test_add_zero():
+    assert add(0, 0) == 0
+```
+
+```python
+def test_add_negative():
+    assert add(-1, -2) == -3
+```
+"""
+
+# 默认脚本：SRS 固定；首轮（错误账本为空）返回错误实现，之后的整文件/增量生成都返回正确实现，
+# 即每个项目第 2 次迭代通过。诊断与修复请求返回让调用方走回退路径的回复。
+DEFAULT_SCRIPT = {
+    'rules': [
+        {'name': 'srs', 'match': '编写完整的 SRS Markdown', 'responses': [_SRS]},
+        {'name': 'code_first', 'match': r'错误账本：\[\]',
+         'responses': ['```python\ndef add(a, b):\n    return a - b\n```']},
+        {'name': 'code_patch', 'match': '只输出修复所需的改动',
+         'responses': ['```python\ndef add(a, b):\n    return a + b\n```']},
+        {'name': 'code', 'match': '生成完整、可运行的 Python 源码',
+         'responses': ['```python\ndef add(a, b):\n    return a + b\n```']},
+        {'name': 'micro_fix', 'match': 'You are a code fixer', 'responses': ['NO_FIX']},
+        {'name': 'diagnosis', 'match': 'Diagnose these', 'responses': ['[]']},
+    ],
+    'default': 'OK',
+}
+
+_TOKEN_RE = re.compile(r'\s*\S{1,4}|\s+')  # 约 4 个字符一个 token，与 estimate_tokens 的量级一致
+
+
+def split_tokens(text: str) -> list[str]:
+    """把回复切成近似 token 的片段（拼接后等于原文）。"""
+    return _TOKEN_RE.findall(text) or ['']
+
+
+def load_script(path: str) -> dict:
+    """读取 YAML / JSON 脚本文件。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+class Script:
+    """
+    脚本化回复：规则按顺序匹配提示，每条规则自带命中计数，第 N 次命中返回 responses[N-1]（用完后重复最后一条）。
+    线程安全；reset() 清空计数。
+    """
+
+    def __init__(self, script: dict = None):
+        script = script or DEFAULT_SCRIPT
+        self.rules = [dict(rule, pattern=re.compile(rule.get('match', ''), re.DOTALL))
+                      for rule in script.get('rules', [])]
+        self.default = script.get('default', '')
+        self._hits: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def respond(self, prompt: str, backend: str) -> tuple[str, str, dict]:
+        """返回 (规则名, 回复文本, 规则)；未命中时规则名为 'default'、规则为空 dict。"""
+        for i, rule in enumerate(self.rules):
+            if rule.get('backend') not in (None, backend) or not rule['pattern'].search(prompt):
+                continue
+            name = rule.get('name') or f'rule{i}'
+            with self._lock:
+                hit = self._hits.get(name, 0)
+                self._hits[name] = hit + 1
+            responses = rule.get('responses') or ['']
+            return name, str(responses[min(hit, len(responses) - 1)]), rule
+        with self._lock:
+            self._hits['default'] = self._hits.get('default', 0) + 1
+        return 'default', str(self.default), {}
+
+    def hits(self) -> dict:
+        with self._lock:
+            return dict(self._hits)
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 非流式回复保持长连接，流式回复用 chunked 编码
+    server: 'StandinServer'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    # ---- 协议入口 ----
+
+    def do_GET(self):
+        if self.path == '/standin/stats':
+            self._send_json(200, self.server.stats())
+        elif self.path in ('/api/tags', '/v1/models'):
+            self._send_json(200, {'models': [], 'data': []})
+        else:
+            self._send_json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': 'invalid JSON body'})
+            return
+        if self.path == '/standin/reset':
+            self.server.reset()
+            self._send_json(200, {'reset': True})
+        elif self.path.endswith('/chat/completions'):
+            prompt = '\n'.join(str(m.get('content', '')) for m in body.get('messages') or [])
+            self._complete('openai', prompt, body, body.get('stream', False))
+        elif self.path == '/api/generate':
+            self._complete('ollama', str(body.get('prompt', '')), body, body.get('stream', True))
+        elif self.path == '/api/chat':
+            prompt = '\n'.join(str(m.get('content', '')) for m in body.get('messages') or [])
+            self._complete('ollama_chat', prompt, body, body.get('stream', True))
+        else:
+            self._send_json(404, {'error': f'unknown path {self.path}'})
+
+    # ---- 回复 ----
+
+    def _complete(self, backend: str, prompt: str, body: dict, stream: bool):
+        server = self.server
+        rule_name, text, rule = server.script.respond(prompt, 'ollama' if backend.startswith('ollama') else backend)
+        failure = server.draw_failure()
+        server.record(backend, rule_name, failure)
+        if failure:
+            status = 429 if failure == 'rate_limited' else 500
+            self.send_response(status)
+            payload = json.dumps({'error': {'message': f'stand-in injected {failure}'}}).encode()
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        time.sleep(server.first_token_delay(rule))
+        tokens = split_tokens(text)
+        usage = {'prompt_tokens': max(1, len(prompt) // 4), 'completion_tokens': len(tokens)}
+        model = body.get('model', 'standin')
+        if not stream:
+            time.sleep(len(tokens) * server.token_interval)
+            self._send_json(200, self._final(backend, model, text, usage))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream' if backend == 'openai' else 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in self._batches(tokens):
+                time.sleep(len(chunk) * server.token_interval)
+                self._write_chunk(self._delta(backend, model, ''.join(chunk)))
+            if backend == 'openai':
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    self._write_chunk('data: ' + json.dumps({'choices': [], 'usage': dict(
+                        usage, total_tokens=usage['prompt_tokens'] + usage['completion_tokens'])}) + '\n\n')
+                self._write_chunk('data: [DONE]\n\n')
+            else:
+                self._write_chunk(json.dumps(self._final(backend, model, '', usage)) + '\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Client closed the stream early (stop condition)")
+            self.close_connection = True
+
+    def _batches(self, tokens: list[str]):
+        """每次写入约 20ms 的 token，避免逐 token 写入的系统调用开销掩盖配置的吞吐。"""
+        size = max(1, int(0.02 / self.server.token_interval)) if self.server.token_interval else len(tokens)
+        for i in range(0, len(tokens), size):
+            yield tokens[i:i + size]
+
+    @staticmethod
+    def _delta(backend: str, model: str, text: str) -> str:
+        if backend == 'openai':
+            return 'data: ' + json.dumps({'model': model, 'choices': [{'index': 0, 'delta': {'content': text}}]},
+                                         ensure_ascii=False) + '\n\n'
+        if backend == 'ollama_chat':
+            return json.dumps({'model': model, 'message': {'role': 'assistant', 'content': text}, 'done': False},
+                              ensure_ascii=False) + '\n'
+        return json.dumps({'model': model, 'response': text, 'done': False}, ensure_ascii=False) + '\n'
+
+    @staticmethod
+    def _final(backend: str, model: str, text: str, usage: dict) -> dict:
+        if backend == 'openai':
+            return {'model': model, 'object': 'chat.completion',
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                                 'finish_reason': 'stop'}],
+                    'usage': dict(usage, total_tokens=usage['prompt_tokens'] + usage['completion_tokens'])}
+        final = {'model': model, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'done': True,
+                 'done_reason': 'stop', 'prompt_eval_count': usage['prompt_tokens'],
+                 'eval_count': usage['completion_tokens']}
+        if backend == 'ollama_chat':
+            final['message'] = {'role': 'assistant', 'content': text}
+        else:
+            final['response'] = text
+        return final
+
+    def _write_chunk(self, text: str):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    替身服务（每个请求一个线程）。
+    - script: 脚本 dict（见模块说明），默认 DEFAULT_SCRIPT。
+    - latency_ms / jitter_ms: 首 token 延迟及其均匀抖动。
+    - tokens_per_sec: 输出吞吐，0 表示不限速。
+    - error_rate / rate_limit_rate: 以该概率返回 500 / 429（Retry-After: 0）。
+    - seed: 随机数种子（抖动与错误注入可复现）。
+    port=0 时自动选择空闲端口，见 url。可用作上下文管理器（后台线程运行，退出时关闭）。
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, script: dict = None, latency_ms: float = 0,
+                 jitter_ms: float = 0, tokens_per_sec: float = 0, error_rate: float = 0,
+                 rate_limit_rate: float = 0, seed: int = 0):
+        super().__init__((host, port), _Handler)
+        self.script = Script(script)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_interval = 1.0 / tokens_per_sec if tokens_per_sec else 0.0
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {'requests': {}, 'failures': {}}
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def first_token_delay(self, rule: dict) -> float:
+        latency = rule.get('latency_ms', self.latency_ms)
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, latency + jitter) / 1000
+
+    def draw_failure(self) -> str | None:
+        """按配置的概率抽取本次请求是否注入错误：None | 'rate_limited' | 'server_error'。"""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 'rate_limited'
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 'server_error'
+        return None
+
+    def record(self, backend: str, rule_name: str, failure: str | None):
+        with self._lock:
+            key = f'{backend}:{rule_name}'
+            self._stats['requests'][key] = self._stats['requests'].get(key, 0) + 1
+            if failure:
+                self._stats['failures'][failure] = self._stats['failures'].get(failure, 0) + 1
+
+    def stats(self) -> dict:
+        """{'requests': {'openai:code': n, ...}, 'failures': {'server_error': n, ...}, 'hits': {规则名: n}}"""
+        with self._lock:
+            stats = {key: dict(value) for key, value in self._stats.items()}
+        stats['hits'] = self.script.hits()
+        return stats
+
+    def reset(self):
+        """清空统计与规则命中计数（脚本重新从第 1 次命中开始）。"""
+        with self._lock:
+            self._stats = {'requests': {}, 'failures': {}}
+        self.script.reset()
+
+    def start(self) -> 'StandinServer':
+        """在后台线程中运行，返回自身。"""
+        self._thread = threading.Thread(target=self.serve_forever, name='llm-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """替身服务的命令行参数（压测基准共用）。"""
+    parser.add_argument('--script', help='回复脚本（YAML / JSON），默认内置脚本：第 2 次迭代通过')
+    parser.add_argument('--latency-ms', type=float, default=0, help='首 token 延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='延迟的均匀抖动（毫秒）')
+    parser.add_argument('--tokens-per-sec', type=float, default=0, help='输出吞吐，0 表示不限速')
+    parser.add_argument('--error-rate', type=float, default=0, help='返回 500 的概率')
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help='返回 429 的概率')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def server_from_args(args, host: str = '127.0.0.1', port: int = 0) -> StandinServer:
+    return StandinServer(host, port, script=load_script(args.script) if args.script else None,
+                         latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tokens_per_sec=args.tokens_per_sec,
+                         error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11500)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = server_from_args(args, args.host, args.port)
+    print(f"LLM stand-in listening on {server.url}")
+    print(f"Point AutoCode at it with: AUTOCODE__STANDIN__URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stats: {json.dumps(server.stats(), ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+离线基准套件：沙箱启动延迟、run_pytest_cases 吞吐、错误账本 append_error / check_regressions、parse_srs。
+
+用法: python -m benchmarks.suite [--quick] [--only sandbox,tester,ledger,srs] [--baseline results/suite.json]
+所有 LLM 调用由 FakeOllama 替代（见 common.offline_llm），不访问网络。
+结果写入 benchmarks/results/suite.json：metrics 为扁平的 {指标名: 中位耗时秒}（越小越好），
+给出 --baseline 时逐项与基线比较，超过 --threshold 的变慢项标为 slower。
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from agents import sandbox, tester
+from agents.error_book import append_error, save_error_history
+from agents.error_ledger import LEDGER_FILE, ErrorLedger
+from benchmarks.common import measure, offline_llm, save_results
+from core.srs_handler import parse_srs
+
+BENCHMARKS = ('sandbox', 'tester', 'ledger', 'srs')
+
+FULL = {'repeat': 5, 'case_counts': [1, 8, 32, 128], 'ledger_sizes': [1000, 10000, 100000], 'srs_mb': [1, 4]}
+QUICK = {'repeat': 3, 'case_counts': [1, 8, 32], 'ledger_sizes': [1000, 10000], 'srs_mb': [1]}
+
+APPENDS_PER_SAMPLE = 20  # append_error 单次太快，每个样本连续追加多条再取平均
+
+
+def bench_sandbox(repeat: int) -> dict:
+    """run_in_sandbox 执行一行代码的往返延迟：预热池 fork 与逐次启动解释器。"""
+    code = "print('ok')"
+    results = {}
+    if sandbox.pool_enabled():
+        sandbox.run_in_sandbox(code)  # 创建并预热池
+        results['pooled'] = measure(lambda: sandbox.run_in_sandbox(code), repeat=repeat)
+    with patch.dict(sandbox.POOL_CONFIG, {'enabled': False}):
+        results['cold'] = measure(lambda: sandbox.run_in_sandbox(code), repeat=repeat)
+    return results
+
+
+def bench_tester(repeat: int, case_counts: list[int]) -> dict:
+    """run_pytest_cases 随用例数增长的耗时与吞吐（每 10 个用例 1 个失败，走诊断路径；不用结果缓存）。"""
+    code = 'def add(a, b):\n    return a + b'
+    results = {}
+    with patch.object(tester, 'get_result_cache', return_value=None):
+        for count in case_counts:
+            cases = [f'def test_add_{i}():\n    assert add({i}, 1) == {0 if i % 10 == 9 else i + 1}'
+                     for i in range(count)]
+            stats = measure(lambda: tester.run_pytest_cases(cases, code, None), repeat=repeat)
+            stats['cases_per_sec'] = count / stats['median']
+            results[str(count)] = stats
+    return {'runner': tester.RUNNER, 'max_workers': tester.MAX_WORKERS, 'cases': results}
+
+
+def _ledger_entry(i: int) -> dict:
+    return {'hash': f'{i:064x}', 'first_iter': 1, 'fixed_iter': 2 if i % 3 == 0 else None,
+            'abstract': f'AssertionError in test case {i}', 'case': f'def test_{i}():\n    assert f({i}) == {i}'}
+
+
+def bench_ledger(repeat: int, sizes: list[int]) -> dict:
+    """N 条历史的账本上：冷打开（日志重放）、append_error 单条追加、check_regressions 20 个新错误。"""
+    results = {}
+    for size in sizes:
+        project_dir = tempfile.mkdtemp(prefix='bench_suite_ledger_')
+        try:
+            save_error_history(project_dir, [_ledger_entry(i) for i in range(size)])
+            ledger_path = os.path.join(project_dir, LEDGER_FILE)
+            counter = iter(range(size, size + (repeat + 1) * APPENDS_PER_SAMPLE))
+
+            def append_batch():
+                for _ in range(APPENDS_PER_SAMPLE):
+                    i = next(counter)
+                    append_error(project_dir, f'{i:064x}', 3, f'AssertionError in test case {i}',
+                                 f'def test_{i}(): pass')
+
+            # 一半是已修复的旧错误（回归），一半是账本里没有的新错误
+            fresh = [{'hash': f'{i:064x}', 'abstract': f'AssertionError in test case {i}'}
+                     for i in range(0, 30, 3)]
+            fresh += [{'hash': f'{size * 2 + i:064x}', 'abstract': 'new'} for i in range(10)]
+
+            append_stats = measure(append_batch, repeat=repeat)
+            results[str(size)] = {
+                'open': measure(lambda: ErrorLedger(ledger_path), repeat=repeat),
+                'append_error': {key: value / APPENDS_PER_SAMPLE if key != 'repeat' else value
+                                 for key, value in append_stats.items()},
+                'check_regressions': measure(lambda: tester.check_regressions(fresh, ledger_path), repeat=repeat),
+            }
+        finally:
+            shutil.rmtree(project_dir, ignore_errors=True)
+    return results
+
+
+def _make_srs(size_bytes: int) -> str:
+    """生成约 size_bytes 大小的 SRS：需求与函数说明各占一段，其余是验收用例代码块。"""
+    parts = ['# SRS\n\n## Requirements\n']
+    parts += [f'- REQ-{i}: add(a, b) must return the sum for input pair {i}.\n' for i in range(2000)]
+    parts.append('\n## Functions\n')
+    parts += [f'- helper_{i}(x: int) -> int\n' for i in range(2000)]
+    parts.append('\n## Test Cases\n')
+    size, i = sum(len(part) for part in parts), 0
+    while size < size_bytes:
+        block = f'```python\ndef test_add_{i}():\n    assert add({i}, 1) == {i + 1}\n```\n\n'
+        parts.append(block)
+        size += len(block)
+        i += 1
+    return ''.join(parts)
+
+
+def bench_srs(repeat: int, sizes_mb: list[int]) -> dict:
+    """parse_srs 解析多 MB SRS 的耗时。"""
+    results = {}
+    for size_mb in sizes_mb:
+        content = _make_srs(size_mb * 1024 * 1024)
+        stats = measure(lambda: parse_srs(content), repeat=repeat)
+        stats['test_cases'] = len(parse_srs(content)['test_cases'])
+        results[f'{size_mb}MB'] = stats
+    return results
+
+
+def flatten_metrics(results: dict) -> dict:
+    """把各基准的结果展开为 {'ledger.10000.append_error': 中位秒数, ...}，用于与基线比较。"""
+    metrics = {}
+
+    def walk(prefix: str, node):
+        if isinstance(node, dict):
+            if 'median' in node:
+                metrics[prefix] = node['median']
+                return
+            for key, value in node.items():
+                walk(f'{prefix}.{key}' if prefix else key, value)
+
+    walk('', results)
+    return metrics
+
+
+def compare(metrics: dict, baseline: dict, threshold: float = 0.2) -> list[dict]:
+    """
+    逐项与基线比较。
+    - threshold: 相对变化超过该比例才算变化（0.2 表示慢 20% 以上为 slower，快到 1/1.2 以下为 faster）。
+    返回: [{'metric', 'baseline', 'current', 'ratio', 'status'}]，status 为 slower | faster | unchanged | new。
+    """
+    rows = []
+    for name, current in metrics.items():
+        base = baseline.get(name)
+        if not base:
+            rows.append({'metric': name, 'baseline': None, 'current': current, 'ratio': None, 'status': 'new'})
+            continue
+        ratio = current / base
+        if ratio > 1 + threshold:
+            status = 'slower'
+        elif ratio < 1 / (1 + threshold):
+            status = 'faster'
+        else:
+            status = 'unchanged'
+        rows.append({'metric': name, 'baseline': base, 'current': current, 'ratio': ratio, 'status': status})
+    return rows
+
+
+def load_baseline(path: str) -> dict:
+    """读取之前保存的 suite 结果 JSON，返回其 metrics。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['results']['metrics']
+
+
+def run(only=BENCHMARKS, quick: bool = False) -> dict:
+    params = QUICK if quick else FULL
+    repeat = params['repeat']
+    results = {}
+    with offline_llm():
+        if 'sandbox' in only:
+            results['sandbox'] = bench_sandbox(repeat)
+        if 'tester' in only:
+            results['tester'] = bench_tester(repeat, params['case_counts'])
+        if 'ledger' in only:
+            results['ledger'] = bench_ledger(repeat, params['ledger_sizes'])
+        if 'srs' in only:
+            results['srs'] = bench_srs(repeat, params['srs_mb'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='更少的重复次数和更小的规模')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help=f"逗号分隔，可选 {','.join(BENCHMARKS)}")
+    parser.add_argument('--baseline', help='用于比较的基线结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='相对变化阈值')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有 slower 项时以退出码 1 结束')
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/suite.json）')
+    args = parser.parse_args()
+    only = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    logging.disable(logging.ERROR)  # 回归检查会按 ERROR 级别记录基准构造的回归
+
+    results = run(only, args.quick)
+    metrics = flatten_metrics(results)
+    payload = {'quick': args.quick, 'benchmarks': results, 'metrics': metrics}
+    comparison = None
+    if args.baseline:
+        comparison = compare(metrics, load_baseline(args.baseline), args.threshold)
+        payload['baseline'] = os.path.abspath(args.baseline)
+        payload['comparison'] = comparison
+
+    print(f"{'metric':<42} {'median ms':>10} {'baseline':>10} {'ratio':>7}  status")
+    for row in comparison or [{'metric': name, 'current': value} for name, value in metrics.items()]:
+        base = f"{row['baseline'] * 1000:>10.3f}" if row.get('baseline') else f"{'-':>10}"
+        ratio = f"{row['ratio']:>7.2f}" if row.get('ratio') else f"{'-':>7}"
+        print(f"{row['metric']:<42} {row['current'] * 1000:>10.3f} {base} {ratio}  {row.get('status', '')}")
+    print(f"Saved to {save_results('suite', payload, args.output)}")
+    if args.fail_on_regression and comparison and any(row['status'] == 'slower' for row in comparison):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
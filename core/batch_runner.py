@@ -0,0 +1,162 @@
+import os
+import json
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from agents.scheduler import get_scheduler
+from agents.settings import get_settings
+from core.project import create_new_project
+from core.srs_handler import SRSHandler
+from core.state_machine import IterationState, State
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(ROOT_DIR, 'config', 'config.yaml')
+
+
+def load_requirements(path: str) -> list[dict]:
+    """
+    读取 JSONL 需求文件，每行一个 JSON 对象。
+    - 需求文本取 requirement / body / text 字段（有 title 时拼在前面）。
+    - 编号取 id / request_id 字段，缺省为 req<行号>。
+    返回: [{'id': str, 'requirement': str}, ...]，空行和无法解析的行跳过。
+    """
+    requirements = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed line {line_no} in {path}: {e}")
+                continue
+            if isinstance(item, str):
+                item = {'requirement': item}
+            text = item.get('requirement') or item.get('body') or item.get('text') or ''
+            if item.get('title'):
+                text = f"{item['title']}\n{text}".strip()
+            if not text:
+                logger.warning(f"Skipping line {line_no} in {path}: no requirement text")
+                continue
+            requirements.append({'id': str(item.get('id') or item.get('request_id') or f'req{line_no}'),
+                                 'requirement': text})
+    logger.info(f"Loaded {len(requirements)} requirements from {path}")
+    return requirements
+
+
+class BatchRunner:
+    """
+    无交互批量模式：每条需求新建一个项目，自动生成 SRS（不经人工审阅），再跑迭代循环。
+    - base_dir / template_dir: 项目目录与模板目录。
+    - max_projects: 同时运行的项目数。云端 LLM、Ollama、沙箱的并发由全局 CapacityScheduler 另行限制。
+    - max_iterations: 每个项目的最大迭代次数。
+    - summary_path: 汇总 JSON 路径，每完成一个项目就重写一次（中途中断也保留已完成的结果）。
+    """
+
+    def __init__(self, base_dir: str, template_dir: str, summary_path: str,
+                 max_projects: int = 4, max_iterations: int = 10, config_path: str = CONFIG_PATH):
+        self.base_dir = base_dir
+        self.template_dir = template_dir
+        self.summary_path = summary_path
+        self.max_projects = max(1, int(max_projects))
+        self.max_iterations = max(1, int(max_iterations))
+        self.config_path = config_path
+        self._results: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def run_project(self, item: dict) -> dict:
+        """跑完一条需求，返回该项目的结果与各阶段耗时。异常不向外抛出，记为 ERROR。"""
+        result = {'id': item['id'], 'project_dir': None, 'status': 'ERROR', 'iterations': 0,
+                  'srs_sec': None, 'iteration_sec': [], 'total_sec': None, 'error': None}
+        start = time.perf_counter()
+        try:
+            project_dir = create_new_project(self.base_dir, self.template_dir)
+            result['project_dir'] = project_dir
+
+            srs_start = time.perf_counter()
+            SRSHandler(self.config_path).generate_initial_srs(item['requirement'], project_dir)
+            result['srs_sec'] = time.perf_counter() - srs_start
+
+            state = IterationState(project_dir)
+            state.transition_to_coding()
+            for _ in range(self.max_iterations):
+                iteration_start = time.perf_counter()
+                passed = state.run_iteration()
+                result['iteration_sec'].append(time.perf_counter() - iteration_start)
+                if passed:
+                    break
+            if state.state != State.PASS:
+                state.state = State.FAILED
+            result['status'] = state.state.value
+            result['iterations'] = state.iteration
+        except Exception as e:
+            logger.error(f"Project {item['id']} failed: {e}")
+            result['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            logger.debug(traceback.format_exc())
+        result['total_sec'] = time.perf_counter() - start
+        logger.info(f"Project {item['id']}: {result['status']} after {result['iterations']} iterations "
+                    f"({result['total_sec']:.1f}s)")
+        return result
+
+    def _write_summary(self, requirements: list[dict], started: float, finished: bool):
+        with self._lock:
+            projects = [self._results[item['id']] for item in requirements if item['id'] in self._results]
+            counts = {}
+            for project in projects:
+                counts[project['status']] = counts.get(project['status'], 0) + 1
+            summary = {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+                'finished': finished,
+                'wall_sec': time.time() - started,
+                'total': len(requirements),
+                'completed': len(projects),
+                'counts': counts,
+                'scheduler': get_scheduler().stats(),
+                'projects': projects,
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.summary_path)), exist_ok=True)
+            tmp_path = self.summary_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.summary_path)
+        return summary
+
+    def run(self, requirements: list[dict]) -> dict:
+        """并发跑所有需求，返回汇总（同时写入 summary_path）。"""
+        started = time.time()
+        ids = [item['id'] for item in requirements]
+        if len(set(ids)) != len(ids):  # 编号重复时加序号区分
+            requirements = [dict(item, id=f"{item['id']}#{i}") for i, item in enumerate(requirements)]
+        logger.info(f"Batch: {len(requirements)} requirements, {self.max_projects} concurrent projects")
+        with ThreadPoolExecutor(max_workers=self.max_projects, thread_name_prefix='project') as executor:
+            futures = {executor.submit(self.run_project, item): item for item in requirements}
+            for future in as_completed(futures):
+                with self._lock:
+                    self._results[futures[future]['id']] = future.result()
+                self._write_summary(requirements, started, finished=False)
+        summary = self._write_summary(requirements, started, finished=True)
+        logger.info(f"Batch finished: {summary['counts']}, summary written to {self.summary_path}")
+        return summary
+
+
+def run_batch(requirements_path: str, summary_path: str = None, max_projects: int = None,
+              max_iterations: int = None) -> dict:
+    """按 config.yaml 的 batch 段运行批量模式（参数覆盖配置）。"""
+    config = get_settings(CONFIG_PATH)
+    batch_config = config.get('batch') or {}
+    base_dir = os.path.join(ROOT_DIR, 'projects')
+    if summary_path is None:
+        summary_path = os.path.join(base_dir, f"batch_summary_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    runner = BatchRunner(
+        base_dir=base_dir,
+        template_dir=os.path.join(base_dir, 'project_template'),
+        summary_path=summary_path,
+        max_projects=max_projects or batch_config.get('max_projects', 4),
+        max_iterations=max_iterations or config['agent'].get('max_iterations', 10),
+    )
+    return runner.run(load_requirements(requirements_path))
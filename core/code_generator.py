@@ -1,23 +1,197 @@
 from .utils import LLMClient
-import yaml
+from .patching import PatchError, apply_patch_response
+from agents.preflight import strip_code_fences  # 与预检相同的围栏处理（增量生成的基准源码）
+from agents.llm_cache import LLMResponseCache
+from agents.settings import get_settings
+from agents.prompt_builder import (CLOUD_BUDGET_TOKENS, LEDGER_BUDGET_TOKENS, PromptBuilder, compact_error_book,
+                                   truncate_to_tokens)
 import json
 import os
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+_LEADING_SPACE = re.compile(r'\s*')
+
+
+def code_block_complete(text: str) -> bool:
+    """
+    回复以 ``` 代码块开头且代码块已闭合时返回 True，用作流式生成的提前停止条件。
+    每收到一段增量都会对累计全文调用一次，因此只用带起始位置的 find，不复制文本。
+    """
+    start = _LEADING_SPACE.match(text).end()
+    if not text.startswith('```', start):
+        return False
+    first_newline = text.find('\n', start)
+    return first_newline != -1 and text.find('\n```', first_newline) != -1
+
 
 class CodeGenerator:
-    def __init__(self, config_path='config/config.yaml'):
-        self.config = yaml.safe_load(open(config_path))
-        self.llm = LLMClient(self.config['cloud_llm'])
+    def __init__(self, config_path=None):
+        self.config = get_settings(config_path)  # 缓存的配置，多次构造不再重复解析
+        self.llm = LLMClient(self.config['cloud_llm'], cache=LLMResponseCache.from_config(self.config.get('llm_cache')))
+        generation = self.config.get('code_generation') or {}
+        self.incremental = generation.get('incremental', False)  # 有上一版源码和失败用例时只请求改动
+        self.patch_max_tokens = generation.get('patch_max_tokens', 2048)
+        self.full_max_tokens = generation.get('full_max_tokens', 4096)
+        self.last_mode = None  # 最近一次生成方式：full | diff | functions（供日志与统计）
+        prompt_config = self.config.get('prompt') or {}
+        self.prompt_budget = prompt_config.get('cloud_budget_tokens', CLOUD_BUDGET_TOKENS)
+        self.ledger_budget = prompt_config.get('ledger_budget_tokens', LEDGER_BUDGET_TOKENS)
+        self.last_prompt_report = None  # 最近一次提示各段的 token 数（PromptBuilder.report）
+
+    def _temperature(self, is_regression: bool) -> float:
+        if is_regression:
+            return self.config['cloud_llm']['temperature_regression']
+        return self.config['cloud_llm']['temperature_code']
+
+    def generate_code(self, srs_content: str, error_book: list, project_dir: str, is_regression=False,
+                      on_token=None, current_code: str = None, failing_errors: list = None,
+                      regression_hashes=()) -> str:  # MODIFIED: 添加 project_dir 参数
+        """
+        生成源码并写入 src/src.py。
+        - error_book: 错误账本条目，按 hash 去重压缩后放入提示（见 compact_error_book）。
+        - regression_hashes: 本轮复发的错误 hash，在账本中完整保留并标为 regressed。
+        - current_code / failing_errors: 上一版源码及其失败用例（[{'case', 'exception'}, ...]）。
+          开启 code_generation.incremental 且两者都有时走增量模式：模型只返回 diff 或整函数替换，
+          本地应用并用 ast 校验，失败则自动退回整文件生成。
+        on_token 可用于回显。
+        """
+        if self.incremental and current_code and failing_errors:
+            base = strip_code_fences(current_code)
+            code = self._generate_patch(srs_content, base, failing_errors, is_regression, on_token)
+            if code is not None:
+                self._write_source(project_dir, code)
+                return code
+        self.last_mode = 'full'
+        return self._generate_full(srs_content, error_book, project_dir, is_regression, on_token, regression_hashes)
+
+    @staticmethod
+    def _add_srs(builder: PromptBuilder, srs_content: str):
+        """SRS 最后才压缩，且保留首尾（接口签名在前、验收用例在后）。"""
+        builder.add(f"读取 SRS 全文：{srs_content}", name='srs', priority=2,
+                    shrink=lambda n: f"读取 SRS 全文：{truncate_to_tokens(srs_content, n - 8, keep='middle')}")
+
+    def _build_prompt(self, builder: PromptBuilder) -> str:
+        prompt = builder.build()
+        self.last_prompt_report = builder.report
+        logger.info(f"Prompt: {builder.report['tokens']} tokens (budget {builder.report['budget']}), "
+                    f"sections {builder.report['sections']}")
+        return prompt
+
+    def _full_prompt(self, srs_content: str, error_book: list, is_regression: bool, regression_hashes=(),
+                     hint: str = '') -> str:
+        def ledger(max_tokens):
+            compacted = compact_error_book(error_book or [], max_tokens, regression_hashes)
+            return f"错误账本：{json.dumps(compacted, ensure_ascii=False)}"
 
-    def generate_code(self, srs_content: str, error_book: dict, project_dir: str, is_regression=False) -> str:  # MODIFIED: 添加 project_dir 参数
-        prompt = f"读取 SRS 全文：{srs_content}\n错误账本：{json.dumps(error_book, ensure_ascii=False)}\n生成完整、可运行的 Python 源码文件（单一文件，如 src.py），严格遵守 SRS 中的接口和功能。不含任何解释或注释。"
+        builder = PromptBuilder(self.prompt_budget)
+        self._add_srs(builder, srs_content)
+        builder.add(ledger(self.ledger_budget), name='error_book', priority=1, shrink=lambda n: ledger(n - 8))
+        instruction = "生成完整、可运行的 Python 源码文件（单一文件，如 src.py），严格遵守 SRS 中的接口和功能。不含任何解释或注释。"
         if is_regression:
-            prompt += "\n强调：不得再次引入已修复的错误。"
-            temperature = self.config['cloud_llm']['temperature_regression']
-        else:
-            temperature = self.config['cloud_llm']['temperature_code']
-        code = self.llm.generate(prompt, temperature)
+            instruction += "\n强调：不得再次引入已修复的错误。"
+        if hint:
+            instruction += f"\n{hint}"
+        builder.add(instruction, name='instruction')
+        return self._build_prompt(builder)
+
+    def _generate_full(self, srs_content: str, error_book: list, project_dir: str, is_regression: bool,
+                       on_token=None, regression_hashes=()) -> str:
+        """整文件生成；流式模式下边接收边写入，代码块闭合即停止。"""
+        prompt = self._full_prompt(srs_content, error_book, is_regression, regression_hashes)
+        temperature = self._temperature(is_regression)
         src_path = os.path.join(project_dir, 'src', 'src.py')  # MODIFIED: 使用动态路径
         os.makedirs(os.path.dirname(src_path), exist_ok=True)  # NEW: 自动创建 src/ 目录
+        with open(src_path, 'w', encoding='utf-8') as f:
+            def write_token(delta: str):
+                f.write(delta)
+                f.flush()
+                if on_token:
+                    on_token(delta)
+            code = self.llm.generate(prompt, temperature, max_tokens=self.full_max_tokens, on_token=write_token,
+                                     stop=code_block_complete)
+        return code
+
+    def _patch_prompt(self, srs_content: str, current_code: str, failing_errors: list, is_regression: bool,
+                      hint: str = '') -> str:
+        numbered = '\n'.join(f"{i:4d} | {line}" for i, line in enumerate(current_code.splitlines(), 1))
+
+        def failures(max_tokens):
+            share = max(32, max_tokens // len(failing_errors))  # 每条失败平分，栈迹保留末尾
+            return "以下测试用例失败：\n" + '\n\n'.join(
+                f"用例：\n{err['case']}\n错误：\n{truncate_to_tokens(err['exception'], share, keep='tail')}"
+                for err in failing_errors)
+
+        builder = PromptBuilder(self.prompt_budget)
+        self._add_srs(builder, srs_content)
+        builder.add(f"当前 src.py（行号仅供定位，不属于代码）：\n{numbered}", name='source')
+        builder.add(failures(self.ledger_budget), name='failures', priority=1, shrink=failures)
+        instruction = ("只输出修复所需的改动，不要输出整个文件。二选一：\n"
+                       "1. 一个 ```diff 代码块，内容为针对 src.py 的 unified diff（带 @@ 行号头和至少 2 行上下文）；\n"
+                       "2. 一个或多个 ```python 代码块，每块是需要整体替换（或新增）的完整顶层函数/类，以及新增的 import。\n"
+                       "不含任何解释。")
+        if is_regression:
+            instruction += "\n强调：不得再次引入已修复的错误。"
+        if hint:
+            instruction += f"\n{hint}"
+        builder.add(instruction, name='instruction')
+        return self._build_prompt(builder)
+
+    def _request_patch(self, prompt: str, current_code: str, temperature: float, on_token=None,
+                       stop=None) -> tuple[str, str] | None:
+        """请求并应用增量补丁，返回 (完整源码, 'diff' | 'functions')；无法应用或校验失败时返回 None。"""
+        try:
+            response = self.llm.generate(prompt, temperature, max_tokens=self.patch_max_tokens,
+                                         on_token=on_token, stop=stop)
+            code, kind = apply_patch_response(current_code, response)
+        except PatchError as e:
+            logger.warning(f"Incremental patch rejected ({e}), falling back to full regeneration")
+            return None
+        except Exception as e:
+            logger.error(f"Incremental generation failed ({e}), falling back to full regeneration")
+            return None
+        logger.info(f"Applied incremental {kind} patch ({len(response)} chars instead of a full file)")
+        return code, kind
+
+    def _generate_patch(self, srs_content: str, current_code: str, failing_errors: list, is_regression: bool,
+                        on_token=None) -> str | None:
+        """增量生成：返回打好补丁的完整源码；补丁无法应用或校验失败时返回 None。"""
+        prompt = self._patch_prompt(srs_content, current_code, failing_errors, is_regression)
+        patched = self._request_patch(prompt, current_code, self._temperature(is_regression), on_token)
+        if patched is None:
+            return None
+        code, self.last_mode = patched
+        return code
+
+    def generate_candidate(self, srs_content: str, error_book: list, temperature: float, hint: str = '',
+                           cancel: threading.Event = None, is_regression=False, current_code: str = None,
+                           failing_errors: list = None, regression_hashes=()) -> tuple[str, str]:
+        """
+        推测式生成的单个候选：与 generate_code 相同的增量/整文件逻辑，但不写 src/src.py，可并发调用。
+        - temperature / hint: 本候选的 temperature 与追加到指令末尾的侧重提示。
+        - cancel: 置位后中止流式请求（返回的代码不完整，调用方应丢弃）。
+        返回: (源码, 'full' | 'diff' | 'functions')。
+        """
+        def stop(text: str) -> bool:
+            return cancel is not None and cancel.is_set()
+
+        if self.incremental and current_code and failing_errors:
+            base = strip_code_fences(current_code)
+            prompt = self._patch_prompt(srs_content, base, failing_errors, is_regression, hint)
+            patched = self._request_patch(prompt, base, temperature, stop=stop)
+            if patched is not None:
+                return patched
+        prompt = self._full_prompt(srs_content, error_book, is_regression, regression_hashes, hint)
+        code = self.llm.generate(prompt, temperature, max_tokens=self.full_max_tokens,
+                                 stop=lambda text: stop(text) or code_block_complete(text))
+        return code, 'full'
+
+    @staticmethod
+    def _write_source(project_dir: str, code: str):
+        src_path = os.path.join(project_dir, 'src', 'src.py')
+        os.makedirs(os.path.dirname(src_path), exist_ok=True)
         with open(src_path, 'w', encoding='utf-8') as f:
             f.write(code)
-        return code
\ No newline at end of file
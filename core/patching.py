@@ -0,0 +1,203 @@
+"""
+增量代码生成的补丁应用：模型只返回改动（unified diff 或整函数/整类替换），在本地应用并用 ast 校验。
+任何一步失败都抛出 PatchError，由调用方退回整文件重新生成。
+"""
+import ast
+import re
+
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_FENCE_RE = re.compile(r'```([\w+-]*)[^\n]*\n(.*?)```', re.DOTALL)
+_HUNK_RE = re.compile(r'^@@\s*(?:-(\d+)(?:,\d+)?\s+\+\d+(?:,\d+)?)?\s*@@')
+
+
+class PatchError(Exception):
+    """补丁无法干净地应用，或应用后的代码未通过校验。"""
+
+
+# ---- unified diff ----
+
+def _parse_hunks(diff: str) -> list[tuple[int | None, list[tuple[str, str]]]]:
+    hunks = []
+    current = None
+    for line in diff.splitlines():
+        header = _HUNK_RE.match(line)
+        if header:
+            current = (int(header.group(1)) - 1 if header.group(1) else None, [])
+            hunks.append(current)
+        elif current is None or line.startswith(('--- ', '+++ ', 'diff ', 'index ')):
+            continue
+        elif line.startswith('\\'):  # "\ No newline at end of file"
+            continue
+        elif line == '':
+            current[1].append((' ', ''))  # 模型常丢掉空上下文行前的空格
+        elif line[0] in ' +-':
+            current[1].append((line[0], line[1:]))
+        else:
+            raise PatchError(f"Unexpected line in diff hunk: {line[:60]!r}")
+    if not hunks:
+        raise PatchError("No hunks found in diff")
+    return hunks
+
+
+def _find_block(lines: list[str], block: list[str], hint: int | None) -> int:
+    """在 lines 中找 block（忽略行尾空白），多处匹配时取离 hint 最近的；无 hint 时要求唯一。"""
+    if not block:
+        if hint is None:
+            raise PatchError("Pure insertion hunk without line numbers")
+        return max(0, min(hint, len(lines)))
+    target = [line.rstrip() for line in block]
+    stripped = [line.rstrip() for line in lines]
+    matches = [i for i in range(len(lines) - len(block) + 1) if stripped[i:i + len(block)] == target]
+    if not matches:
+        raise PatchError(f"Hunk context not found: {block[0][:60]!r}")
+    if hint is None:
+        if len(matches) > 1:
+            raise PatchError(f"Ambiguous hunk context: {block[0][:60]!r}")
+        return matches[0]
+    return min(matches, key=lambda i: abs(i - hint))
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """
+    应用 unified diff。按上下文定位每个 hunk（行号只作提示，允许偏移），上下文对不上时抛 PatchError。
+    - source: 原代码。
+    - diff: diff 文本（可含 ---/+++ 头）。
+    返回: 应用后的代码。
+    """
+    lines = source.splitlines()
+    delta = 0
+    for old_start, body in _parse_hunks(diff):
+        old = [text for op, text in body if op in ' -']
+        new = [text for op, text in body if op in ' +']
+        hint = None if old_start is None else old_start + delta
+        position = _find_block(lines, old, hint)
+        lines[position:position + len(old)] = new
+        if old_start is not None:
+            delta = position - old_start + len(new) - len(old)
+    return '\n'.join(lines) + '\n'
+
+
+# ---- 函数级替换 ----
+
+def _node_start(node: ast.AST) -> int:
+    decorators = getattr(node, 'decorator_list', [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _top_level_index(tree: ast.Module) -> dict[str, tuple[int, int]]:
+    """顶层函数/类/单目标赋值的名字 -> (起始行, 结束行)，1 起始、闭区间。"""
+    index = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            index[node.name] = (_node_start(node), node.end_lineno)
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            index[node.targets[0].id] = (node.lineno, node.end_lineno)
+    return index
+
+
+def _defined_names(tree: ast.Module) -> set[str]:
+    names = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Assign):
+            names.update(t.id for t in node.targets if isinstance(t, ast.Name))
+    return names
+
+
+def apply_function_replacements(source: str, blocks: list[str]) -> str:
+    """
+    用代码块中的顶层定义替换 source 中的同名函数/类/常量；新名字追加到末尾，缺少的 import 补到导入区。
+    - blocks: 每个元素是一段可独立解析的 Python 代码。
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise PatchError(f"Current source does not parse: {e}")
+    index = _top_level_index(tree)
+    lines = source.splitlines()
+    existing_imports = {ast.dump(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))}
+    import_end = max([node.end_lineno for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))],
+                     default=0)
+
+    replacements: dict[tuple[int, int], list[str]] = {}
+    imports, appended = [], []
+    for block in blocks:
+        try:
+            block_tree = ast.parse(block)
+        except SyntaxError as e:
+            raise PatchError(f"Replacement block does not parse: {e}")
+        block_lines = block.splitlines()
+        for node in block_tree.body:
+            segment = block_lines[_node_start(node) - 1:node.end_lineno]
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                if ast.dump(node) not in existing_imports:
+                    existing_imports.add(ast.dump(node))
+                    imports.extend(segment)
+                continue
+            name = None
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = node.name
+            elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                name = node.targets[0].id
+            if name in index:
+                replacements[index[name]] = segment
+            elif name is not None:
+                appended.extend([''] * 2 + segment)
+            # 其他顶层语句（如示例调用）忽略
+
+    spans = sorted(replacements, reverse=True)
+    for (start, end), (next_start, _) in zip(spans[1:], spans):
+        if end >= next_start:
+            raise PatchError("Overlapping replacements")
+    for start, end in spans:
+        lines[start - 1:end] = replacements[(start, end)]
+    if imports:
+        lines[import_end:import_end] = imports
+    lines.extend(appended)
+    return '\n'.join(lines).rstrip('\n') + '\n'
+
+
+# ---- 模型回复 ----
+
+def _looks_like_diff(text: str) -> bool:
+    return any(_HUNK_RE.match(line) for line in text.splitlines())
+
+
+def apply_patch_response(source: str, response: str) -> tuple[str, str]:
+    """
+    解析模型的增量回复并应用：```diff 代码块（或含 @@ 的文本）按 unified diff 处理，
+    否则把 ```python 代码块当作整函数/整类替换。
+    返回: (新代码, 'diff' | 'functions')。校验失败抛 PatchError：
+    结果必须能被 ast 解析，且原有的顶层函数/类/常量都还在。
+    """
+    response = _THINK_RE.sub('', response)
+    blocks = [(lang.lower(), body) for lang, body in _FENCE_RE.findall(response)]
+    diffs = [body for lang, body in blocks if lang in ('diff', 'patch', 'udiff') or _looks_like_diff(body)]
+    if not blocks and _looks_like_diff(response):
+        diffs = [response]
+
+    if diffs:
+        patched, kind = source, 'diff'
+        for diff in diffs:
+            patched = apply_unified_diff(patched, diff)
+    else:
+        code_blocks = [body for lang, body in blocks if lang in ('', 'python', 'py', 'python3')]
+        if not code_blocks:
+            if blocks or not response.strip():
+                raise PatchError("No diff or Python code in response")
+            code_blocks = [response]
+        patched, kind = apply_function_replacements(source, code_blocks), 'functions'
+
+    try:
+        patched_tree = ast.parse(patched)
+    except SyntaxError as e:
+        raise PatchError(f"Patched source does not parse: {e}")
+    try:
+        original_names = _defined_names(ast.parse(source))
+    except SyntaxError:  # 原代码本身有语法错误（正是要修的问题）时不做此项检查
+        original_names = set()
+    missing = original_names - _defined_names(patched_tree)
+    if missing:
+        raise PatchError(f"Patch removed top-level definitions: {sorted(missing)}")
+    return patched, kind
@@ -0,0 +1,48 @@
+import os
+import logging
+import threading
+
+from agents.error_book import reset_error_history
+
+logger = logging.getLogger(__name__)
+
+_create_lock = threading.Lock()  # 批量模式下多个线程同时创建项目
+
+
+def create_new_project(base_dir: str, template_dir: str) -> str:
+    """创建新项目目录，复制模板并初始化。线程安全；与其他进程抢到同一编号时顺延。"""
+    with _create_lock:
+        # 找到现有项目最大编号（如 project1 -> 1）
+        existing_projects = [d for d in os.listdir(base_dir) if d.startswith('project') and d[7:].isdigit()]
+        max_num = max([int(d[7:]) for d in existing_projects] or [0])
+        while True:
+            max_num += 1
+            new_project_dir = os.path.join(base_dir, f'project{max_num}')
+            try:
+                os.makedirs(new_project_dir)
+                break
+            except FileExistsError:
+                continue
+
+    os.makedirs(os.path.join(new_project_dir, 'src'), exist_ok=True)
+    os.makedirs(os.path.join(new_project_dir, 'reports'), exist_ok=True)
+
+    # 复制模板文件
+    for file in os.listdir(template_dir):
+        src = os.path.join(template_dir, file)
+        dst = os.path.join(new_project_dir, file)
+        if os.path.isfile(src):
+            with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+                f_dst.write(f_src.read())
+
+    # 初始化账本为空（覆盖旧内容，模板中的 error_history.json 一并移除）
+    reset_error_history(new_project_dir)
+
+    # 清空旧 SRS 和 src（如果存在）
+    srs_path = os.path.join(new_project_dir, 'project.srs.md')
+    open(srs_path, 'w').close()
+    src_path = os.path.join(new_project_dir, 'src', 'src.py')
+    open(src_path, 'w').close()
+
+    logger.info(f"创建新项目: {new_project_dir}")
+    return new_project_dir
@@ -0,0 +1,102 @@
+"""
+推测式多候选生成：同时请求 K 份实现（不同 temperature / 提示侧重），并行测试，取第一份全部通过的，
+其余候选随即取消（中止流式生成、不再启动新用例）。所有候选的失败都交给调用方登记到错误账本。
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# 候选多于温度档位时依次追加的指令侧重，使候选在同一温度下也有差异
+PROMPT_HINTS = [
+    '',
+    '特别注意边界值、空输入与异常输入的处理，严格按 SRS 抛出指定异常。',
+    '实现尽量简单直接，只使用 Python 标准库。',
+    '先逐条核对 SRS 中的接口签名（函数名、参数、返回值），再实现。',
+]
+
+
+def candidate_variants(count: int, temperatures: list[float], vary_prompts: bool = True) -> list[dict]:
+    """
+    生成 count 个候选的参数。
+    - temperatures: 温度档位，候选依次轮换使用。
+    - vary_prompts: 为 True 时每个候选追加不同的侧重提示（第一个候选不加）。
+    返回: [{'index': int, 'temperature': float, 'hint': str}, ...]
+    """
+    temperatures = list(temperatures) or [0.2]
+    variants = []
+    for index in range(max(1, int(count))):
+        hint = PROMPT_HINTS[index % len(PROMPT_HINTS)] if vary_prompts else ''
+        variants.append({'index': index, 'temperature': temperatures[index % len(temperatures)], 'hint': hint})
+    return variants
+
+
+def race_candidates(variants: list[dict], generate, evaluate, cancel_grace_sec: float = 2.0
+                    ) -> tuple[dict | None, list[dict]]:
+    """
+    并发生成并测试所有候选，第一个全部通过的为胜者，随后通知其余候选取消。
+    - generate(variant, cancel) -> str: 生成候选源码；cancel 为 threading.Event。
+    - evaluate(code, cancel) -> list[dict]: 测试源码，返回失败列表（空表示全部通过）。
+    - cancel_grace_sec: 出现胜者后等待其余候选收尾的最长时间，超时的候选记为 cancelled 且不带结果。
+    返回: (胜者或 None, 按 index 排列的全部候选)。候选在 variant 基础上增加
+    code、errors、status（passed | failed | cancelled | error）、error、elapsed_sec。
+    取消后才结束的候选，其失败列表可能不完整（未运行的用例不计），status 为 cancelled。
+    """
+    cancel = threading.Event()
+    lock = threading.Lock()
+    winner = None
+
+    def attempt(variant: dict) -> dict:
+        nonlocal winner
+        candidate = dict(variant, code=None, errors=[], status='cancelled', error=None)
+        start = time.perf_counter()
+        try:
+            code = generate(variant, cancel)
+            if not cancel.is_set():
+                candidate['code'] = code
+                candidate['errors'] = evaluate(code, cancel)
+                with lock:
+                    if cancel.is_set():
+                        pass  # 测试中途被取消，结果不完整
+                    elif candidate['errors']:
+                        candidate['status'] = 'failed'
+                    else:
+                        candidate['status'] = 'passed'
+                        winner = candidate
+                        cancel.set()
+        except Exception as e:
+            candidate['status'], candidate['error'] = 'error', e
+            logger.error(f"Candidate {variant['index']} failed: {e}")
+        candidate['elapsed_sec'] = time.perf_counter() - start
+        logger.info(f"Candidate {variant['index']} (temperature {variant['temperature']}): {candidate['status']}, "
+                    f"{len(candidate['errors'])} failures, {candidate['elapsed_sec']:.1f}s")
+        return candidate
+
+    executor = ThreadPoolExecutor(max_workers=max(1, len(variants)), thread_name_prefix='candidate')
+    try:
+        futures = [executor.submit(attempt, variant) for variant in variants]
+        pending = set(futures)
+        while pending and not cancel.is_set():
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if pending:
+            wait(pending, timeout=cancel_grace_sec)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    candidates = []
+    for variant, future in zip(variants, futures):
+        if future.done() and not future.cancelled():
+            candidates.append(future.result())
+        else:
+            candidates.append(dict(variant, code=None, errors=[], status='cancelled', error=None, elapsed_sec=None))
+    return winner, candidates
+
+
+def best_candidate(candidates: list[dict]) -> dict | None:
+    """没有胜者时选失败最少的已测候选（同数取 index 小的）；都没有源码时返回 None。"""
+    tested = [c for c in candidates if c['status'] == 'failed']
+    if not tested:
+        tested = [c for c in candidates if c['code'] is not None]
+    return min(tested, key=lambda c: (len(c['errors']), c['index'])) if tested else None
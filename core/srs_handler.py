@@ -1,9 +1,12 @@
 import os
 import re
 import logging
-import yaml
 from .utils import LLMClient
 from agents.local_llm_agent import LocalLLMAgent
+from agents.llm_cache import LLMResponseCache
+from agents.preflight import pytest_blocks
+from agents.settings import get_settings
+from agents.prompt_builder import CLOUD_BUDGET_TOKENS, LOCAL_BUDGET_TOKENS, PromptBuilder, truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -26,11 +29,10 @@ def parse_srs(content: str) -> dict:
     """解析 SRS 内容：提取要求、函数、测试用例。"""
     requirements = re.findall(r'## Requirements\n(.*?)(?=##|$)', content, re.DOTALL)
     functions = re.findall(r'## Functions\n(.*?)(?=##|$)', content, re.DOTALL)
-    test_cases = re.findall(r'```python\n(.*?)\n```', content, re.DOTALL)
     parsed = {
         'requirements': requirements[0].strip() if requirements else '',
         'functions': functions[0].strip() if functions else '',
-        'test_cases': [case.strip() for case in test_cases if case.strip().startswith('def test_')]
+        'test_cases': pytest_blocks(content)  # 含 parametrize / fixture / import pytest 开头的用例块
     }
     if not parsed['test_cases']:
         logger.warning("No test cases found in SRS")
@@ -38,27 +40,35 @@ def parse_srs(content: str) -> dict:
     return parsed
 
 class SRSHandler:
-    def __init__(self, config_path='config/config.yaml'):
-        self.config = yaml.safe_load(open(config_path))
-        self.llm = LLMClient(self.config['cloud_llm'])
-        self.local_agent = LocalLLMAgent()  # 初始化本地 Ollama Agent
+    def __init__(self, config_path=None):
+        self.config = get_settings(config_path)  # 缓存的配置，多次构造不再重复解析
+        llm_cache = LLMResponseCache.from_config(self.config.get('llm_cache'))  # 可选响应缓存
+        self.llm = LLMClient(self.config['cloud_llm'], cache=llm_cache)
+        self.local_agent = LocalLLMAgent(cache=llm_cache)  # 初始化本地 Ollama Agent
+        self.prompt_budget = (self.config.get('prompt') or {}).get('cloud_budget_tokens', CLOUD_BUDGET_TOKENS)
 
-    def generate_initial_srs(self, user_requirement: str, project_dir: str) -> str:
-        """生成初版 SRS，使用云端 LLM。"""
+    def generate_initial_srs(self, user_requirement: str, project_dir: str, on_token=None) -> str:
+        """生成初版 SRS，使用云端 LLM。on_token 用于流式回显。"""
         prompt = f"基于用户自然语言需求：{user_requirement}\n编写完整的 SRS Markdown 文档，包括：\n- 原始需求摘录\n- 功能点清单（可勾选）\n- 接口签名（函数/类/CLI）\n- 验收用例：必须包含至少3个 pytest 格式的测试函数，覆盖正常、边界和异常场景。每个用例放在单独的 ```python 代码块中，例如：\n```python\ndef test_add():\n    assert add(1, 2) == 3\n```\n确保输出为纯 Markdown 格式，无额外解释。"
         temperature = self.config['cloud_llm'].get('temperature_srs', 0.3)
-        srs_content = self.llm.generate(prompt, temperature)
+        srs_content = self.llm.generate(prompt, temperature, on_token=on_token)
         srs_path = os.path.join(project_dir, 'project.srs.md')
         os.makedirs(os.path.dirname(srs_path), exist_ok=True)
         with open(srs_path, 'w', encoding='utf-8') as f:
             f.write(srs_content)
         return srs_content
 
-    def modify_srs(self, feedback: str, current_srs: str, project_dir: str) -> str:
-        """根据反馈修改 SRS，使用云端 LLM。"""
-        prompt = f"当前 SRS：{current_srs}\n用户反馈：{feedback}\n修改 SRS 文档，确保一致性，并更新验收用例。验收用例必须包含至少3个 pytest 格式的测试函数，覆盖正常、边界和异常场景，每个用例放在单独的 ```python 代码块中。"
+    def modify_srs(self, feedback: str, current_srs: str, project_dir: str, on_token=None) -> str:
+        """根据反馈修改 SRS，使用云端 LLM。on_token 用于流式回显。"""
+        prompt = (PromptBuilder(self.prompt_budget)
+                  .add(f"当前 SRS：{current_srs}", name='srs',
+                       shrink=lambda n: f"当前 SRS：{truncate_to_tokens(current_srs, n - 8, keep='middle')}")
+                  .add(f"用户反馈：{feedback}", name='feedback')
+                  .add("修改 SRS 文档，确保一致性，并更新验收用例。验收用例必须包含至少3个 pytest 格式的测试函数，覆盖正常、边界和异常场景，每个用例放在单独的 ```python 代码块中。",
+                       name='instruction')
+                  .build())
         temperature = self.config['cloud_llm'].get('temperature_srs', 0.3)
-        new_srs = self.llm.generate(prompt, temperature)
+        new_srs = self.llm.generate(prompt, temperature, on_token=on_token)
         srs_path = os.path.join(project_dir, 'project.srs.md')
         os.makedirs(os.path.dirname(srs_path), exist_ok=True)
         with open(srs_path, 'w', encoding='utf-8') as f:
@@ -74,7 +84,8 @@ class SRSHandler:
         test_cases = parsed['test_cases']
         if len(test_cases) < 3:
             logger.warning(f"SRS 中测试用例不足 ({len(test_cases)})，使用本地 LLM 补全")
-            supplement_prompt = f"基于 SRS 内容：{srs_content[:2000]}\n生成至少 {3 - len(test_cases)} 个 pytest 测试函数，覆盖正常、边界和异常场景。每个函数格式为：def test_xxx():\n    assert ...\n只输出代码，无解释。"
+            srs_excerpt = truncate_to_tokens(srs_content, min(LOCAL_BUDGET_TOKENS - 200, 2000), keep='middle')
+            supplement_prompt = f"基于 SRS 内容：{srs_excerpt}\n生成至少 {3 - len(test_cases)} 个 pytest 测试函数，覆盖正常、边界和异常场景。每个函数格式为：def test_xxx():\n    assert ...\n只输出代码，无解释。"
             supplement_cases = self.local_agent.generate(supplement_prompt)
             if supplement_cases:
                 # 拆分并追加
@@ -1,21 +1,31 @@
 import os
 import logging
-import subprocess
 from enum import Enum
 from typing import Optional, List, Dict
 import json
 
 
-from agents.tester import extract_pytest_cases, run_pytest_cases, check_regressions, compute_error_fingerprint
+from agents.tester import (extract_pytest_cases, run_pytest_cases, check_regressions, compute_error_fingerprint,
+                           adjust_case, split_support, write_html_report, FAIL_FAST)
 from agents.self_repair import micro_fix
-from agents.error_book import append_error, backfill_fixed
+from agents.settings import get_settings
+from agents.error_book import ErrorBook
+from agents.error_ledger import LEDGER_FILE
+from agents.preflight import PREFLIGHT_CASE, interface_names, strip_code_fences
+from agents.tracing import TRACING, Span, bind, iteration_profile, save_profile, save_prometheus, span, trace
 from core.srs_handler import load_srs  # 假设 Substep 5 会实现，目前 mock
 from core.srs_handler import parse_srs  # NEW: 导入 parse_srs 函数
 from core.code_generator import CodeGenerator  # NEW: 导入 CodeGenerator 用于真实代码生成
 from core.code_generator import CodeGenerator
+from core.speculation import best_candidate, candidate_variants, race_candidates
 
 logger = logging.getLogger(__name__)
 
+config = get_settings()  # 全进程共享的配置（config/config.yaml + AUTOCODE__ 环境变量覆盖）
+
+MAX_REPAIR_ROUNDS = config['agent'].get('max_repair_rounds', 2)  # 每次迭代内 micro_fix 复测轮数
+SPECULATION = config.get('speculation') or {}  # candidates > 1 时启用推测式多候选生成
+
 class State(Enum):
     NEGOTIATING = "NEGOTIATING"
     CODING = "CODING"
@@ -32,7 +42,23 @@ class IterationState:
         self.srs_content = load_srs(project_dir)
         parsed = parse_srs(self.srs_content)  # MODIFIED: 调用 parse_srs 以补全用例
         self.test_cases = parsed['test_cases']
+        self.interface_names = interface_names(self.srs_content)  # 预检要求源码定义的接口名
         self.code_generator = CodeGenerator()  # NEW: 初始化 CodeGenerator（默认 config_path）
+        self.error_book = ErrorBook(project_dir)  # 整个运行期间常驻内存
+        self.last_regressions: List[Dict] = []
+        self.last_errors: List[Dict] = []  # 上一次测试的失败用例，供增量生成
+        self.fail_fast = FAIL_FAST
+        self.max_repair_rounds = MAX_REPAIR_ROUNDS
+        self.repair_rounds = 0  # 累计修复子轮次（不调用云端）
+        self.candidates = int(SPECULATION.get('candidates', 1))  # 每次迭代并发生成的候选数
+        self.last_candidates: List[Dict] = []  # 最近一次推测式迭代的候选摘要（不含源码）
+        self.profile: List[Dict] = []  # 每次迭代的阶段耗时与 token 用量（tracing 段），写入 profile.json
+        self.profile_path = os.path.join(project_dir, TRACING.get('profile_file', 'reports/profile.json'))
+        prometheus_file = TRACING.get('prometheus_file')
+        self.prometheus_path = os.path.join(project_dir, prometheus_file) if prometheus_file else None
+        self.report_path = os.path.join(project_dir, 'pytest_report.html')
+        # pytest 模式下本次迭代测试运行顺带生成的报告，通过后改名为 report_path
+        self.run_report_path = os.path.join(project_dir, 'reports', 'pytest_run.html')
 
     def transition_to_coding(self):
         """从 NEGOTIATING 过渡到 CODING。"""
@@ -42,66 +68,253 @@ class IterationState:
     def run_iteration(self) -> bool:
         self.iteration += 1
         logger.info(f"Starting iteration {self.iteration}")
+        result = 'error'
+        root = None
+        try:
+            with trace('iteration', iteration=self.iteration) as root:
+                try:
+                    passed = self._run_iteration()
+                    result = 'pass' if passed else 'fail'
+                finally:
+                    with span('ledger_flush'):
+                        self.error_book.flush()  # 本次迭代的新错误与回填批量写入账本
+            return passed
+        finally:
+            self._save_profile(root, result)
 
+    def _save_profile(self, root, result: str):
+        """追加本次迭代的剖析记录并重写 profile.json（配置了 prometheus_file 时同时导出）。"""
+        if not isinstance(root, Span):  # tracing 未启用
+            return
+        self.profile.append(iteration_profile(root, iteration=self.iteration, result=result,
+                                              repair_rounds=self.repair_rounds))
+        try:
+            save_profile(self.profile_path, self.profile)
+            if self.prometheus_path:
+                save_prometheus(self.prometheus_path, self.profile, {'project': os.path.basename(self.project_dir)})
+        except OSError as e:
+            logger.warning(f"Failed to write iteration profile: {e}")
+
+    def _run_iteration(self) -> bool:
         # MODIFIED: 使用云端 LLM 生成代码，注入 SRS + 账本 + 回归标志 + project_dir
-        history_path = os.path.join(self.project_dir, 'error_history.json')
-        with open(history_path, 'r', encoding='utf-8') as f:
-            error_book = json.load(f)
-        is_regression = len(check_regressions([], history_path)) > 0  # 检查是否有历史回归
-        self.current_code = self.code_generator.generate_code(self.srs_content, error_book, self.project_dir,is_regression)  # MODIFIED: 传入 project_dir
+        # 回归标志取自上一次迭代的测试结果（生成之前尚无本次结果）
+        is_regression = bool(self.last_regressions)
+        loser_errors: List[Dict] = []
+        if self.candidates > 1:
+            # 步骤0+1: 并发生成 K 个候选并行测试，取第一个全部通过的（或失败最少的）
+            with span('speculate', candidates=self.candidates):
+                fresh_errors, loser_errors = self._speculate(is_regression)
+        else:
+            # 有上一版源码和失败用例时只请求改动（CodeGenerator 增量模式）
+            with span('generate') as generate_span:
+                code = self.code_generator.generate_code(self.srs_content, self.error_book.entries(),
+                                                         self.project_dir, is_regression,
+                                                         current_code=self.current_code,
+                                                         failing_errors=self.last_errors,
+                                                         regression_hashes={err['hash'] for err in
+                                                                            self.last_regressions})
+                generate_span.set(mode=self.code_generator.last_mode)
+            # 模型常把源码包在 ``` 代码围栏里，去掉后写回 src/src.py
+            self.current_code = strip_code_fences(code) if '```' in code else code
+            if self.current_code != code:
+                self._write_source()
 
-        # 步骤1: 在 sandbox 中运行测试
-        fresh_errors: List[Dict] = run_pytest_cases(self.test_cases, self.current_code, self.project_dir)
+            # 步骤1: 在 sandbox 中运行测试（先做静态预检，不通过时不启动沙箱）
+            self._discard_run_report()
+            fresh_errors: List[Dict] = run_pytest_cases(self.test_cases, self.current_code, self.project_dir,
+                                                        fail_fast=self.fail_fast,
+                                                        required_names=self.interface_names,
+                                                        html_report=self.run_report_path)
+        self.last_errors = fresh_errors
 
         # 步骤2: 检查回归
-        history_path = os.path.join(self.project_dir, 'error_history.json')
-        regressions = check_regressions(fresh_errors, history_path)
-        if regressions:
-            logger.warning(f"Detected {len(regressions)} regressions")
-            # 可以选择 FAILED 或继续，但根据设计，继续但记录
+        self._check_regressions(fresh_errors)
+
+        # 全部用例都执行过时，之前未修复、本次不再出现的错误视为已修复
+        if self._ran_all_cases(fresh_errors):
+            fresh_hashes = {err['hash'] for err in fresh_errors}
+            for error_hash in self.error_book.unfixed_hashes() - fresh_hashes:
+                self.error_book.mark_fixed(error_hash, self.iteration)
+
+        if loser_errors:
+            self._record_loser_errors(loser_errors, fresh_errors)
 
         if not fresh_errors:  # 无错误，所有测试通过，无回归
-            self.state = State.PASS
-            self.generate_report()
-            logger.info("All tests passed, no regressions")
-            return True
+            return self._pass(run_report=self.candidates <= 1)
 
-        # 步骤3: 处理错误并更新日志
-        for err in fresh_errors:
-            error_hash = err['hash']  # 已由 tester 计算
-            abstract = err['abstract']
-            case = err['case']
-            append_error(self.project_dir, error_hash, self.iteration, abstract, case)
-
-        # 步骤4: 尝试 minor fix（仅当单一错误且为 Syntax/NameError）
-        if len(fresh_errors) == 1:
-            err = fresh_errors[0]
-            exception_str = err['exception'].lower()  # 转小写，忽略大小写
-            if 'syntaxerror' in exception_str or 'indentationerror' in exception_str or 'nameerror' in exception_str:
-                logger.info("Detected minor error, attempting LLM fix")
-                fixed_code, fixed = micro_fix(self.current_code, err)
-                if fixed:
-                    self.current_code = fixed_code
-                    backfill_fixed(self.project_dir, err['hash'], self.iteration)
-                    return self.run_iteration()  # 递归重试（移除参数）
+        # 步骤3: 处理错误并更新日志（hash 已由 tester 计算，迭代结束时整批写入）
+        self.error_book.record(fresh_errors, self.iteration)
+
+        # 步骤4: 尝试 minor fix（仅当单一错误且为 Syntax/NameError），修复后就地复测，不再调用云端
+        if self._is_minor(fresh_errors) and self._repair(fresh_errors):
+            return self._pass()
 
         # 如果未修复或多个错误，继续下一次迭代
         logger.info(f"Iteration {self.iteration} failed, proceeding to next")
         return False
 
-    def generate_report(self):
-        """生成 pytest HTML 报告。"""
-        report_path = os.path.join(self.project_dir, 'pytest_report.html')
-        test_file = os.path.join(self.project_dir, 'temp_tests.py')  # 临时写入测试用例
-        with open(test_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(self.test_cases))
+    def _speculate(self, is_regression: bool) -> tuple[List[Dict], List[Dict]]:
+        """
+        推测式生成：按 speculation 配置并发请求多个候选（不同 temperature / 提示侧重），并行测试，
+        第一个全部通过的胜出，其余取消。没有胜者时取失败最少的候选继续后续流程。
+        选中的候选写入 src/src.py 并成为 current_code。
+        返回: (选中候选的失败列表, 其余候选的失败列表)。
+        """
+        entries = self.error_book.entries()
+        regression_hashes = {err['hash'] for err in self.last_regressions}
+        previous_code, previous_errors = self.current_code, self.last_errors
+
+        @bind  # 候选线程中的区间挂在 speculate 区间下
+        def generate(variant, cancel):
+            with span('generate', candidate=variant['index'], temperature=variant['temperature']) as generate_span:
+                code, mode = self.code_generator.generate_candidate(
+                    self.srs_content, entries, variant['temperature'], variant['hint'], cancel,
+                    is_regression=is_regression, current_code=previous_code, failing_errors=previous_errors,
+                    regression_hashes=regression_hashes)
+                generate_span.set(mode=mode)
+            return strip_code_fences(code) if '```' in code else code
+
+        @bind
+        def evaluate(code, cancel):
+            return run_pytest_cases(self.test_cases, code, self.project_dir, fail_fast=self.fail_fast, cancel=cancel,
+                                    required_names=self.interface_names)
+
+        variants = candidate_variants(self.candidates, SPECULATION.get('temperatures', [0.2, 0.5, 0.8]),
+                                      SPECULATION.get('vary_prompts', True))
+        winner, candidates = race_candidates(variants, generate, evaluate,
+                                             SPECULATION.get('cancel_grace_sec', 2.0))
+        self.last_candidates = [{key: c[key] for key in ('index', 'temperature', 'status', 'elapsed_sec')}
+                                for c in candidates]
+        chosen = winner or best_candidate(candidates)
+        if chosen is None:  # 所有候选都生成失败，与串行模式一样抛出
+            error = next((c['error'] for c in candidates if c['error'] is not None), None)
+            raise error or RuntimeError("All speculative candidates were cancelled")
+        outcome = 'passed' if winner else f"{len(chosen['errors'])} failures"
+        logger.info(f"Speculation: candidate {chosen['index']} chosen ({outcome}), "
+                    f"statuses {[c['status'] for c in candidates]}")
+        self.current_code = chosen['code']
+        self._write_source()
+        loser_errors = [err for c in candidates if c is not chosen for err in c['errors']]
+        return chosen['errors'], loser_errors
+
+    def _record_loser_errors(self, loser_errors: List[Dict], fresh_errors: List[Dict]):
+        """
+        落选候选的失败也登记到账本（按 hash 去重，已在选中候选失败里的跳过）。
+        选中候选跑完了全部用例且没有该错误时，同一迭代内即标记为已修复。
+        """
+        known = {err['hash'] for err in fresh_errors} | self.error_book.unfixed_hashes()
+        new_errors = {}
+        for err in loser_errors:
+            if err['hash'] not in known:
+                new_errors.setdefault(err['hash'], err)
+        if not new_errors:
+            return
+        self.error_book.record(list(new_errors.values()), self.iteration)
+        if not fresh_errors or self._ran_all_cases(fresh_errors):
+            for error_hash in new_errors:
+                self.error_book.mark_fixed(error_hash, self.iteration)
+        logger.info(f"Recorded {len(new_errors)} failures from losing candidates")
+
+    def _ran_all_cases(self, fresh_errors: List[Dict]) -> bool:
+        """
+        本次测试运行是否执行了全部用例：没有任何失败（含预检）时一定是完整运行；fail_fast 可能在第一个失败后跳过其余用例，
+        预检不通过（PREFLIGHT_CASE 合成错误）时一个用例都没有运行。只有完整运行里没出现的错误才能回填为已修复。
+        """
+        if not fresh_errors:
+            return True
+        return not self.fail_fast and not any(err['case'] == PREFLIGHT_CASE for err in fresh_errors)
+
+    def _check_regressions(self, fresh_errors: List[Dict]) -> List[Dict]:
+        history_path = os.path.join(self.project_dir, LEDGER_FILE)
+        with span('regression_check', errors=len(fresh_errors)):
+            regressions = check_regressions(fresh_errors, history_path, error_book=self.error_book)
+        self.last_regressions = regressions
+        if regressions:
+            logger.warning(f"Detected {len(regressions)} regressions")
+            # 可以选择 FAILED 或继续，但根据设计，继续但记录
+        return regressions
+
+    def _pass(self, run_report: bool = False) -> bool:
+        """
+        - run_report: 通过的正是本次迭代的完整测试运行，其顺带生成的报告可直接使用。
+        """
+        self.state = State.PASS
+        with span('report'):
+            self.generate_report(self.run_report_path if run_report else None)
+        logger.info("All tests passed, no regressions")
+        return True
+
+    @staticmethod
+    def _is_minor(fresh_errors: List[Dict]) -> bool:
+        if len(fresh_errors) != 1:
+            return False
+        exception_str = fresh_errors[0]['exception'].lower()  # 转小写，忽略大小写
+        return 'syntaxerror' in exception_str or 'indentationerror' in exception_str or 'nameerror' in exception_str
+
+    def _repair(self, failing: List[Dict]) -> bool:
+        """
+        修复子循环（本次迭代内，不调用云端）：micro_fix 的结果写回 src/src.py，
+        先复测之前失败的用例，通过后再跑其余用例。最多 max_repair_rounds 轮。
+        返回: 全部用例通过时为 True。
+        """
+        recorded = {err['hash'] for err in failing}
+        for round_no in range(1, self.max_repair_rounds + 1):
+            logger.info("Detected minor error, attempting LLM fix")
+            with span('micro_fix', round=round_no):
+                fixed_code, fixed = micro_fix(self.current_code, failing[0])
+            if not fixed:
+                return False
+            self.current_code = strip_code_fences(fixed_code) if '```' in fixed_code else fixed_code
+            self._write_source()
+            self.repair_rounds += 1
+            logger.info(f"Repair round {round_no} of iteration {self.iteration}: retesting failing cases first")
+
+            failing_cases = [err['case'] for err in failing]
+            _, support = split_support(self.test_cases)  # 共享 fixture 块随失败用例一起复测
+            fresh_errors = run_pytest_cases(failing_cases + support, self.current_code, self.project_dir,
+                                            fail_fast=self.fail_fast, required_names=self.interface_names)
+            if not fresh_errors:
+                for err in failing:
+                    self.error_book.mark_fixed(err['hash'], self.iteration)
+                remaining = [case for case in self.test_cases if adjust_case(case) not in set(failing_cases)]
+                fresh_errors = run_pytest_cases(remaining, self.current_code, self.project_dir,
+                                                fail_fast=self.fail_fast, required_names=self.interface_names)
+                if not fresh_errors:
+                    logger.info(f"Repair round {round_no} fixed iteration {self.iteration}")
+                    return True
+
+            self.last_errors = fresh_errors
+            self._check_regressions(fresh_errors)
+            self.error_book.record([err for err in fresh_errors if err['hash'] not in recorded], self.iteration)
+            recorded.update(err['hash'] for err in fresh_errors)
+            if not self._is_minor(fresh_errors):
+                return False
+            failing = fresh_errors
+        return False
+
+    def _write_source(self):
+        """把当前代码写回 src/src.py（与 CodeGenerator 的输出位置一致）。"""
+        src_path = os.path.join(self.project_dir, 'src', 'src.py')
+        os.makedirs(os.path.dirname(src_path), exist_ok=True)
+        with open(src_path, 'w', encoding='utf-8') as f:
+            f.write(self.current_code)
 
-        cmd = ['pytest', test_file, f'--html={report_path}', '--self-contained-html']
+    def _discard_run_report(self):
+        """删除上一次测试运行留下的报告，避免把旧报告当成本次的。"""
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True)  # 捕获输出
-            logger.info(f"Report generated at {report_path}")
-        except subprocess.CalledProcessError as e:
-            stderr_output = e.stderr.decode('utf-8') if e.stderr else 'No stderr'
-            logger.error(f"Failed to generate report: {e}. Stderr: {stderr_output}")
-        finally:
-            os.remove(test_file)  # 清理
\ No newline at end of file
+            os.remove(self.run_report_path)
+        except FileNotFoundError:
+            pass
+
+    def generate_report(self, run_report: str = None):
+        """
+        生成 pytest HTML 报告（需要 pytest-html）。
+        - run_report: 测试运行时已顺带生成的报告（sandbox.runner 为 pytest），存在时直接改名使用，不再跑第二遍；
+          否则（其他 runner、结果命中缓存、修复子轮次后通过等）单独跑一次 pytest，源码与用例的写法同测试运行。
+        """
+        if run_report and os.path.exists(run_report):
+            os.replace(run_report, self.report_path)
+            logger.info(f"Report generated at {self.report_path} (from the test run)")
+            return
+        if write_html_report(self.test_cases, self.current_code or '', self.report_path):
+            logger.info(f"Report generated at {self.report_path}")
@@ -2,18 +2,131 @@ import requests
 import json
 import yaml
 import os
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+from agents.llm_cache import LLMResponseCache
+from agents.prompt_builder import estimate_tokens, get_usage_tracker
+from agents.scheduler import CLOUD, get_scheduler
+from agents.tracing import current_span, span
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _retry_after_seconds(response) -> float | None:
+    """解析 Retry-After 头（秒数或 HTTP 日期），无法解析返回 None。"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _iter_sse_lines(response):
+    """
+    逐行读取 SSE 响应，数据一到即产出。
+    iter_lines 在非 chunked 响应上会一直读到连接关闭，这里用 read1 读取已到达的数据。
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        response.encoding = 'utf-8'  # text/event-stream 未声明 charset 时 requests 默认按 latin-1 解码
+        yield from response.iter_lines(decode_unicode=True)
+        return
+    buffer = b''
+    while True:
+        chunk = read1(65536, decode_content=True)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8', errors='replace')
+    if buffer:
+        yield buffer.rstrip(b'\r').decode('utf-8', errors='replace')
+
+
+def _stop_cache_id(stop) -> str | None:
+    """
+    流式 stop 条件的稳定标识（'模块.函数名'），用于缓存键；lambda、闭包等没有稳定标识的返回 None。
+    """
+    if stop is None:
+        return None
+    qualname = getattr(stop, '__qualname__', '')
+    module = getattr(stop, '__module__', None)
+    if not module or not qualname or '<' in qualname:
+        return None
+    return f"{module}.{qualname}"
+
 
 class LLMClient:
-    def __init__(self, config):
+    def __init__(self, config, cache: LLMResponseCache = None):
         self.api_key = os.getenv('CLOUD_API_KEY', config['api_key'])  # 优先环境变量，提高安全性
         self.model = config['model']
         self.endpoint = f"{config['base_url']}{config['path']}"
         self.default_temperature = config.get('temperature_code', 0.2)
+        self.stream_enabled = config.get('stream', False)  # 默认是否使用 SSE 流式输出
+        self.stream_usage = config.get('stream_usage', True)  # 流式请求附带 stream_options.include_usage
+        self.cache = cache  # 可选响应缓存（config.yaml 的 llm_cache 段）
+        # (连接超时, 读超时)，读超时沿用 cloud_llm.timeout
+        self.timeout = (config.get('connect_timeout', 10), config.get('timeout', 60))
+        self.max_retries = config.get('max_retries', 3)
+        self.backoff_base = config.get('backoff_base', 1.0)
+        self.backoff_max = config.get('backoff_max', 30.0)
+        # 复用连接，避免每次请求重新 TCP+TLS 握手
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.get('pool_maxsize', 10))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        self._local = threading.local()
 
-    def generate(self, prompt: str, temperature=None, max_tokens=4096) -> str:
-        """生成响应，支持 OpenAI 兼容格式"""
-        if temperature is None:
-            temperature = self.default_temperature
+    @property
+    def last_usage(self) -> dict | None:
+        """当前线程最近一次调用的 token 用量 {'prompt_tokens', 'completion_tokens', 'estimated'}。"""
+        return getattr(self._local, 'usage', None)
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避 + 全抖动。"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _post(self, payload: dict, **kwargs) -> requests.Response:
+        """
+        发送请求，对连接错误/超时及 429/5xx 重试（最多 max_retries 次）。
+        有 Retry-After 时按其等待（不超过 backoff_max），否则指数退避。
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.endpoint, json=payload, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"LLM request failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                return response
+            retry_after = _retry_after_seconds(response)
+            delay = min(retry_after, self.backoff_max) if retry_after is not None else self._backoff(attempt)
+            logger.warning(f"LLM request got {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+            response.close()
+            time.sleep(delay)
+
+    def _payload(self, prompt: str, temperature, max_tokens, stream: bool = False) -> dict:
         payload = {
             "model": self.model,
             "messages": [{"role": "system", "content": "You are a helpful code generation assistant."},  # 系统提示，可自定义
@@ -21,12 +134,114 @@ class LLMClient:
             "temperature": temperature,
             "max_tokens": max_tokens
         }
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        response = requests.post(self.endpoint, json=payload, headers=headers)
+        if stream:
+            payload["stream"] = True
+            if self.stream_usage:
+                payload["stream_options"] = {"include_usage": True}  # 末尾多一个只含 usage 的块
+        return payload
+
+    def stream(self, prompt: str, temperature=None, max_tokens=4096, usage: dict = None):
+        """
+        以 SSE 流式调用 OpenAI 兼容接口，逐个产出内容增量。关闭生成器即中止请求。
+        - usage: 传入 dict 时写入接口返回的用量（若有）。
+        """
+        if temperature is None:
+            temperature = self.default_temperature
+        response = self._post(self._payload(prompt, temperature, max_tokens, stream=True), stream=True)
+        try:
+            if response.status_code != 200:
+                raise Exception(f"API 调用失败: {response.status_code} - {response.text}")
+            for line in _iter_sse_lines(response):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                if usage is not None and event.get('usage'):
+                    usage.update(event['usage'])
+                choices = event.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content')
+                if delta:
+                    yield delta
+        finally:
+            response.close()
+
+    def generate(self, prompt: str, temperature=None, max_tokens=4096,
+                 on_token=None, stop=None, stream: bool = None) -> str:
+        """
+        生成响应，支持 OpenAI 兼容格式
+        - on_token: 每收到一段增量时回调 on_token(text)（非流式时整段回调一次）。
+        - stop: stop(已生成全文) 返回 True 时提前中止流式请求。
+        - stream: 是否流式，默认取 cloud_llm.stream。
+
+        缓存：stop 为模块级具名函数（如 code_block_complete）时，其名字计入缓存键，截断后的内容照常缓存，
+        命中时返回同样截断的内容；lambda / 闭包（如取消信号）的结果不只取决于文本，被其中止的响应不缓存。
+        """
+        if temperature is None:
+            temperature = self.default_temperature
+        if stream is None:
+            stream = self.stream_enabled
+        cache_key = None
+        stop_id = _stop_cache_id(stop) if stream else None
+        if self.cache is not None and self.cache.applies_to(temperature):
+            cache_key = self.cache.make_key('openai', self.model, prompt, temperature, max_tokens, stop=stop_id)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM response served from cache")
+                self._local.usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'estimated': False}
+                if on_token:
+                    on_token(cached)
+                return cached
+
+        # 多项目并发时共享云端并发上限（同一线程内可重入）
+        with span('cloud_llm', stream=stream), get_scheduler().slot(CLOUD):
+            return self._generate(prompt, temperature, max_tokens, on_token, stop, stream, cache_key,
+                                  cache_truncated=stop_id is not None)
+
+    def _record_usage(self, prompt: str, content: str, usage: dict | None):
+        """记录本次调用的用量：优先用接口返回的 usage，缺失（或流被提前中止）时估算。"""
+        if usage and usage.get('prompt_tokens') is not None and usage.get('completion_tokens') is not None:
+            recorded = get_usage_tracker().record('cloud', usage['prompt_tokens'], usage['completion_tokens'])
+        else:
+            recorded = get_usage_tracker().record('cloud', estimate_tokens(prompt), estimate_tokens(content),
+                                                  estimated=True)
+        self._local.usage = recorded
+
+    def _generate(self, prompt, temperature, max_tokens, on_token, stop, stream, cache_key,
+                  cache_truncated: bool = False) -> str:
+        if stream:
+            content, first, aborted, usage = '', True, False, {}
+            start = time.perf_counter()
+            tokens = self.stream(prompt, temperature, max_tokens, usage=usage)
+            try:
+                for delta in tokens:
+                    if first and current_span() is not None:
+                        current_span().set(first_token_sec=round(time.perf_counter() - start, 6))
+                    first = False
+                    content += delta  # 累加而不是每次 join 全部片段，长回复下保持线性
+                    if on_token:
+                        on_token(delta)
+                    if stop is not None and stop(content):
+                        logger.info("Stop condition hit, aborting stream")
+                        aborted = True
+                        break
+            finally:
+                tokens.close()
+            self._record_usage(prompt, content, usage)
+            if cache_key is not None and (cache_truncated or not aborted):
+                self.cache.put(cache_key, content)
+            return content
+
+        response = self._post(self._payload(prompt, temperature, max_tokens))
         if response.status_code == 200:
-            return response.json()['choices'][0]['message']['content']
+            body = response.json()
+            content = body['choices'][0]['message']['content']
+            self._record_usage(prompt, content, body.get('usage'))
+            if cache_key is not None:
+                self.cache.put(cache_key, content)
+            if on_token:
+                on_token(content)
+            return content
         else:
-            raise Exception(f"API 调用失败: {response.status_code} - {response.text}")
\ No newline at end of file
+            raise Exception(f"API 调用失败: {response.status_code} - {response.text}")
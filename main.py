@@ -1,46 +1,19 @@
 import os
+import argparse
 import logging
 import json  # NEW: 用于账本加载
 from core.state_machine import IterationState, State
 from core.srs_handler import load_srs, parse_srs, SRSHandler  # NEW: 导入 SRSHandler 用于协商
 from core.code_generator import CodeGenerator  # NEW: 导入，但实际在 state_machine 中使用
+from core.project import create_new_project
+from agents.settings import setup_logging
 
 logger = logging.getLogger(__name__)
 
 
-def create_new_project(base_dir: str, template_dir: str) -> str:
-    """创建新项目目录，复制模板并初始化。"""
-    # 找到现有项目最大编号（如 project1 -> 1）
-    existing_projects = [d for d in os.listdir(base_dir) if d.startswith('project') and d[7:].isdigit()]
-    max_num = max([int(d[7:]) for d in existing_projects] or [0])
-    new_project_name = f'project{max_num + 1}'
-    new_project_dir = os.path.join(base_dir, new_project_name)
-
-    os.makedirs(new_project_dir, exist_ok=True)
-    os.makedirs(os.path.join(new_project_dir, 'src'), exist_ok=True)
-    os.makedirs(os.path.join(new_project_dir, 'reports'), exist_ok=True)
-
-    # 复制模板文件
-    for file in os.listdir(template_dir):
-        src = os.path.join(template_dir, file)
-        dst = os.path.join(new_project_dir, file)
-        if os.path.isfile(src):
-            with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
-                f_dst.write(f_src.read())
-
-    # 初始化账本为空数组（覆盖旧内容）
-    history_path = os.path.join(new_project_dir, 'error_history.json')
-    with open(history_path, 'w', encoding='utf-8') as f:
-        json.dump([], f)
-
-    # 清空旧 SRS 和 src（如果存在）
-    srs_path = os.path.join(new_project_dir, 'project.srs.md')
-    open(srs_path, 'w').close()
-    src_path = os.path.join(new_project_dir, 'src', 'src.py')
-    open(src_path, 'w').close()
-
-    logger.info(f"创建新项目: {new_project_dir}")
-    return new_project_dir
+def _echo(text: str):
+    """流式回显 LLM 输出。"""
+    print(text, end='', flush=True)
 
 
 def main():
@@ -53,8 +26,9 @@ def main():
     # 需求协商阶段
     srs_handler = SRSHandler()
     user_requirement = input("请输入原始需求（自然语言）：")
-    srs_content = srs_handler.generate_initial_srs(user_requirement, project_dir)
-    print("生成的 SRS：\n" + srs_content)
+    print("生成的 SRS：")
+    srs_content = srs_handler.generate_initial_srs(user_requirement, project_dir, on_token=_echo)
+    print()
 
     while True:
         feedback = input("审阅 SRS，提供反馈（行号或描述），或输入 'ok' 确认：")
@@ -64,8 +38,9 @@ def main():
                 f.write(srs_content)
             break
         else:
-            srs_content = srs_handler.modify_srs(feedback, srs_content, project_dir)
-            print("修改后的 SRS：\n" + srs_content)
+            print("修改后的 SRS：")
+            srs_content = srs_handler.modify_srs(feedback, srs_content, project_dir, on_token=_echo)
+            print()
 
     parsed_srs = parse_srs(srs_content)
 
@@ -82,5 +57,22 @@ def main():
         state.state = State.FAILED
         logger.error("Max iterations reached: FAILED")
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AutoCode：需求 → SRS → 代码迭代")
+    parser.add_argument('--batch', metavar='REQUIREMENTS_JSONL',
+                        help='无交互批量模式：逐行读取需求（JSON，含 requirement/body/text 字段），多项目并发运行')
+    parser.add_argument('--summary', help='批量模式汇总 JSON 路径（默认 projects/batch_summary_<时间>.json）')
+    parser.add_argument('--max-projects', type=int, help='批量模式同时运行的项目数（默认 batch.max_projects）')
+    parser.add_argument('--max-iterations', type=int, help='每个项目的最大迭代次数（默认 agent.max_iterations）')
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    setup_logging()  # 日志只在入口初始化一次
+    if args.batch:
+        from core.batch_runner import run_batch
+        run_batch(args.batch, args.summary, args.max_projects, args.max_iterations)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+from agents.async_llm import AsyncLLMDispatcher
+
+
+class _SlowBackend:
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return {'response': ' ok '}
+
+
+def test_ollama_concurrency_is_bounded():
+    backend = _SlowBackend()
+    dispatcher = AsyncLLMDispatcher(ollama_concurrency=2)
+
+    async def fan_out():
+        return await dispatcher.gather(*(dispatcher.ollama_generate('m', f'p{i}') for i in range(6)))
+
+    with patch('agents.async_llm.ollama.generate', side_effect=backend):
+        results = dispatcher.run(fan_out())
+    assert results == ['ok'] * 6
+    assert backend.peak == 2
+
+
+def test_run_inside_running_loop():
+    dispatcher = AsyncLLMDispatcher()
+
+    async def value():
+        return 42
+
+    async def outer():
+        return dispatcher.run(value())  # 同步 API 在异步上下文中仍可用
+
+    assert asyncio.run(outer()) == 42
+
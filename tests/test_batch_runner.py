@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from core.batch_runner import BatchRunner, load_requirements
+from core.project import create_new_project
+from core.state_machine import State
+
+
+def test_load_requirements(tmp_path):
+    path = tmp_path / 'reqs.jsonl'
+    path.write_text('{"id": "a", "requirement": "add two numbers"}\n\n'
+                    'not json\n'
+                    '{"request_id": "b", "title": "Stack", "body": "push and pop"}\n'
+                    '"bare string requirement"\n'
+                    '{"id": "empty"}\n', encoding='utf-8')
+    assert load_requirements(str(path)) == [
+        {'id': 'a', 'requirement': 'add two numbers'},
+        {'id': 'b', 'requirement': 'Stack\npush and pop'},
+        {'id': 'req5', 'requirement': 'bare string requirement'},
+    ]
+
+
+def test_create_new_project_is_thread_safe(tmp_path):
+    template = tmp_path / 'project_template'
+    template.mkdir()
+    (template / 'requirements.txt').write_text('', encoding='utf-8')
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(create_new_project(str(tmp_path), str(template))))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(results)) == 8
+
+
+class _FakeState:
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    failing = set()  # 始终失败的项目目录
+
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.state = State.CODING
+        self.iteration = 0
+
+    def transition_to_coding(self):
+        pass
+
+    def run_iteration(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.active -= 1
+        self.iteration += 1
+        if self.project_dir in cls.failing or self.iteration < 2:
+            return False
+        self.state = State.PASS
+        return True
+
+
+def test_batch_runs_projects_concurrently(tmp_path):
+    base = tmp_path / 'projects'
+    (base / 'project_template').mkdir(parents=True)
+    summary_path = str(tmp_path / 'summary.json')
+    items = [{'id': f'r{i}', 'requirement': f'req {i}'} for i in range(6)] + [{'id': 'boom', 'requirement': 'x'}]
+
+    def generate_srs(self, requirement, project_dir, on_token=None):
+        if requirement == 'x':
+            raise RuntimeError('cloud down')
+        if requirement == 'req 5':
+            _FakeState.failing.add(project_dir)
+
+    runner = BatchRunner(str(base), str(base / 'project_template'), summary_path, max_projects=3, max_iterations=3)
+    with patch('core.batch_runner.SRSHandler.__init__', return_value=None), \
+            patch('core.batch_runner.SRSHandler.generate_initial_srs', generate_srs), \
+            patch('core.batch_runner.IterationState', _FakeState):
+        summary = runner.run(items)
+
+    assert _FakeState.peak == 3
+    assert summary['counts'] == {'PASS': 5, 'FAILED': 1, 'ERROR': 1}
+    with open(summary_path, encoding='utf-8') as f:
+        on_disk = json.load(f)
+    assert on_disk['finished'] is True
+    assert [p['id'] for p in on_disk['projects']] == [item['id'] for item in items]  # 与输入同序
+    passed = on_disk['projects'][0]
+    assert passed['iterations'] == 2 and len(passed['iteration_sec']) == 2 and passed['srs_sec'] is not None
+    assert 'cloud down' in on_disk['projects'][-1]['error']
@@ -0,0 +1,59 @@
+import os
+from unittest.mock import patch
+
+from core.code_generator import CodeGenerator
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yaml')
+FAILING = [{'case': 'def test_add():\n    assert add(1, 2) == 3', 'exception': 'AssertionError'}]
+CURRENT = '```python\ndef add(a, b):\n    return a - b\n\ndef mul(a, b):\n    return a * b\n```'
+
+
+def _generator():
+    generator = CodeGenerator(CONFIG)
+    generator.incremental = True
+    return generator
+
+
+def test_incremental_patch_is_applied_and_written(tmp_path):
+    generator = _generator()
+    calls = []
+
+    def generate(prompt, temperature, max_tokens=4096, on_token=None, stop=None):
+        calls.append(max_tokens)
+        return '```python\ndef add(a, b):\n    return a + b\n```'
+
+    with patch.object(generator.llm, 'generate', side_effect=generate):
+        code = generator.generate_code('SRS', [], str(tmp_path), current_code=CURRENT, failing_errors=FAILING)
+    assert calls == [generator.patch_max_tokens]
+    assert generator.last_mode == 'functions'
+    assert 'return a + b' in code and 'def mul' in code
+    assert (tmp_path / 'src' / 'src.py').read_text(encoding='utf-8') == code
+
+
+def test_bad_patch_falls_back_to_full_generation(tmp_path):
+    generator = _generator()
+    replies = iter(['```diff\n@@ -1,2 +1,2 @@\n def nope():\n-    pass\n+    pass\n```',
+                    '```python\ndef add(a, b):\n    return a + b\n```'])
+    with patch.object(generator.llm, 'generate', side_effect=lambda *a, **k: next(replies)):
+        code = generator.generate_code('SRS', [], str(tmp_path), current_code=CURRENT, failing_errors=FAILING)
+    assert generator.last_mode == 'full'
+    assert code.startswith('```python')  # 整文件回复原样写入
+
+
+def test_full_prompt_embeds_compacted_error_book(tmp_path):
+    generator = _generator()
+    generator.ledger_budget = 400
+    book = [{'hash': f'h{i}', 'first_iter': i, 'fixed_iter': i + 1, 'abstract': 'fixed', 'case': 'x' * 400}
+            for i in range(50)] + [{'hash': 'live', 'first_iter': 9, 'fixed_iter': None,
+                                   'abstract': 'still failing', 'case': 'def test_live(): ...'}]
+    prompts = []
+
+    def generate(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return '```python\npass\n```'
+
+    with patch.object(generator.llm, 'generate', side_effect=generate):
+        generator.generate_code('SRS', book, str(tmp_path))
+    assert 'def test_live(): ...' in prompts[0] and 'x' * 400 not in prompts[0]
+    assert '"status": "omitted"' in prompts[0]
+    assert generator.last_prompt_report['sections']['error_book'] <= 400
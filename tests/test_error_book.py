@@ -11,4 +11,37 @@ def test_append_and_backfill(tmp_path):
 
     backfill_fixed(project_dir, "hash1", 2)
     history = load_error_history(project_dir)
-    assert history[0]["fixed_iter"] == 2
\ No newline at end of file
+    assert history[0]["fixed_iter"] == 2
+
+def test_error_book_batches_writes(tmp_path):
+    from agents.error_book import ErrorBook
+    project_dir = str(tmp_path)
+    append_error(project_dir, "old", 1, "abstract", "case")
+    backfill_fixed(project_dir, "old", 2)
+
+    book = ErrorBook(project_dir)
+    assert book.is_fixed("old")
+    fresh = [{'hash': 'old', 'abstract': 'a', 'case': 'c'}, {'hash': 'new', 'abstract': 'b', 'case': 'd'}]
+    assert [e['hash'] for e in book.regressions(fresh)] == ['old']
+    book.record(fresh, 3)
+    book.mark_fixed('new', 4)
+    ledger_file = tmp_path / 'error_history.jsonl'
+    assert len(ledger_file.read_text(encoding='utf-8').splitlines()) == 2  # 尚未写入（1 条 add + 1 条 fix）
+    assert book.get('new')['fixed_iter'] == 4 and book.unfixed_hashes() == {'old'}  # 索引已更新
+    assert book.flush() == 3 and book.flush() == 0
+    assert len(ledger_file.read_text(encoding='utf-8').splitlines()) == 5
+    history = load_error_history(project_dir)
+    assert [(e['hash'], e['fixed_iter']) for e in history] == [('old', 2), ('old', None), ('new', 4)]
+    assert ErrorBook(project_dir).unfixed_hashes() == {'old'}
+
+
+def test_error_book_pending_survives_external_write(tmp_path):
+    from agents.error_book import ErrorBook
+    project_dir = str(tmp_path)
+    book = ErrorBook(project_dir)
+    book.record([{'hash': 'mine', 'abstract': 'a', 'case': 'c'}], 1)
+    with open(tmp_path / 'error_history.jsonl', 'a', encoding='utf-8') as f:  # 其他写入方追加
+        f.write(json.dumps({'op': 'add', 'hash': 'other', 'first_iter': 1, 'fixed_iter': None}) + '\n')
+    assert book.unfixed_hashes() == {'mine', 'other'}
+    book.flush()
+    assert [e['hash'] for e in load_error_history(project_dir)] == ['other', 'mine']
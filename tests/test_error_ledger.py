@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from agents.error_book import append_errors, backfill_fixed, load_error_history
+from agents.error_ledger import ErrorLedger
+from agents.tester import check_regressions
+
+
+def _errors(*hashes):
+    return [{'hash': h, 'abstract': f'abs {h}', 'case': f'case {h}'} for h in hashes]
+
+
+def test_batch_append_is_one_write_and_fix_is_indexed(tmp_path):
+    project_dir = str(tmp_path)
+    append_errors(project_dir, _errors('a', 'b', 'a'), 1)
+    lines = (tmp_path / 'error_history.jsonl').read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 3
+    backfill_fixed(project_dir, 'a', 2)  # 只回填最早的一条
+    history = load_error_history(project_dir)
+    assert [e['fixed_iter'] for e in history] == [2, None, None]
+    ledger = ErrorLedger.for_project(project_dir)
+    assert ledger.is_fixed('a') and not ledger.is_fixed('b')
+    assert ledger.unfixed_hashes() == {'a', 'b'}
+
+
+def test_replay_survives_reopen_and_torn_write(tmp_path):
+    path = tmp_path / 'error_history.jsonl'
+    ledger = ErrorLedger(str(path))
+    ledger.append(_errors('x'))
+    ledger.mark_fixed('x', 3)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "hash": "trunc')  # 写入中断
+    reopened = ErrorLedger(str(path))
+    assert reopened.entries()[0]['fixed_iter'] == 3
+    reopened.append(_errors('y'))
+    assert [e['hash'] for e in ErrorLedger(str(path)).entries()] == ['x', 'y']
+
+
+def test_compaction_drops_fix_records(tmp_path):
+    path = tmp_path / 'error_history.jsonl'
+    ledger = ErrorLedger(str(path))
+    ledger.append(_errors(*[str(i) for i in range(10)]))
+    ledger.mark_fixed_many([str(i) for i in range(10)], 2)
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 20
+    ledger.compact()
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert len(lines) == 10 and all(r['op'] == 'add' and r['fixed_iter'] == 2 for r in lines)
+
+
+def test_migrates_legacy_json(tmp_path):
+    legacy = tmp_path / 'error_history.json'
+    legacy.write_text(json.dumps([{'hash': 'old', 'first_iter': 1, 'fixed_iter': 2, 'abstract': 'a', 'case': 'c'},
+                                  {'hash': 'open', 'first_iter': 2, 'fixed_iter': None, 'abstract': 'a',
+                                   'case': 'c'}]), encoding='utf-8')
+    fresh = [{'hash': 'old', 'abstract': 'a'}, {'hash': 'open', 'abstract': 'a'}]
+    with pytest.raises(ValueError):  # 账本路径就是 JSONL 本身，不再由 .json 推导
+        check_regressions(fresh, str(legacy))
+    regs = check_regressions(fresh, str(tmp_path / 'error_history.jsonl'))
+    assert [r['hash'] for r in regs] == ['old']
+    assert not legacy.exists() and (tmp_path / 'error_history.json.migrated').exists()
+    assert len(load_error_history(str(tmp_path))) == 2
+
+
+def test_external_rewrite_is_picked_up(tmp_path):
+    project_dir = str(tmp_path)
+    append_errors(project_dir, _errors('a'), 1)
+    (tmp_path / 'error_history.jsonl').write_text(
+        json.dumps({'op': 'add', 'hash': 'z', 'first_iter': 5, 'fixed_iter': None}) + '\n', encoding='utf-8')
+    assert [e['hash'] for e in load_error_history(project_dir)] == ['z']
+
+
+def test_legacy_json_at_ledger_path_is_converted_in_place(tmp_path):
+    path = tmp_path / 'history.json'  # 配置的账本路径上仍是旧版整体 JSON
+    path.write_text(json.dumps([{'hash': 'old', 'first_iter': 1, 'fixed_iter': 2}]), encoding='utf-8')
+    assert [r['hash'] for r in check_regressions([{'hash': 'old', 'abstract': 'a'}], str(path))] == ['old']
+    assert json.loads(path.read_text(encoding='utf-8').splitlines()[0])['op'] == 'add'
+    assert (tmp_path / 'history.json.migrated').exists() and not (tmp_path / 'history.jsonl').exists()
@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from agents import tester
+from agents.async_llm import AsyncLLMDispatcher
+from agents.failure_analysis import analyze_failures, error_type_of, parse_response
+
+
+def _failures(n):
+    return [{'hash': f'{i:064x}', 'case': f'def test_{i}():\n    assert False', 'exception': 'AssertionError'}
+            for i in range(n)]
+
+
+def _reply_for(prompt):
+    hashes = [line.split(': ', 1)[1] for line in prompt.splitlines() if line.startswith('### hash: ')]
+    return json.dumps([{'hash': h, 'abstract': f'abs {h[-2:]}', 'diagnosis': 'fix it'} for h in hashes])
+
+
+def test_parse_tolerates_noise():
+    hashes = ['a' * 64, 'b' * 64]
+    text = ('<think>hmm [not json]</think>Sure:\n```json\n'
+            '[{"hash": "aaaaaaaa", "abstract": "first", "diagnosis": "d1"},'
+            ' {"hash": "' + 'b' * 64 + '", "abstract": "second", "diagnosis": {"fix": "x"}}]\n```')
+    parsed = parse_response(text, hashes)
+    assert parsed['a' * 64] == {'abstract': 'first', 'diagnosis': 'd1'}  # 截断哈希按前缀匹配
+    assert parsed['b' * 64]['abstract'] == 'second'
+    assert parse_response('not json at all', hashes) == {}
+    assert parse_response('{"results": [{"abstract": "x"}]}', ['c' * 64]) == {'c' * 64: {'abstract': 'x',
+                                                                                         'diagnosis': ''}}
+
+
+def test_one_call_per_batch_with_fallback():
+    calls = []
+
+    def generate(model, prompt, options):
+        calls.append(prompt)
+        reply = json.loads(_reply_for(prompt))
+        return {'response': json.dumps(reply[:-1])}  # 漏掉最后一条
+
+    failures = _failures(3) + _failures(1)  # 重复的 hash 只分析一次
+    with patch('agents.async_llm.ollama.generate', side_effect=generate):
+        results = analyze_failures(failures, 'm', batch_size=8, dispatcher=AsyncLLMDispatcher())
+    assert len(calls) == 1
+    assert [r['abstract'] for r in results] == ['abs 00', 'abs 01', 'AssertionError in test case', 'abs 00']
+
+
+def test_batches_run_concurrently(monkeypatch):
+    from agents.scheduler import CapacityScheduler
+    monkeypatch.setattr('agents.scheduler._scheduler', CapacityScheduler({'ollama': 4}))
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def generate(model, prompt, options):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return {'response': _reply_for(prompt)}
+
+    with patch('agents.async_llm.ollama.generate', side_effect=generate):
+        start = time.perf_counter()
+        results = analyze_failures(_failures(8), 'm', batch_size=2, dispatcher=AsyncLLMDispatcher(4))
+        elapsed = time.perf_counter() - start
+    assert peak[0] == 4
+    assert elapsed < 0.6
+    assert all(r['diagnosis'] == 'fix it' for r in results)
+
+
+def test_fingerprint_is_llm_free():
+    with patch('agents.tester.ollama.generate', side_effect=AssertionError('no LLM calls')):
+        assert tester.compute_error_fingerprint('ValueError', 'boom', 'x = 1') == \
+            tester.compute_error_fingerprint('ValueError', 'boom', 'x = 1')
+
+
+def test_error_type_of():
+    assert error_type_of('ValueError: bad') == 'ValueError'
+    assert error_type_of('Traceback (most recent call last):\n  File "x", line 1\nKeyError: 1') == 'KeyError'
+    assert error_type_of('boom') == 'Unknown'
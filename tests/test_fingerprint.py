@@ -0,0 +1,59 @@
+from agents.fingerprint import (cluster_failures, cluster_key, fingerprint, message_template, normalize_traceback,
+                                parse_traceback)
+
+CASE = 'def test_div():\n    assert div(4, 0) == 0'
+
+
+def _traceback(tmp_dir, line, address='0x7f3a2c1b9e80', case_file='case_3.py', value=4):
+    return (f'Traceback (most recent call last):\n'
+            f'  File "{case_file}", line 2, in test_div\n'
+            f'  File "/tmp/{tmp_dir}/src.py", line {line}, in div\n'
+            f'    return helper(a) / b\n'
+            f'ZeroDivisionError: division by zero ({value} at <object at {address}>)')
+
+
+def test_fingerprint_ignores_paths_lines_and_addresses():
+    first = fingerprint(_traceback('sandbox_a1', 3), CASE)
+    second = fingerprint(_traceback('sandbox_zz', 17, '0x55d1', 'case_0.py', value=9), CASE)
+    assert first == second
+    assert len(first) == 64
+    assert fingerprint(_traceback('x', 3), 'def test_other():\n    assert div(1, 0) == 0') != first
+
+
+def test_fingerprint_keys_on_type_and_innermost_function():
+    other_func = _traceback('x', 3).replace('in div', 'in mod')
+    other_type = _traceback('x', 3).replace('ZeroDivisionError', 'ValueError')
+    base = fingerprint(_traceback('x', 3), CASE)
+    assert fingerprint(other_func, CASE) != base
+    assert fingerprint(other_type, CASE) != base
+    # 用例中空白/注释不影响
+    assert fingerprint(_traceback('x', 3), 'def test_div():  # c\n    assert div(4,0)==0') == base
+
+
+def test_parse_chained_and_syntax_errors():
+    chained = ('Traceback (most recent call last):\n  File "a.py", line 1, in f\nKeyError: 1\n\n'
+               'During handling of the above exception, another exception occurred:\n\n'
+               'Traceback (most recent call last):\n  File "/tmp/x/temp_ab12cd.py", line 9, in g\nValueError: bad')
+    parsed = parse_traceback(chained)
+    assert parsed == {'type': 'ValueError', 'message': 'bad', 'frames': [('temp.py', 'g')]}
+    syntax = '  File "src.py", line 1\n    def add(a, b: return a\n               ^\nSyntaxError: invalid syntax'
+    assert parse_traceback(syntax)['type'] == 'SyntaxError'
+    assert fingerprint('TimeoutError: Execution exceeded timeout', CASE) == \
+        fingerprint('TimeoutError: Execution exceeded timeout', CASE)
+
+
+def test_normalize_and_template():
+    text = normalize_traceback(_traceback('sandbox_a1', 3))
+    assert '/tmp/' not in text and 'line N' in text and '0x?' in text and 'case.py' in text
+    assert message_template("index 5 out of range for 'abc' at 0xdeadbeef") == 'index <n> out of range for <s> at <addr>'
+
+
+def test_cluster_groups_near_duplicates_across_cases():
+    failures = [
+        {'exception': 'Traceback (most recent call last):\n  File "src.py", line 3, in get\nIndexError: index 5'},
+        {'exception': 'Traceback (most recent call last):\n  File "src.py", line 8, in get\nIndexError: index 12'},
+        {'exception': 'Traceback (most recent call last):\n  File "src.py", line 3, in put\nIndexError: index 5'},
+    ]
+    clusters = cluster_failures(failures)
+    assert [len(group) for group in clusters.values()] == [2, 1]
+    assert cluster_key(failures[0]['exception']) == cluster_key(failures[1]['exception'])
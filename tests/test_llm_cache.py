@@ -0,0 +1,47 @@
+from unittest.mock import patch, MagicMock
+from agents.llm_cache import LLMResponseCache
+from agents.local_llm_agent import LocalLLMAgent
+from core.utils import LLMClient
+
+CLOUD_CONFIG = {'api_key': 'k', 'model': 'm', 'base_url': 'http://127.0.0.1:9', 'path': '/v1/chat/completions'}
+
+
+def test_ttl_and_eviction(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm.sqlite'), ttl_sec=10, max_entries=2)
+    with patch('agents.llm_cache.time.time', return_value=1000.0):
+        cache.put('a', 'A')
+        cache.put('b', 'B')
+    with patch('agents.llm_cache.time.time', return_value=1005.0):
+        assert cache.get('a') == 'A'
+        cache.put('c', 'C')  # 超出上限，淘汰最久未用的 b
+        assert cache.get('b') is None
+    with patch('agents.llm_cache.time.time', return_value=1020.0):
+        assert cache.get('a') is None  # 已过期
+    assert cache.stats()['hits'] == 1
+
+
+def test_bypass_nonzero_temperature(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm.sqlite'), bypass_nonzero_temperature=True)
+    assert cache.applies_to(0)
+    assert not cache.applies_to(0.2)
+
+
+def test_llm_client_replays_cached_response(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm.sqlite'))
+    client = LLMClient(CLOUD_CONFIG, cache=cache)
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'choices': [{'message': {'content': 'def add(a, b): return a + b'}}]}
+    with patch.object(client.session, 'post', return_value=response) as post:
+        first = client.generate('prompt', 0.2)
+        second = client.generate('prompt', 0.2)
+        third = client.generate('prompt', 0.2, max_tokens=100)  # 不同参数不命中
+    assert first == second == third
+    assert post.call_count == 2
+
+
+def test_local_agent_uses_cache(tmp_path):
+    agent = LocalLLMAgent(cache=LLMResponseCache(str(tmp_path / 'llm.sqlite')))
+    with patch('agents.local_llm_agent.ollama.generate', return_value={'response': ' ok '}) as gen:
+        assert agent.generate('p') == 'ok'
+        assert agent.generate('p') == 'ok'
+    assert gen.call_count == 1
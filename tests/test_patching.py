@@ -0,0 +1,62 @@
+import pytest
+
+from agents.preflight import strip_code_fences
+from core.patching import PatchError, apply_function_replacements, apply_patch_response, apply_unified_diff
+
+SOURCE = '''import math
+
+
+def add(a, b):
+    return a - b
+
+
+def area(r):
+    return math.pi * r * r
+
+
+LIMIT = 10
+'''
+
+
+def test_unified_diff_with_shifted_line_numbers():
+    diff = '''--- a/src.py
++++ b/src.py
+@@ -2,4 +2,4 @@
+
+
+ def add(a, b):
+-    return a - b
++    return a + b
+'''
+    patched = apply_unified_diff(SOURCE, diff)
+    assert 'return a + b' in patched and 'return a - b' not in patched
+    assert patched.count('def area') == 1
+    with pytest.raises(PatchError):
+        apply_unified_diff(SOURCE, '@@ -1,2 +1,2 @@\n def nope():\n-    pass\n+    return 1\n')
+
+
+def test_function_replacement_adds_imports_and_new_defs():
+    block = 'import operator\n\ndef add(a, b):\n    return operator.add(a, b)\n\ndef sub(a, b):\n    return a - b\n'
+    patched = apply_function_replacements(SOURCE, [block])
+    assert patched.startswith('import math\nimport operator\n')
+    assert 'operator.add' in patched and 'return a - b\n\n\ndef area' not in patched
+    assert patched.rstrip().endswith('return a - b')  # 新函数追加到末尾
+    assert 'LIMIT = 10' in patched
+
+
+def test_patch_response_validation():
+    patched, kind = apply_patch_response(SOURCE, 'Here:\n```python\ndef add(a, b):\n    return a + b\n```')
+    assert kind == 'functions' and 'return a + b' in patched
+    patched, kind = apply_patch_response(SOURCE, '```diff\n@@ -12 +12 @@\n-LIMIT = 10\n+LIMIT = 20\n```')
+    assert kind == 'diff' and 'LIMIT = 20' in patched
+    with pytest.raises(PatchError):  # 删除了已有定义
+        apply_patch_response(SOURCE, '```diff\n@@ -8,3 +8,0 @@\n-def area(r):\n-    return math.pi * r * r\n-\n```')
+    with pytest.raises(PatchError):  # 应用后语法错误
+        apply_patch_response(SOURCE, '```python\ndef add(a, b):\n    return (a +\n```')
+    with pytest.raises(PatchError):
+        apply_patch_response(SOURCE, 'I cannot help with that.\n```text\nnope\n```')
+
+
+def test_strip_code_fences():
+    assert strip_code_fences('```python\nx = 1\n```\nexplanation') == 'x = 1'
+    assert strip_code_fences('x = 1\n') == 'x = 1'
@@ -0,0 +1,105 @@
+from unittest.mock import patch
+
+from agents.preflight import PREFLIGHT_CASE, check_code, interface_names, strip_code_fences
+from agents.tester import run_pytest_cases
+
+SRS = '''## 接口签名
+- `def add(a: int, b: int) -> int`
+- `class Stack:` 提供 `def push(self, item)` 与 `def __init__(self)`
+- 这个 class that 不应被当作接口名
+
+```python
+def test_add():
+    def helper():
+        return 1
+    assert add(1, 2) == 3
+```
+'''
+
+
+def test_interface_names_skip_test_blocks():
+    assert interface_names(SRS) == ['add', 'push', 'Stack']
+
+
+def test_interface_names_ignore_prose():
+    srs = '''## 1. 原始需求
+用户会调用 def helper(x) 处理数据，或者 `def parse(text)` 之类的函数。
+
+## 2. 接口签名设计
+采用类 `Todo` 封装，定义如下：
+
+```python
+class Todo:
+    def add(self, content: str) -> int:
+        # 不是标题
+        ...
+```
+### 2.1 删除
+- `def remove(todo_id)`
+
+## 3. 验收用例
+`def internal()` 不在接口章节内。
+```python
+import pytest
+
+@pytest.fixture
+def todo():
+    return Todo()
+```
+'''
+    assert interface_names(srs) == ['add', 'remove', 'Todo']
+
+
+def test_strip_code_fences():
+    assert strip_code_fences('<think>x</think>\n```python\ndef f():\n    pass\n```\n说明') == 'def f():\n    pass'
+    assert strip_code_fences('def f():\n    pass\n') == 'def f():\n    pass'
+    two = '```python\nimport math\n```\n然后：\n```python\ndef f():\n    return math.pi\n```\n```bash\npip install x\n```'
+    assert strip_code_fences(two) == 'import math\n\ndef f():\n    return math.pi'
+    assert strip_code_fences('```text\nonly\n```') == 'only'
+    echoed = '```python\ndef add(a, b):\n    return a + b\n```\n```python\ndef test_add():\n    assert add(1, 2) == 3\n```'
+    assert strip_code_fences(echoed) == 'def add(a, b):\n    return a + b'  # 回显的验收用例不进源码
+
+
+def test_check_code():
+    good = '''
+import math
+LIMIT = 3
+
+def add(a, b):
+    global TOTAL
+    TOTAL = a + b
+    return [math.floor(x) for x in (a, b)] + [TOTAL, LIMIT]
+
+class Stack:
+    size = 0
+    doubled = size * 2
+
+    def push(self, item):
+        return super().__init__() or item
+'''
+    assert check_code(good, ['add', 'push', 'Stack']) is None
+    assert 'SyntaxError' in check_code('def add(a, b:\n    return a + b')
+    undefined = check_code('def add(a, b):\n    return helper(a) + b\n')
+    assert undefined.startswith("NameError: name 'helper' is not defined")
+    assert check_code('def add(a, b):\n    return helper(a)\n', undefined_names=False) is None
+    assert check_code('from math import *\nx = floor(1.5)\n') is None  # 星号导入无法判断，跳过
+    assert 'Stack' in check_code('def add(a, b):\n    return a + b\n', ['add', 'Stack'])
+
+
+def test_preflight_failure_skips_sandbox(tmp_path):
+    cases = [f'def test_{i}():\n    assert add(1, 2) == 3' for i in range(5)]
+    with patch('agents.tester._execute_cases') as execute, patch('agents.tester.analyze_failures') as analyze:
+        errors = run_pytest_cases(cases, 'def add(a, b:\n    return a + b', str(tmp_path))
+    assert not execute.called and not analyze.called
+    assert len(errors) == 1 and errors[0]['case'] == PREFLIGHT_CASE
+    assert 'SyntaxError' in errors[0]['exception'] and errors[0]['abstract'].startswith('Preflight')
+
+    with patch('agents.tester._execute_cases') as execute:
+        errors = run_pytest_cases(cases, 'def add(a, b):\n    return a + b', str(tmp_path), required_names=['mul'])
+    assert not execute.called and 'ImportError' in errors[0]['exception']
+
+
+def test_fenced_code_is_stripped_before_running(tmp_path):
+    cases = ['def test_add():\n    assert add(1, 2) == 3', PREFLIGHT_CASE]
+    fenced = f'```python\ndef add(a, b):\n    return a + b  # {tmp_path}\n```'
+    assert run_pytest_cases(cases, fenced, str(tmp_path)) == []
@@ -0,0 +1,65 @@
+import json
+
+from agents.prompt_builder import (PromptBuilder, UsageTracker, compact_error_book, estimate_tokens,
+                                   record_ollama_usage, truncate_to_tokens)
+
+
+def test_estimate_and_truncate():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('错误账本') == 4
+    text = 'x' * 4000
+    assert estimate_tokens(truncate_to_tokens(text, 100)) <= 100
+    tail = truncate_to_tokens('head ' * 200 + 'ZeroDivisionError: division by zero', 30, keep='tail')
+    assert tail.endswith('ZeroDivisionError: division by zero')
+    middle = truncate_to_tokens('START' + 'y' * 4000 + 'END', 50, keep='middle')
+    assert middle.startswith('START') and middle.endswith('END')
+
+
+def test_compact_error_book_dedupes_and_keeps_active_entries_in_full():
+    case = 'def test_div():\n    assert div(1, 0) == 0'
+    entries = (
+        [{'hash': f'fixed{i:04d}', 'first_iter': i, 'fixed_iter': i + 1, 'abstract': 'old bug ' * 30, 'case': 'x' * 500}
+         for i in range(200)]
+        + [{'hash': 'open', 'first_iter': 5, 'fixed_iter': None, 'abstract': 'open bug', 'case': case}] * 3
+        + [{'hash': 'back', 'first_iter': 1, 'fixed_iter': 2, 'abstract': 'was fixed', 'case': 'c1'},
+           {'hash': 'back', 'first_iter': 6, 'fixed_iter': None, 'abstract': 'came back', 'case': 'c2'}]
+    )
+    compacted = compact_error_book(entries, max_tokens=1500)
+    assert estimate_tokens(json.dumps(compacted, ensure_ascii=False)) <= 1500
+    assert [e['status'] for e in compacted[:2]] == ['regressed', 'open']
+    assert compacted[0]['abstract'] == 'came back' and compacted[0]['occurrences'] == 2
+    assert compacted[1]['case'] == case and compacted[1]['occurrences'] == 3
+    fixed = [e for e in compacted if e['status'] == 'fixed']
+    assert fixed and 'case' not in fixed[0] and len(fixed[0]['abstract']) <= 83
+    assert fixed[0]['fixed_iter'] == 200  # 最近修复的优先保留
+    assert compacted[-1] == {'status': 'omitted', 'count': 200 - len(fixed)}
+
+
+def test_compact_error_book_marks_explicit_regressions():
+    entries = [{'hash': 'abc', 'first_iter': 1, 'fixed_iter': 2, 'abstract': 'a', 'case': 'c'}]
+    assert compact_error_book(entries)[0]['status'] == 'fixed'
+    assert compact_error_book(entries, regression_hashes={'abc'})[0]['status'] == 'regressed'
+
+
+def test_prompt_builder_shrinks_lowest_priority_first():
+    srs = 'S' * 4000
+    ledger = 'L' * 4000
+    builder = PromptBuilder(1500)
+    builder.add(srs, name='srs', priority=2, shrink=lambda n: truncate_to_tokens(srs, n))
+    builder.add(ledger, name='ledger', priority=1, shrink=lambda n: truncate_to_tokens(ledger, n))
+    builder.add('INSTRUCTION', name='instruction')
+    prompt = builder.build()
+    assert builder.report['tokens'] <= 1500
+    assert builder.report['sections']['srs'] == 1000  # 账本压缩后已够，SRS 不动
+    assert prompt.startswith(srs) and prompt.endswith('INSTRUCTION')
+
+
+def test_usage_tracker_and_ollama_usage(monkeypatch):
+    tracker = UsageTracker()
+    monkeypatch.setattr('agents.prompt_builder._tracker', tracker)
+    assert record_ollama_usage({'response': 'ok', 'prompt_eval_count': 12, 'eval_count': 3}, 'p', 'ok') == \
+        {'prompt_tokens': 12, 'completion_tokens': 3, 'estimated': False}
+    assert record_ollama_usage({'response': 'ok'}, 'abcdefgh', 'ok')['estimated'] is True
+    assert tracker.totals()['ollama'] == {'calls': 2, 'prompt_tokens': 14, 'completion_tokens': 4,
+                                          'estimated_calls': 1}
@@ -0,0 +1,49 @@
+from unittest.mock import patch
+from agents.result_cache import CaseResultCache
+from agents.tester import run_pytest_cases
+
+
+def test_lru_eviction_and_counters(tmp_path):
+    cache = CaseResultCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    cache.put_many({'a': None, 'b': 'AssertionError'})
+    assert cache.get_many(['a', 'x']) == {'a': None}  # 刷新 a 的使用时间
+    cache.put_many({'c': None})  # 淘汰最久未用的 b
+    assert cache.get_many(['a', 'b', 'c']) == {'a': None, 'c': None}
+    assert cache.stats() == {'hits': 3, 'misses': 2, 'entries': 2}
+
+    cache.put_many({'t': 'TimeoutError: Execution exceeded timeout'})  # 不确定结果不缓存
+    assert cache.get_many(['t']) == {}
+
+
+def test_key_depends_on_code_case_and_config():
+    key = CaseResultCache.make_key('code', 'case', {'timeout_sec': 10})
+    assert key != CaseResultCache.make_key('code2', 'case', {'timeout_sec': 10})
+    assert key != CaseResultCache.make_key('code', 'case2', {'timeout_sec': 10})
+    assert key != CaseResultCache.make_key('code', 'case', {'timeout_sec': 5})
+
+
+def test_run_pytest_cases_skips_sandbox_on_hit(tmp_path):
+    cache = CaseResultCache(str(tmp_path / 'cache.sqlite'))
+    cases = ['def test_add():\n    assert add(1,2) == 3', 'def test_bad():\n    assert add(1,2) == 4']
+    code = 'def add(a,b): return a + b'
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')):
+        first = run_pytest_cases(cases, code, str(tmp_path), cache=cache)
+        with patch('agents.tester.run_in_sandbox') as sandbox:
+            second = run_pytest_cases(cases, code, str(tmp_path), cache=cache)
+            sandbox.assert_not_called()
+    assert [e['exception'] for e in second] == [e['exception'] for e in first]
+    assert len(second) == 1
+
+
+def test_sandbox_failures_are_not_cached(tmp_path):
+    cache = CaseResultCache(str(tmp_path / 'cache.sqlite'))
+    cases = ['def test_add():\n    assert add(1,2) == 3']
+    code = 'def add(a,b): return a + b'
+    broken = {'stdout': '', 'stderr': '', 'returncode': -1, 'exception': 'No space left on device'}
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')):
+        with patch('agents.tester.run_in_sandbox', return_value=broken):
+            first = run_pytest_cases(cases, code, str(tmp_path), cache=cache)
+        assert first and 'No space left on device' in first[0]['exception']
+        assert cache.stats()['entries'] == 0  # 沙箱自身的失败不是用例结果
+        second = run_pytest_cases(cases, code, str(tmp_path), cache=cache)
+    assert second == []
@@ -22,4 +22,150 @@ def test_network_block():  # 手动检查，预期失败
 
 def test_file_write_block():
     result = run_in_sandbox('with open("test.txt", "w") as f: f.write("test")')
-    assert 'PermissionError' in result['exception'] or result['returncode'] == 0  # umask 限制
\ No newline at end of file
+    assert 'PermissionError' in result['exception'] or result['returncode'] == 0  # umask 限制
+
+def test_pool_isolation_and_recycle(tmp_path):
+    from agents.sandbox_pool import SandboxPool
+    pool = SandboxPool(size=1, max_runs_per_worker=2, max_memory_mb=100)
+    try:
+        first = pool.run('import sys; sys.leaked = 1; print("ok")', str(tmp_path), timeout_sec=5)
+        assert first['stdout'].strip() == 'ok'
+        assert first['exception'] is None
+        # fork 出的子进程互不影响：上一次设置的属性不可见
+        second = pool.run('import sys; print(hasattr(sys, "leaked"))', timeout_sec=5)
+        assert second['stdout'].strip() == 'False'
+        worker = pool._idle[0]
+        assert worker.runs == 0  # 达到 max_runs_per_worker 后已回收重建
+    finally:
+        pool.shutdown()
+
+
+def test_pool_error_and_timeout(tmp_path):
+    from agents.sandbox_pool import SandboxPool
+    pool = SandboxPool(size=1, max_runs_per_worker=10)
+    try:
+        result = pool.run('def f():\n    raise ValueError("bad")\nf()', str(tmp_path), timeout_sec=5)
+        assert result['returncode'] == 1
+        assert 'ValueError: bad' in result['exception']
+        assert 'temp.py' in result['exception']
+        result = pool.run('import time; time.sleep(5)', timeout_sec=0.5)
+        assert 'TimeoutError' in result['exception']
+    finally:
+        pool.shutdown()
+
+
+def test_memory_limit_enforced(monkeypatch):
+    import agents.sandbox as sandbox
+    code = 'data = bytearray(512 * 1024 * 1024)'  # 远超 max_memory_mb
+    for use_pool in (True, False):
+        monkeypatch.setitem(sandbox.POOL_CONFIG, 'enabled', use_pool)
+        result = run_in_sandbox(code, timeout_sec=5)
+        assert result['exception'] == 'MemoryError: Exceeded max memory'
+        assert result['returncode'] != 0
+
+
+def test_cpu_limit_enforced(monkeypatch):
+    import agents.sandbox as sandbox
+    from agents.resource_limits import rlimits_supported
+    if not rlimits_supported():
+        pytest.skip('RLIMIT_CPU requires POSIX')
+    monkeypatch.setitem(sandbox.POOL_CONFIG, 'enabled', False)
+    # 忽略 SIGTERM 的忙循环：墙钟超时无法终止，由内核 CPU 上限兜底
+    code = 'import signal\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\nwhile True: pass'
+    result = run_in_sandbox(code, timeout_sec=1)
+    assert 'TimeoutError' in result['exception']
+
+
+def test_cold_path_sets_limits_in_child(monkeypatch):
+    import subprocess
+    import sys
+    import agents.sandbox as sandbox
+    from agents.resource_limits import rlimits_supported
+    if not rlimits_supported():
+        pytest.skip('rlimits are POSIX-only')
+    monkeypatch.setitem(sandbox.POOL_CONFIG, 'enabled', False)
+    calls = []
+    real_popen = subprocess.Popen
+
+    def popen(cmd, **kwargs):
+        calls.append((cmd, kwargs))
+        return real_popen(cmd, **kwargs)
+
+    monkeypatch.setattr(sandbox.subprocess, 'Popen', popen)
+    code = ('import os, resource, sys\n'
+            'print(resource.getrlimit(resource.RLIMIT_AS)[0], resource.getrlimit(resource.RLIMIT_CPU)[0], '
+            'os.getsid(0) == os.getpid(), os.getpriority(os.PRIO_PROCESS, 0), '
+            '__name__, os.path.basename(sys.argv[0]))')
+    result = run_in_sandbox(code, timeout_sec=5)
+    assert result['exception'] is None, result['exception']
+    cmd, kwargs = calls[0]
+    assert cmd[:2] == [sys.executable, sandbox.LAUNCHER_SCRIPT]  # 上限由启动器在被测代码之前设置
+    assert 'preexec_fn' not in kwargs and kwargs['start_new_session'] is True
+    memory, cpu, session_leader, niceness, name, script = result['stdout'].split()
+    assert int(memory) == sandbox.MAX_MEMORY_MB * 1024 * 1024 and int(cpu) == 6
+    assert session_leader == 'True' and int(niceness) >= 10
+    assert name == '__main__' and script == 'temp.py'
+
+
+def test_concurrent_calls_keep_parent_state(tmp_path, monkeypatch):
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    import agents.sandbox as sandbox
+    code = ('import os, sys\n'
+            'token = {token!r}\n'
+            'with open("out.txt", "w") as f:\n'
+            '    f.write(token)\n'
+            'mask = os.umask(0)\n'
+            'print(token, os.getcwd(), oct(mask), open("out.txt").read() == token)')
+    cwd = os.getcwd()
+    mask = os.umask(0o022)
+    os.umask(mask)
+    for use_pool in (True, False):
+        monkeypatch.setitem(sandbox.POOL_CONFIG, 'enabled', use_pool)
+
+        def call(i):
+            src_dir = None
+            if i % 2:  # 一半指定工作目录，一半用池中的工作区
+                src_dir = str(tmp_path / f'{use_pool}_{i}')
+                os.makedirs(src_dir, exist_ok=True)
+            result = run_in_sandbox(code.format(token=f'run{i}'), src_dir, timeout_sec=10)
+            return i, src_dir, result
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(call, range(48)))
+        for i, src_dir, result in results:
+            assert result['exception'] is None, result['exception']
+            token, child_cwd, child_mask, wrote = result['stdout'].split()
+            assert token == f'run{i}' and wrote == 'True'
+            assert child_mask == oct(sandbox.SANDBOX_UMASK)
+            if src_dir:
+                assert os.path.realpath(child_cwd) == os.path.realpath(src_dir)
+        assert os.getcwd() == cwd
+        assert os.umask(mask) == mask  # 调用方进程的 umask 未被改动
+    assert sandbox.get_workspaces().stats()['created'] <= 16 + 1  # 工作区复用，而非每次新建
+
+
+def test_pool_spawns_workers_outside_lock(monkeypatch):
+    import agents.sandbox_pool as sandbox_pool
+    pool = sandbox_pool.SandboxPool(size=2, max_runs_per_worker=1)
+    spawned = []
+
+    class _FakeWorker:
+        def __init__(self, workspace_root=None):
+            assert not pool._lock.locked()  # 启动进程时不持锁，其他取用/归还不被阻塞
+            spawned.append(self)
+            self.runs = 0
+
+        def alive(self):
+            return True
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(sandbox_pool, '_Worker', _FakeWorker)
+    pool.warm()
+    worker = pool._acquire()
+    worker.runs = 1  # 达到 max_runs_per_worker，归还时回收并补一个
+    pool._release(worker)
+    assert len(spawned) == 3 and len(pool._idle) == 2
+    pool.shutdown()
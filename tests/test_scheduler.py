@@ -0,0 +1,31 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.scheduler import CapacityScheduler
+
+
+def test_limits_are_independent_and_reentrant():
+    scheduler = CapacityScheduler({'cloud': 2, 'sandbox': 3, 'ollama': None})
+    active = {'cloud': 0, 'sandbox': 0}
+    peak = {'cloud': 0, 'sandbox': 0}
+    lock = threading.Lock()
+
+    def work(resource):
+        with scheduler.slot(resource):
+            with scheduler.slot(resource):  # 嵌套不额外占名额，也不会死锁
+                with lock:
+                    active[resource] += 1
+                    peak[resource] = max(peak[resource], active[resource])
+                time.sleep(0.05)
+                with lock:
+                    active[resource] -= 1
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        list(executor.map(work, ['cloud'] * 6 + ['sandbox'] * 6))
+    assert peak == {'cloud': 2, 'sandbox': 3}
+    stats = scheduler.stats()
+    assert stats['cloud']['acquired'] == 6 and stats['cloud']['peak'] == 2
+    assert 'ollama' not in stats  # 未配置上限的资源不限制
+    with scheduler.slot('ollama'):
+        pass
@@ -0,0 +1,66 @@
+import logging
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from agents import settings
+from agents.settings import LazyModule, apply_env_overrides, get_settings, lazy_import, load_settings
+
+
+def test_env_overrides_parse_yaml_scalars():
+    config = {'sandbox': {'timeout_sec': 10, 'runner': 'batch'}}
+    environ = {'AUTOCODE__SANDBOX__TIMEOUT_SEC': '20', 'AUTOCODE__SANDBOX__RUNNER': 'isolated',
+               'AUTOCODE__SPECULATION__TEMPERATURES': '[0.1, 0.9]', 'OTHER': 'x'}
+    apply_env_overrides(config, environ)
+    assert config['sandbox'] == {'timeout_sec': 20, 'runner': 'isolated'}
+    assert config['speculation'] == {'temperatures': [0.1, 0.9]}
+    assert 'other' not in config
+
+
+def test_get_settings_cached_per_path(tmp_path):
+    path = tmp_path / 'config.yaml'
+    path.write_text('agent:\n  max_iterations: 3\n', encoding='utf-8')
+    first = get_settings(str(path))
+    path.write_text('agent:\n  max_iterations: 9\n', encoding='utf-8')
+    assert get_settings(str(path)) is first
+    assert first['agent']['max_iterations'] == 3
+    assert load_settings(str(path), environ={})['agent']['max_iterations'] == 9
+    assert get_settings('config/config.yaml') is get_settings()
+
+
+def test_standin_url_redirects_clients(tmp_path):
+    path = tmp_path / 'config.yaml'
+    path.write_text('cloud_llm:\n  base_url: https://api.example.com\n  path: /v1/chat/completions\n'
+                    'standin:\n  url: null\n', encoding='utf-8')
+    with patch.dict(os.environ, {}, clear=False):
+        os.environ.pop('OLLAMA_HOST', None)
+        assert load_settings(str(path), environ={})['cloud_llm']['base_url'] == 'https://api.example.com'
+        assert 'OLLAMA_HOST' not in os.environ
+        config = load_settings(str(path), environ={'AUTOCODE__STANDIN__URL': 'http://127.0.0.1:11500/'})
+        assert config['cloud_llm']['base_url'] == 'http://127.0.0.1:11500'
+        assert os.environ['OLLAMA_HOST'] == 'http://127.0.0.1:11500'
+
+
+def test_lazy_module_defers_import_and_supports_patch():
+    module = LazyModule('json')
+    assert module._module is None
+    with patch.object(module, 'dumps', return_value='patched'):
+        assert module.dumps({}) == 'patched'
+    assert module.dumps({}) == '{}'
+    assert lazy_import('sys') is sys
+    with pytest.raises(ImportError):
+        lazy_import('autocode_missing_module')
+
+
+def test_setup_logging_runs_once():
+    root = logging.getLogger()
+    level = root.level
+    with patch.object(settings, '_logging_configured', False), \
+            patch('logging.config.fileConfig') as file_config:
+        settings.setup_logging(level='debug')
+        settings.setup_logging()
+        assert file_config.call_count == 1
+        assert root.level == logging.DEBUG
+    root.setLevel(level)
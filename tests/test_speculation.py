@@ -0,0 +1,54 @@
+import threading
+import time
+
+from core.speculation import best_candidate, candidate_variants, race_candidates
+
+
+def test_candidate_variants_spread_temperatures_and_hints():
+    variants = candidate_variants(4, [0.2, 0.8])
+    assert [v['temperature'] for v in variants] == [0.2, 0.8, 0.2, 0.8]
+    assert variants[0]['hint'] == '' and len({v['hint'] for v in variants}) == 4
+    assert {v['hint'] for v in candidate_variants(3, [0.2], vary_prompts=False)} == {''}
+
+
+def test_first_passing_candidate_wins_and_losers_are_cancelled():
+    loser_saw_cancel = threading.Event()
+
+    def generate(variant, cancel):
+        return f"code-{variant['index']}"
+
+    def evaluate(code, cancel):
+        if code == 'code-1':
+            time.sleep(0.1)
+            return []
+        if code == 'code-0':
+            return [{'hash': 'h0'}]
+        # 慢候选：在测试中途收到取消信号
+        cancel.wait(timeout=5)
+        loser_saw_cancel.set()
+        return [{'hash': 'partial'}]
+
+    start = time.perf_counter()
+    winner, candidates = race_candidates(candidate_variants(3, [0.2, 0.5, 0.8]), generate, evaluate)
+    assert time.perf_counter() - start < 2
+    assert winner['index'] == 1 and winner['code'] == 'code-1'
+    assert [c['status'] for c in candidates] == ['failed', 'passed', 'cancelled']
+    assert loser_saw_cancel.is_set()
+    assert candidates[2]['errors'] == [{'hash': 'partial'}]  # 被取消候选的部分失败仍返回给调用方
+
+
+def test_no_winner_picks_fewest_failures():
+    failures = {0: 3, 1: 1, 2: 2}
+
+    def generate(variant, cancel):
+        if variant['index'] == 2:
+            raise RuntimeError('api down')
+        return variant['index']
+
+    def evaluate(code, cancel):
+        return [{'hash': f'{code}-{i}'} for i in range(failures[code])]
+
+    winner, candidates = race_candidates(candidate_variants(3, [0.2]), generate, evaluate)
+    assert winner is None
+    assert [c['status'] for c in candidates] == ['failed', 'failed', 'error']
+    assert best_candidate(candidates)['index'] == 1
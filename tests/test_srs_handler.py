@@ -15,4 +15,24 @@ def test_add():
     content = load_srs(str(tmp_path))
     assert "Req1" in content
     parsed = parse_srs(content)
-    assert len(parsed['test_cases']) == 1
\ No newline at end of file
+    assert len(parsed['test_cases']) == 1
+
+def test_parse_keeps_parametrized_and_fixture_blocks():
+    content = """## 验收用例
+```python
+import pytest
+
+@pytest.fixture
+def stack():
+    return []
+```
+```python
+@pytest.mark.parametrize("a, b", [(1, 2)])
+def test_add(a, b):
+    assert add(a, b) == 3
+```
+```python
+class Helper:
+    pass
+```"""
+    assert [case.split('\n')[0] for case in parse_srs(content)['test_cases']] == ['import pytest', '@pytest.mark.parametrize("a, b", [(1, 2)])']
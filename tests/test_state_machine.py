@@ -1,3 +1,4 @@
+import os
 from core.state_machine import IterationState
 from unittest.mock import patch
 
@@ -10,7 +11,7 @@ def test_run_iteration_pass(tmp_path):
 
             with patch('core.state_machine.run_pytest_cases', return_value=[]):  # Mock 无错误
                 with patch('core.state_machine.check_regressions', return_value=[]):
-                    with patch('core.state_machine.subprocess.run') as mock_run:  # Mock subprocess 以避免 report 错误
+                    with patch('core.state_machine.write_html_report') as mock_run:  # Mock 报告生成以避免 report 错误
                         mock_run.return_value = None
                         assert state.run_iteration("mock_code") is True
                     assert state.state.name == "PASS"
@@ -26,4 +27,137 @@ def test_run_iteration_fail(tmp_path):
             with patch('core.state_machine.run_pytest_cases', return_value=mock_errors):  # Mock 有单一错误
                 with patch('core.state_machine.check_regressions', return_value=[]):
                     with patch('core.state_machine.micro_fix', return_value=("mock_fixed_code", False)):  # Mock 无修复
-                        assert state.run_iteration("mock_code") is False
\ No newline at end of file
+                        assert state.run_iteration("mock_code") is False
+
+def test_error_book_shared_across_iterations(tmp_path):
+    from agents.error_book import load_error_history
+    project_dir = str(tmp_path)
+    with patch('core.state_machine.load_srs', return_value="Mock SRS"), patch('core.state_machine.CodeGenerator'):
+        state = IterationState(project_dir)
+    state.transition_to_coding()
+    state.fail_fast = False
+    err_a = {'hash': 'a', 'abstract': 'A', 'case': 'c', 'exception': 'AssertionError'}
+    err_b = {'hash': 'b', 'abstract': 'B', 'case': 'c', 'exception': 'AssertionError'}
+    flags = []
+
+    def generate(srs, error_book, project_dir, is_regression, **kwargs):
+        flags.append(is_regression)
+        return 'code'
+
+    with patch.object(state.code_generator, 'generate_code', side_effect=generate), \
+            patch('core.state_machine.check_regressions',
+                  side_effect=lambda fresh, path, error_book: error_book.regressions(fresh)), \
+            patch('core.state_machine.run_pytest_cases', side_effect=[[err_a, err_b], [err_b], [err_a, err_b], [err_b]]):
+        for _ in range(4):
+            assert state.run_iteration() is False
+    # 第 2 轮 a 消失被回填，第 3 轮 a 再次出现为回归，第 4 轮生成时带回归标志；一直未修复的 b 只登记一次
+    assert flags == [False, False, False, True]
+    history = [(e['hash'], e['first_iter'], e['fixed_iter']) for e in load_error_history(project_dir)]
+    assert history == [('a', 1, 2), ('b', 1, None), ('a', 3, 4)]
+
+
+def test_fail_fast_pass_backfills_open_errors(tmp_path):
+    project_dir = str(tmp_path)
+    with patch('core.state_machine.load_srs', return_value="Mock SRS"), patch('core.state_machine.CodeGenerator'):
+        state = IterationState(project_dir)
+    state.transition_to_coding()
+    state.fail_fast = True
+    state.code_generator.generate_code.return_value = 'code'
+    err_b = {'hash': 'b', 'abstract': 'B', 'case': 'c', 'exception': 'AssertionError'}
+
+    with patch('core.state_machine.check_regressions',
+               side_effect=lambda fresh, path, error_book: error_book.regressions(fresh)), \
+            patch('core.state_machine.run_pytest_cases', side_effect=[[err_b], [err_b], [err_b], []]), \
+            patch.object(state, 'generate_report'):
+        for _ in range(3):
+            assert state.run_iteration() is False
+        assert state.run_iteration() is True  # 全部通过即完整运行，fail_fast 下同样回填
+    assert [(e['hash'], e['first_iter'], e['fixed_iter']) for e in state.error_book.entries()] == [('b', 1, 4)]
+    assert state.error_book.unfixed_hashes() == set()
+
+
+def test_preflight_failure_does_not_backfill_open_errors(tmp_path):
+    from agents.preflight import PREFLIGHT_CASE
+    project_dir = str(tmp_path)
+    with patch('core.state_machine.load_srs', return_value="Mock SRS"), patch('core.state_machine.CodeGenerator'):
+        state = IterationState(project_dir)
+    state.transition_to_coding()
+    state.fail_fast = False
+    state.code_generator.generate_code.return_value = 'code'
+    err_a = {'hash': 'a', 'abstract': 'A', 'case': 'c', 'exception': 'AssertionError'}
+    preflight = {'hash': 'p', 'abstract': 'P', 'case': PREFLIGHT_CASE, 'exception': 'ImportError: no module x'}
+
+    with patch('core.state_machine.check_regressions',
+               side_effect=lambda fresh, path, error_book: error_book.regressions(fresh)), \
+            patch('core.state_machine.run_pytest_cases', side_effect=[[err_a], [preflight], [err_a]]):
+        for _ in range(3):
+            assert state.run_iteration() is False
+            assert state.last_regressions == []  # 预检失败时未运行用例，a 没有被当成已修复，再出现也不是回归
+    assert not state.error_book.is_fixed('a')
+    assert state.error_book.is_fixed('p')  # 第 3 轮完整运行后预检错误才回填
+
+
+def test_micro_fix_is_kept_and_retested_without_regeneration(tmp_path):
+    project_dir = str(tmp_path)
+    with patch('core.state_machine.load_srs', return_value="Mock SRS"), patch('core.state_machine.CodeGenerator'):
+        state = IterationState(project_dir)
+    state.transition_to_coding()
+    state.test_cases = ['def test_a():\n    assert add(1, 1) == 2', 'def test_b():\n    assert add(2, 2) == 4']
+    state.code_generator.generate_code.return_value = 'def add(a, b):\n    return a + c'
+    name_error = {'hash': 'h', 'abstract': 'NameError', 'case': state.test_cases[0],
+                  'exception': "NameError: name 'c' is not defined"}
+    runs = []
+
+    def run_cases(cases, code, src_dir, fail_fast=None, required_names=(), html_report=None):
+        runs.append(list(cases))
+        return [name_error] if 'a + c' in code and len(cases) == 2 else []
+
+    with patch('core.state_machine.run_pytest_cases', side_effect=run_cases), \
+            patch('core.state_machine.micro_fix', return_value=('def add(a, b):\n    return a + b', True)), \
+            patch.object(state, 'generate_report'):
+        assert state.run_iteration() is True
+    assert state.code_generator.generate_code.call_count == 1  # 修复后不再调用云端重新生成
+    assert runs == [state.test_cases, [state.test_cases[0]], [state.test_cases[1]]]  # 先复测失败用例，再跑其余
+    assert state.iteration == 1 and state.repair_rounds == 1
+    with open(tmp_path / 'src' / 'src.py', encoding='utf-8') as f:
+        assert f.read() == 'def add(a, b):\n    return a + b'
+    assert state.error_book.is_fixed('h')
+
+
+def test_speculative_iteration_takes_passing_candidate_and_records_losers(tmp_path):
+    project_dir = str(tmp_path)
+    with patch('core.state_machine.load_srs', return_value="Mock SRS"), patch('core.state_machine.CodeGenerator'):
+        state = IterationState(project_dir)
+    state.transition_to_coding()
+    state.candidates = 2
+    state.fail_fast = False
+    state.code_generator.generate_candidate.side_effect = \
+        lambda srs, book, temperature, hint, cancel, **kwargs: (f'code@{temperature}', 'full')
+    bad = {'hash': 'bad', 'abstract': 'AssertionError', 'case': 'c', 'exception': 'AssertionError'}
+
+    def run_cases(cases, code, src_dir, fail_fast=None, cancel=None, required_names=()):
+        return [] if code == 'code@0.5' else [bad]
+
+    with patch('core.state_machine.run_pytest_cases', side_effect=run_cases), \
+            patch.object(state, 'generate_report'):
+        assert state.run_iteration() is True
+    assert state.current_code == 'code@0.5'
+    assert (tmp_path / 'src' / 'src.py').read_text(encoding='utf-8') == 'code@0.5'
+    assert sorted(c['status'] for c in state.last_candidates) == ['failed', 'passed']
+    assert state.error_book.get('bad')['fixed_iter'] == 1  # 落选候选的失败入账，并已由胜者修复
+
+
+def test_generate_report_reuses_test_run_report(tmp_path):
+    with patch('core.state_machine.load_srs', return_value="Mock SRS"), patch('core.state_machine.CodeGenerator'):
+        state = IterationState(str(tmp_path))
+    os.makedirs(os.path.dirname(state.run_report_path))
+    with open(state.run_report_path, 'w', encoding='utf-8') as f:
+        f.write('<html>run</html>')
+    with patch('core.state_machine.write_html_report') as write:
+        state.generate_report(state.run_report_path)
+        assert not write.called
+        assert open(state.report_path, encoding='utf-8').read() == '<html>run</html>'
+        assert not os.path.exists(state.run_report_path)
+
+        state.generate_report()  # 没有现成报告时单独跑一次
+        write.assert_called_once_with(state.test_cases, '', state.report_path)
@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 from agents.tester import extract_pytest_cases, compute_error_fingerprint, run_pytest_cases, check_regressions
 import os
 import json
@@ -34,4 +35,154 @@ def test_check_regressions(tmp_path):
     fresh = [{'hash': 'abc'}, {'hash': 'ghi'}]
     regs = check_regressions(fresh, str(history_file))
     assert len(regs) == 1
-    assert regs[0]['hash'] == 'abc'
\ No newline at end of file
+    assert regs[0]['hash'] == 'abc'
+
+def test_run_pytest_cases_batched(tmp_path, monkeypatch):
+    from unittest.mock import patch
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'batch')
+    cases = [
+        'def test_add():\n    assert add(1,2) == 3',
+        'def test_wrong():\n    assert add(1,2) == 4',
+        'def test_crash():\n    import os\n    os._exit(3)',  # 中途退出，剩余用例退回隔离执行
+        'def test_after():\n    assert add(2,2) == 4',
+    ]
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')):
+        errors = run_pytest_cases(cases, 'def add(a,b): return a + b', str(tmp_path))
+    assert [e['case'].split('(')[0] for e in errors] == ['def test_wrong', 'def test_crash']
+    assert 'AssertionError' in errors[0]['exception']
+    assert set(errors[0]) == {'hash', 'abstract', 'case', 'exception', 'llm_diagnosis', 'cluster'}
+
+
+def test_run_pytest_cases_parallel_order_and_fail_fast(tmp_path, monkeypatch):
+    from unittest.mock import patch
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'isolated')
+    # 先提交的用例更慢，结果顺序仍需与输入一致
+    cases = [f'def test_{i}():\n    import time\n    time.sleep({0.3 - i * 0.1})\n    assert False, {i}'
+             for i in range(3)]
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')):
+        errors = run_pytest_cases(cases, 'pass', str(tmp_path), max_workers=3, fail_fast=False)
+        assert [e['case'].split('(')[0] for e in errors] == ['def test_0', 'def test_1', 'def test_2']
+
+        slow = ['def test_fail():\n    assert False'] + \
+               [f'def test_slow_{i}():\n    import time\n    time.sleep(1)' for i in range(4)]
+        errors = run_pytest_cases(slow, 'pass', str(tmp_path), max_workers=1, fail_fast=True)
+        assert len(errors) == 1
+
+
+def test_run_pytest_cases_cancelled(tmp_path, monkeypatch):
+    import threading
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'isolated')
+    cancel = threading.Event()
+    cancel.set()
+    cases = [f'def test_fail_{i}():\n    assert False, {str(tmp_path)!r}' for i in range(3)]  # 避开结果缓存
+    with patch('agents.tester._run_case_isolated') as run_case, \
+            patch('agents.tester.analyze_failures') as analyze:
+        errors = run_pytest_cases(cases, 'pass', str(tmp_path), max_workers=2, cancel=cancel)
+    assert errors == [] and not run_case.called and not analyze.called
+
+
+def test_run_pytest_cases_pytest_runner(tmp_path, monkeypatch):
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'pytest')
+    cases = [
+        'import pytest\n@pytest.fixture\ndef base():\n    return 1\n\ndef test_fixture(base):\n    assert add(base, 1) == 2',
+        '@pytest.mark.parametrize("a, b", [(1, 2), (2, 2)])\ndef test_param(a, b):\n    assert add(a, b) == 3',
+        'def test_add():\n    assert add(1, 2) == 3',  # 与下面的用例同名，各自一个模块互不覆盖
+        'def test_add():\n    import os\n    os._exit(3)',  # 进程中途退出，其余用例重跑一次
+        'def test_after():\n    assert add(2, 2) == 5',
+    ]
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')), \
+            patch.object(tester, 'get_result_cache', return_value=None):
+        errors = run_pytest_cases(cases, 'def add(a, b):\n    return a + b', str(tmp_path))
+        assert [e['case'] for e in errors] == [tester.adjust_case(cases[i]) for i in (1, 3, 4)]
+        assert errors[0]['exception'].startswith('Traceback') and 'assert 4 == 3' in errors[0]['exception']
+        assert 'pluggy' not in errors[0]['exception']  # 只保留被测代码的栈帧
+
+        errors = run_pytest_cases(cases[:3], 'def add(a, b):\n    return a + b\nraise ValueError("boom")',
+                                  str(tmp_path))
+    assert len(errors) == 3 and all('ValueError: boom' in e['exception'] for e in errors)
+
+
+def test_adjust_case_keeps_pytest_and_stdlib_imports():
+    from agents.tester import adjust_case
+    case = ('from src import add\nfrom src.src import (\n    sub,\n    mul,\n)\nfrom pytest import approx\n'
+            'from math import pi\n\ndef test_pi():\n    assert add(pi, 0) == approx(3.1416, rel=1e-4)')
+    assert adjust_case(case) == ('from pytest import approx\nfrom math import pi\n\n'
+                                 'def test_pi():\n    assert add(pi, 0) == approx(3.1416, rel=1e-4)')
+
+
+def test_srs_cases_run_end_to_end_in_pytest_runner(tmp_path, monkeypatch):
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'pytest')
+    srs_file = tmp_path / 'project.srs.md'
+    srs_file.write_text("""# SRS
+## 接口签名
+```python
+def add(a: float, b: float) -> float: ...
+```
+## 验收用例
+```python
+import pytest
+
+@pytest.fixture
+def base():
+    return 1
+```
+```python
+from src import add
+from pytest import approx
+
+def test_float(base):
+    assert add(0.1, 0.2) == approx(0.3) and base == 1
+```
+```python
+@pytest.mark.parametrize("a, b, expected", [(1, 2, 3), (2, 2, 5)])
+def test_param(a, b, expected):
+    assert add(a, b) == expected
+```
+""", encoding='utf-8')
+    cases = extract_pytest_cases(str(srs_file))
+    assert len(cases) == 3
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')), \
+            patch.object(tester, 'get_result_cache', return_value=None):
+        errors = run_pytest_cases(cases, 'def add(a, b):\n    return a + b', str(tmp_path))
+    assert [e['case'] for e in errors] == [tester.adjust_case(cases[2])]  # 只有参数化的第二组失败
+    assert 'assert 4 == 5' in errors[0]['exception']
+
+
+def test_pytest_runner_does_not_collect_source_tests(tmp_path, monkeypatch):
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'pytest')
+    code = ('def add(a, b):\n    return a + b\n\n\ndef test_helper_demo():\n    assert False, "from src"\n\n\n'
+            'class TestDemo:\n    def test_x(self):\n        assert False\n')
+    cases = ['def test_a():\n    assert add(1, 1) == 2', 'def test_b():\n    assert add(2, 2) == 4']
+    with patch.object(tester, 'get_result_cache', return_value=None):
+        assert run_pytest_cases(cases, code, str(tmp_path)) == []
+
+
+def test_write_html_report_requires_plugin(tmp_path, monkeypatch):
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'html_report_available', lambda: False)
+    with patch.object(tester, '_run_cases_pytest') as run:
+        assert tester.write_html_report(['def test_a():\n    pass'], 'x = 1', str(tmp_path / 'r.html')) is False
+    assert not run.called
+
+
+def test_fail_fast_kills_running_sandboxes(tmp_path, monkeypatch):
+    import time
+    import agents.tester as tester
+    monkeypatch.setattr(tester, 'RUNNER', 'isolated')
+    cases = ['def test_fail():\n    assert False'] + \
+            [f'def test_slow_{i}():\n    import time\n    time.sleep(8)' for i in range(3)]
+    with patch('agents.tester.ollama.generate', side_effect=Exception('offline')), \
+            patch.object(tester, 'get_result_cache', return_value=None):
+        start = time.perf_counter()
+        errors = run_pytest_cases(cases, 'pass', str(tmp_path), max_workers=4, fail_fast=True)
+        elapsed = time.perf_counter() - start
+    assert [e['case'] for e in errors] == ['def test_fail():\n    assert False']
+    assert elapsed < 5  # 慢用例的沙箱被杀掉，而不是跑满 8 秒后才释放名额
+    time.sleep(0.2)
+    assert tester.get_scheduler().stats()['sandbox']['in_use'] == 0
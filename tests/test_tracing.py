@@ -0,0 +1,76 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.tracing import (add_usage, bind, current_span, iteration_profile, prometheus_text, record_span,
+                            save_profile, span, trace)
+
+
+def test_span_noop_without_trace():
+    assert current_span() is None
+    with span('generate') as s:
+        s.set(mode='full')
+        add_usage('cloud', 10, 5)
+        record_span('case', 0.1, parent=s)
+    assert current_span() is None
+
+
+def test_nested_spans_and_tokens():
+    with trace('iteration') as root:
+        with span('generate', mode='full'):
+            add_usage('cloud', 100, 20)
+            add_usage('cloud', 50, 10, estimated=True)
+        with span('run_tests') as run:
+            record_span('case', 0.25, case='test_add')
+            add_usage('ollama', 30, 3)
+    assert root.duration is not None and current_span() is None
+    assert [child.name for child in root.children] == ['generate', 'run_tests']
+    assert run.children[0].duration == 0.25 and run.children[0].attrs == {'case': 'test_add'}
+
+    profile = iteration_profile(root, iteration=1, result='pass')
+    assert profile['stages']['generate'] == {'count': 1, 'total_sec': profile['stages']['generate']['total_sec']}
+    assert profile['stages']['case']['total_sec'] == 0.25
+    assert profile['tokens']['cloud'] == {'calls': 2, 'prompt_tokens': 150, 'completion_tokens': 30,
+                                          'estimated_calls': 1}
+    assert profile['spans']['children'][0]['attrs'] == {'mode': 'full'}
+
+
+def test_bind_attaches_thread_work_to_parent():
+    with trace('iteration') as root:
+        with span('execute') as execute:
+            @bind
+            def task(i):
+                with span('case', index=i):
+                    pass
+                return i
+
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                assert list(pool.map(task, range(8))) == list(range(8))
+    assert len(execute.children) == 8
+    assert not [child for child in root.children if child.name == 'case']
+
+
+def test_span_records_error():
+    with trace('iteration') as root:
+        try:
+            with span('sandbox'):
+                raise TimeoutError()
+        except TimeoutError:
+            pass
+    assert root.children[0].attrs['error'] == 'TimeoutError'
+
+
+def test_save_profile_and_prometheus(tmp_path):
+    with trace('iteration') as root:
+        with span('generate'):
+            add_usage('cloud', 100, 20)
+    iterations = [iteration_profile(root, iteration=1, result='fail'),
+                  iteration_profile(root, iteration=2, result='pass')]
+    path = tmp_path / 'reports' / 'profile.json'
+    save_profile(str(path), iterations)
+    assert [r['iteration'] for r in json.loads(path.read_text(encoding='utf-8'))['iterations']] == [1, 2]
+
+    text = prometheus_text(iterations, {'project': 'p"1'})
+    assert 'autocode_iterations_total{project="p\\"1",result="pass"} 1' in text
+    assert 'autocode_iteration_seconds_count{project="p\\"1"} 2' in text
+    assert 'autocode_stage_calls_total{project="p\\"1",stage="generate"} 2' in text
+    assert 'autocode_llm_tokens_total{project="p\\"1",backend="cloud",kind="prompt"} 200' in text
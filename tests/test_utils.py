@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from core.utils import LLMClient
+from core.code_generator import code_block_complete
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    """按脚本依次返回 (status, headers, delay) 的 OpenAI 兼容替身服务。"""
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive
+
+    def do_POST(self):
+        server = self.server
+        server.requests.append(self.client_address)
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if payload.get('stream'):
+            return self._stream(server.chunks, (payload.get('stream_options') or {}).get('include_usage'))
+        status, headers, delay = server.script.pop(0) if server.script else (200, {}, 0)
+        time.sleep(delay)
+        body = json.dumps({'choices': [{'message': {'content': f'reply-{len(server.requests)}'}}],
+                           'usage': {'prompt_tokens': 11, 'completion_tokens': 2}}).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, chunks, include_usage=False):
+        """SSE 流式响应，每块间隔 chunk_delay 秒。"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                event = {'choices': [{'delta': {'content': chunk}}]}
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(self.server.chunk_delay)
+            if include_usage:
+                usage = {'choices': [], 'usage': {'prompt_tokens': 9, 'completion_tokens': len(chunks)}}
+                self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.aborted = True
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def standin():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+    server.script, server.requests = [], []
+    server.chunks, server.chunk_delay, server.aborted = [], 0, False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **overrides):
+    config = {'api_key': 'k', 'model': 'm', 'base_url': f'http://127.0.0.1:{server.server_port}',
+              'path': '/v1/chat/completions', 'timeout': 2, 'connect_timeout': 1,
+              'max_retries': 3, 'backoff_base': 0.01, 'backoff_max': 0.5}
+    config.update(overrides)
+    return LLMClient(config)
+
+
+def test_retries_5xx_and_reuses_connection(standin):
+    standin.script = [(503, {}, 0), (502, {}, 0)]
+    client = _client(standin)
+    assert client.generate('hi') == 'reply-3'
+    assert client.generate('hi') == 'reply-4'
+    assert len(standin.requests) == 4
+    assert len(set(standin.requests)) == 1  # 同一连接（客户端端口不变）
+
+
+def test_honors_retry_after(standin):
+    standin.script = [(429, {'Retry-After': '0.3'}, 0)]
+    client = _client(standin)
+    start = time.perf_counter()
+    assert client.generate('hi') == 'reply-2'
+    assert time.perf_counter() - start >= 0.3
+
+
+def test_gives_up_after_max_retries(standin):
+    standin.script = [(500, {}, 0)] * 5
+    with pytest.raises(Exception, match='500'):
+        _client(standin, max_retries=2).generate('hi')
+    assert len(standin.requests) == 3
+
+
+def test_read_timeout_is_retried_then_raised(standin):
+    standin.script = [(200, {}, 1.0)] * 3
+    with pytest.raises(requests.Timeout):
+        _client(standin, timeout=0.2, max_retries=1).generate('hi')
+    assert len(standin.requests) == 2
+
+
+def test_stream_delivers_tokens_incrementally(standin):
+    standin.chunks = ['def ', '加法', '(a, b):', '\n    return a + b']
+    tokens = []
+    content = _client(standin).generate('hi', stream=True, on_token=tokens.append)
+    assert tokens == standin.chunks
+    assert content == ''.join(standin.chunks)
+
+
+def test_records_token_usage(standin):
+    client = _client(standin)
+    client.generate('hi', stream=False)
+    assert client.last_usage == {'prompt_tokens': 11, 'completion_tokens': 2, 'estimated': False}
+    standin.chunks = ['a', 'b', 'c']
+    client.generate('hi', stream=True)
+    assert client.last_usage == {'prompt_tokens': 9, 'completion_tokens': 3, 'estimated': False}
+    client = _client(standin, stream_usage=False)  # 无 usage 块时估算
+    client.generate('abcdefgh', stream=True)
+    assert client.last_usage == {'prompt_tokens': 2, 'completion_tokens': 1, 'estimated': True}
+
+
+def test_stream_aborts_on_stop_condition(standin):
+    standin.chunks = ['```python\n', 'x = 1\n', '```', '\n解释文字'] + ['...'] * 50
+    standin.chunk_delay = 0.05
+    start = time.perf_counter()
+    content = _client(standin).generate('hi', stream=True, stop=code_block_complete)
+    assert content == '```python\nx = 1\n```'
+    assert time.perf_counter() - start < 1.0
+
+
+def test_stream_stopped_response_is_cached(standin, tmp_path):
+    from agents.llm_cache import LLMResponseCache
+    standin.chunks = ['```python\n', 'x = 1\n', '```', '\n解释文字']
+    client = _client(standin, stream_usage=False)
+    client.cache = LLMResponseCache(str(tmp_path / 'llm.sqlite'))
+    first = client.generate('hi', 0, stream=True, stop=code_block_complete)
+    tokens = []
+    second = client.generate('hi', 0, stream=True, stop=code_block_complete, on_token=tokens.append)
+    assert first == second == tokens[0] == '```python\nx = 1\n```'  # 命中时返回同样截断的内容
+    assert len(standin.requests) == 1
+    assert client.generate('hi', 0, stream=True) == ''.join(standin.chunks)  # 不带 stop 的完整响应分开缓存
+    for _ in range(2):  # 无稳定标识的 stop（如取消信号）中止的响应不写缓存
+        assert client.generate('other', 0, stream=True, stop=lambda text: '```' in text[3:]) == first
+    assert len(standin.requests) == 4
+
+
+def test_code_block_complete():
+    assert not code_block_complete('```python\ndef f():')
+    assert code_block_complete('```python\ndef f():\n    pass\n```')
+    assert not code_block_complete('def f():\n    pass')
+    assert code_block_complete('\n  ```\nx = 1\n```\ntrailing')
+    assert not code_block_complete('  ```python')
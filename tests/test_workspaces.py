@@ -0,0 +1,52 @@
+import os
+import threading
+
+from agents.workspaces import WorkspacePool, clear_directory
+
+
+def test_workspace_reused_and_cleared(tmp_path):
+    pool = WorkspacePool(str(tmp_path), max_idle=1)
+    with pool.workspace() as first:
+        with pool.workspace() as second:
+            assert second != first
+            os.makedirs(os.path.join(second, 'src'))
+            with open(os.path.join(second, 'src', 'src.py'), 'w') as f:
+                f.write('x = 1')
+    assert not os.path.exists(first)  # 超过 max_idle 的直接删除
+    with pool.workspace() as again:
+        assert again == second and os.listdir(again) == []
+    assert pool.stats()['created'] == 2
+    pool.close()
+    assert not os.path.exists(second)
+
+
+def test_workspace_exclusive_across_threads(tmp_path):
+    pool = WorkspacePool(str(tmp_path), max_idle=8)
+    in_use, clashes, lock = set(), [], threading.Lock()
+
+    def worker():
+        for _ in range(50):
+            with pool.workspace() as path:
+                with lock:
+                    if path in in_use:
+                        clashes.append(path)
+                    in_use.add(path)
+                with open(os.path.join(path, 'f'), 'w') as f:
+                    f.write('x')
+                with lock:
+                    in_use.discard(path)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert clashes == [] and pool.stats()['created'] <= 8
+
+
+def test_clear_directory(tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    (tmp_path / 'a' / 'b' / 'c.txt').write_text('x')
+    (tmp_path / 'd.txt').write_text('y')
+    assert clear_directory(str(tmp_path)) and os.listdir(tmp_path) == []
+    assert clear_directory(str(tmp_path / 'missing')) is False